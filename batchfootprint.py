@@ -0,0 +1,382 @@
+#file: batchfootprint.py
+#purpose: batch generation of kicad footprints from a parameter table
+#author: Patrick Menschel (C)2018
+
+import csv
+import json
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from makefootprint import build_footprint_stmicro
+import footprintstats
+from footprintdrc import check_footprint
+from footprintwriter import atomic_write, write_file_atomic, is_archive, open_output, background_writer
+from footprintcache import footprint_cache, get_parameter_key, get_text_digest, get_file_digest, DEFAULT_CACHE_FILENAME
+
+#columns that are handed to make_footprint_stmicro, grouped by their type
+INT_COLUMNS = ["N","numthermalvias"]
+FLOAT_COLUMNS = ["E","X2","Y2","C","X","Y","V","EV"]
+BOOL_COLUMNS = ["centerpad","generate_thermalvias","optimize_thermal"]
+STR_COLUMNS = ["modulename","description","datasheet"]
+REQUIRED_COLUMNS = INT_COLUMNS + FLOAT_COLUMNS + STR_COLUMNS + ["package_dimensions",]
+
+
+def parse_number(value):
+    """ parse a number from a table cell, keep integers as int so "{0}mm".format(E) stays the same as with a hand written call
+        @param value: a string or a number
+        @return: int or float
+    """
+    if isinstance(value,(int,float)):
+        return value
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_bool(value,default=False):
+    """ parse a boolean from a table cell
+        @param value: a string, a number, a bool or None
+        @param default: the value of an empty cell or None, so a blank cell means the default and not False
+        @return: bool or default
+    """
+    if value is None:
+        return default
+    if isinstance(value,bool):
+        return value
+    if isinstance(value,(int,float)):
+        return bool(value)
+    value = value.strip().lower()
+    if value == "":
+        return default
+    if value in ["1","true","yes","y"]:
+        return True
+    if value in ["0","false","no","n"]:
+        return False
+    raise ValueError("Not a boolean value {0}".format(value))
+
+
+def parse_number_pair(value,name):
+    """ parse two numbers from a table cell
+        @param value: a list (x,y) or a string like "3x2", "3,2" or "(3,2)"
+        @param name: column name for the error message
+        @return: tuple (x,y)
+    """
+    if isinstance(value,str):
+        value = value.strip().strip("()[]").lower().replace("x",",").split(",")
+    dims = tuple(parse_number(dim) for dim in value)
+    if len(dims) != 2:
+        raise ValueError("{0} needs 2 values, got {1}".format(name,len(dims)))
+    return dims
+
+
+def parse_package_dimensions(value):
+    """ parse the package dimensions from a table cell, see parse_number_pair """
+    return parse_number_pair(value,"package_dimensions")
+
+
+def row_to_kwargs(row):
+    """ convert a row of the parameter table to the keyword arguments of make_footprint_stmicro
+        @param row: a dict column->value as read from csv or json lines
+        @return: a dict of keyword arguments
+    """
+    missing = [col for col in REQUIRED_COLUMNS if col not in row]
+    if missing:
+        raise KeyError("Missing columns {0}".format(", ".join(missing)))
+    if any(sep in row["modulename"] for sep in ["/","\\"]):
+        raise ValueError("modulename must not contain a path separator, got {0}".format(row["modulename"]))
+    kwargs = {}
+    for col in INT_COLUMNS:
+        kwargs[col] = int(parse_number(row[col]))
+    for col in FLOAT_COLUMNS:
+        kwargs[col] = parse_number(row[col])
+    for col in STR_COLUMNS:
+        kwargs[col] = row[col]
+    kwargs["centerpad"] = parse_bool(row.get("centerpad"),default=True)
+    generate_thermalvias = parse_bool(row.get("generate_thermalvias"),default=None)
+    if generate_thermalvias is not None:#left out, the default of build_footprint_stmicro applies
+        kwargs["generate_thermalvias"] = generate_thermalvias
+    if parse_bool(row.get("optimize_thermal")):
+        kwargs["optimize_thermal"] = True
+        if row.get("paste_coverage"):
+            kwargs["paste_coverage"] = parse_number_pair(row["paste_coverage"],"paste_coverage")
+    kwargs["package_dimensions"] = parse_package_dimensions(row["package_dimensions"])
+    return kwargs
+
+
+def read_parameter_table(filepath):
+    """ read a parameter table, either csv with a header line or json lines
+        @param filepath: path to a .csv or .jsonl file
+        @return: a list of dicts, one per row
+    """
+    rows = []
+    with open(filepath,newline="") as f:
+        if os.path.splitext(filepath)[1].lower() == ".csv":
+            rows.extend(csv.DictReader(f))
+        else:
+            for line in f:
+                if line.strip():
+                    rows.append(json.loads(line))
+    return rows
+
+
+class batch_result():
+
+
+    def __init__(self,rownum,modulename,filepath=None,error=None,digest=None,skipped=False,stats=None,violations=None,text=None,preview=None):
+        """ A class to represent the outcome of one row of a batch """
+        self.rownum = rownum
+        self.modulename = modulename
+        self.filepath = filepath
+        self.error = error
+        self.digest = digest
+        self.skipped = skipped
+        self.stats = stats#footprint_stats.to_dict() if the batch collects stats
+        self.violations = violations or []#drc violations as text, the footprint is still written
+        self.text = text#the footprint for the background writer of the parent process, see run_batch
+        self.preview = preview#path of the preview svg
+
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.skipped:
+            return "row {0} {1}: {2} (unchanged)".format(self.rownum,self.modulename,self.filepath)
+        if self.ok():
+            return "row {0} {1}: {2}".format(self.rownum,self.modulename,self.filepath)
+        return "row {0} {1}: {2}".format(self.rownum,self.modulename,self.error)
+
+
+def get_output_filename(modulename):
+    return "{0}.kicad_mod".format(modulename)
+
+
+def get_output_filepath(outdir,modulename):
+    return os.path.join(outdir,get_output_filename(modulename))
+
+
+def make_footprint_job(rownum,kwargs,outdir,hashed=False,collect_stats=False,drc=True,return_text=False,preview_dir=None):
+    """ generate and write a single footprint, this runs in a worker process
+        @param rownum: row number in the parameter table, used for reporting
+        @param kwargs: keyword arguments for make_footprint_stmicro
+        @param outdir: directory to write the .kicad_mod file to, files are replaced atomically
+        @param hashed: hash the output and leave the file untouched if its content did not change, outdir must be a directory
+        @param collect_stats: collect footprintstats for this row
+        @param drc: run the design rule checks of footprintdrc on the footprint
+        @param return_text: return the text in the batch_result instead of writing a file, for a writer of the parent process
+        @param preview_dir: write an svg preview of the footprint into this directory, see footprintpreview.py
+        @return: a batch_result
+    """
+    if collect_stats:
+        footprintstats.enable()
+    try:
+        result = _make_footprint_job(rownum,kwargs,outdir,hashed,drc,return_text,preview_dir)
+    finally:
+        if collect_stats:
+            stats = footprintstats.disable()
+    if collect_stats:
+        result.stats = stats.to_dict()
+    return result
+
+
+def _make_footprint_job(rownum,kwargs,outdir,hashed,drc,return_text,preview_dir):
+    modulename = kwargs.get("modulename")
+    digest = None
+    violations = None
+    preview = None
+    try:
+        footprint = build_footprint_stmicro(**kwargs)
+        if drc:
+            violations = [repr(violation) for violation in footprintstats.run_stage("drc",check_footprint,footprint)]
+        if preview_dir is not None:
+            from footprintpreview import write_preview#only needed with previews
+            with footprintstats.stage("preview"):
+                preview = write_preview(footprint,preview_dir)
+        filepath = None
+        if hashed or return_text:
+            text = footprintstats.run_stage("format",footprint.format)
+            digest = get_text_digest(text)
+            if hashed:
+                filepath = get_output_filepath(outdir,modulename)
+                if get_file_digest(filepath) == digest:
+                    return batch_result(rownum,modulename,filepath=filepath,digest=digest,skipped=True,violations=violations,preview=preview)
+            if return_text:
+                return batch_result(rownum,modulename,filepath=filepath,digest=digest,violations=violations,text=text,preview=preview)
+            with footprintstats.stage("write"):
+                write_file_atomic(filepath,text)
+        else:
+            filepath = get_output_filepath(outdir,modulename)
+            with footprintstats.stage("format_and_write"):
+                with atomic_write(filepath) as f:
+                    footprint.write(f)
+    except Exception as e:#one bad row must not abort the whole batch
+        return batch_result(rownum,modulename,error="{0}: {1}".format(type(e).__name__,e))
+    return batch_result(rownum,modulename,filepath=filepath,digest=digest,violations=violations,preview=preview)
+
+
+def get_preview_entries(results,preview_dir):
+    """ return the contact sheet entries (name,preview path,error) of all rows
+        rows skipped by the cache keep their preview from an earlier run, a missing one is rendered from the output file
+    """
+    from footprintpreview import get_preview_path, render_file_job
+    entries = []
+    for result in results:
+        name = result.modulename or "row {0}".format(result.rownum+1)
+        if not result.ok():
+            entries.append((name,None,result.error))
+        elif result.preview is not None:
+            entries.append((name,result.preview,None))
+        elif os.path.exists(get_preview_path(preview_dir,result.modulename)):
+            entries.append((name,get_preview_path(preview_dir,result.modulename),None))
+        else:
+            entries.append(render_file_job(result.filepath,preview_dir))
+    return entries
+
+
+def run_batch(rows,outdir=".",max_workers=None,cache=None,force=False,verify=False,collect_stats=False,drc=True,preview_dir=None):
+    """ generate footprints for all rows of a parameter table in a process pool
+        @param rows: a list of dicts as returned by read_parameter_table
+        @param outdir: directory to write the .kicad_mod files to, or a .zip/.tar(.gz,.bz2,.xz) archive, both are written by a background
+                       thread while the next footprints are generated, see footprintwriter.py
+        @param max_workers: number of worker processes, None for the number of cpus, 0 to run in this process
+        @param cache: a footprint_cache, rows with unchanged parameters are skipped, None to generate all rows
+        @param force: ignore the cache and generate all rows, the cache is still updated
+        @param verify: recheck the hash of cached output files, rows with changed files are generated again
+        @param collect_stats: collect footprintstats for each generated row, see merge_stats
+        @param drc: run the design rule checks on each generated row, rows skipped by the cache are not checked
+        @param preview_dir: write an svg preview of each generated row and a contact sheet index.html of all rows into this directory
+        @return: a list of batch_result in the order of rows
+    """
+    archive = is_archive(outdir)
+    if archive and cache is not None:
+        raise ValueError("The cache needs an output directory, not an archive")
+    if not archive:
+        os.makedirs(outdir,exist_ok=True)
+    if preview_dir is not None:
+        os.makedirs(preview_dir,exist_ok=True)
+    results = [None]*len(rows)
+    jobs = []
+    keys = {}
+    for rownum,row in enumerate(rows):
+        try:
+            kwargs = row_to_kwargs(row)
+        except Exception as e:
+            results[rownum] = batch_result(rownum,row.get("modulename"),error="{0}: {1}".format(type(e).__name__,e))
+            continue
+        if cache is not None:
+            key = keys[rownum] = get_parameter_key(kwargs)
+            filepath = get_output_filepath(outdir,kwargs["modulename"])
+            if not force and cache.lookup(key,filepath,verify=verify):
+                results[rownum] = batch_result(rownum,kwargs["modulename"],filepath=filepath,skipped=True)
+                continue
+        jobs.append((rownum,kwargs))
+    hashed = cache is not None
+    writer = background_writer(open_output(outdir))
+    try:
+        if max_workers == 0:
+            for rownum,kwargs in jobs:
+                results[rownum] = _collect_result(make_footprint_job(rownum,kwargs,outdir,hashed=hashed,collect_stats=collect_stats,drc=drc,
+                                                                     return_text=True,preview_dir=preview_dir),writer)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(make_footprint_job,rownum,kwargs,outdir,hashed,collect_stats,drc,True,preview_dir) for rownum,kwargs in jobs]
+                for future in futures:
+                    result = _collect_result(future.result(),writer)
+                    results[result.rownum] = result
+    except BaseException:
+        writer.abort()#an interrupted batch leaves no archive behind, files written so far are complete
+        raise
+    writer.close()
+    _collect_write_errors(results,writer)
+    if preview_dir is not None:
+        from footprintpreview import write_index
+        write_index(get_preview_entries(results,preview_dir),preview_dir)
+    if cache is not None:
+        for rownum,kwargs in jobs:
+            result = results[rownum]
+            if result.ok():
+                cache.store(keys[rownum],result.filepath,result.digest)
+        cache.save()
+    return results
+
+
+def _collect_result(result,writer):
+    #hand the text of a job to the background writer, the next footprint is generated meanwhile
+    if result.text is not None:
+        result.filepath = writer.sink.get_member_name(get_output_filename(result.modulename))
+        writer.write(get_output_filename(result.modulename),result.text)
+        result.text = None
+    return result
+
+
+def _collect_write_errors(results,writer):
+    #a file that could not be written fails its row, the other rows of the batch are kept
+    for result in results:
+        if result.ok() and not result.skipped and result.filepath is not None:
+            e = writer.errors.get(get_output_filename(result.modulename))
+            if e is not None:
+                result.error = "{0}: {1}".format(type(e).__name__,e)
+                result.filepath = None
+
+
+def merge_stats(results):
+    """ aggregate the stats of all rows of a batch
+        @param results: list of batch_result
+        @return: a footprint_stats
+    """
+    stats = footprintstats.footprint_stats()
+    for result in results:
+        if result.stats is not None:
+            stats.merge(result.stats)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate kicad footprints from a parameter table (csv or json lines)")
+    parser.add_argument("table",help="parameter table, .csv or .jsonl")
+    parser.add_argument("-o","--outdir",default=".",help="output directory, or a .zip/.tar/.tar.gz/.tar.bz2/.tar.xz archive which implies --no-cache")
+    parser.add_argument("-j","--jobs",type=int,default=None,help="number of worker processes, 0 to run in this process")
+    parser.add_argument("--cache",default=None,help="cache file, default is {0} in the output directory".format(DEFAULT_CACHE_FILENAME))
+    parser.add_argument("--cache-size",type=int,default=100000,help="maximum number of cache entries")
+    parser.add_argument("--no-cache",action="store_true",help="do not use the cache, write all footprints")
+    parser.add_argument("--force",action="store_true",help="generate all footprints, files with unchanged content are still left untouched")
+    parser.add_argument("--verify",action="store_true",help="recheck cached output files against their hashes")
+    parser.add_argument("--no-drc",action="store_true",help="do not run the design rule checks")
+    parser.add_argument("--preview",default=None,help="write svg previews of the generated footprints and an index.html to this directory")
+    parser.add_argument("--stats",default=None,help="write per stage timing and counters of the batch to this json file")
+    parser.add_argument("--profile",default=None,help="write per stage timing of the batch to this file in cProfile format")
+    args = parser.parse_args(argv)
+
+    cache = None
+    if not args.no_cache and not is_archive(args.outdir):
+        cache = footprint_cache(args.cache or os.path.join(args.outdir,DEFAULT_CACHE_FILENAME),max_entries=args.cache_size)
+    results = run_batch(read_parameter_table(args.table),outdir=args.outdir,max_workers=args.jobs,
+                        cache=cache,force=args.force,verify=args.verify,
+                        collect_stats=bool(args.stats or args.profile),drc=not args.no_drc,
+                        preview_dir=args.preview)
+    failed = [result for result in results if not result.ok()]
+    skipped = [result for result in results if result.skipped]
+    checked = [result for result in results if result.violations]
+    for result in failed:
+        print(result)
+    for result in checked:
+        for violation in result.violations:
+            print("row {0} {1}: {2}".format(result.rownum,result.modulename,violation))
+    print("{0} footprints written, {1} unchanged, {2} failed".format(len(results)-len(failed)-len(skipped),len(skipped),len(failed)))
+    if checked:
+        print("{0} footprints with design rule violations".format(len(checked)))
+    if args.stats or args.profile:
+        stats = merge_stats(results)
+        print(stats.format_summary())
+        if args.stats:
+            with open(args.stats,"w") as f:
+                f.write(stats.to_json())
+        if args.profile:
+            stats.dump_stats(args.profile)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
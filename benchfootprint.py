@@ -0,0 +1,194 @@
+#file: benchfootprint.py
+#purpose: benchmark suite for footprint generation across pin and thermal via counts
+#author: Patrick Menschel (C)2018
+
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import makefootprint
+import footprintthermal
+from footprintpreview import render_svg
+from makefootprint import build_footprint_stmicro, build_footprint_variants_stmicro, get_posxy_for_span, footprint_pad, format_courtyard_lines, get_dual_layout, get_quad_layout, get_grid_layout
+
+PIN_COUNTS = [8,16,32,64,128,256,512,1024]
+VIA_COUNTS = [4,16,64,256]
+QUICK_PIN_COUNTS = [8,64,1024]
+QUICK_VIA_COUNTS = [4,64]
+
+
+def get_stmicro_parameters(N,numthermalvias,E=0.5,EV=1.0,V=0.3):
+    """ return make_footprint_stmicro arguments for a synthetic dual flat package that fits N pins and the vias
+        @param N: number of pins
+        @param numthermalvias: number of thermal vias, two rows
+        @return: dict of keyword arguments
+    """
+    viarows = numthermalvias/2
+    Y2 = max(1.8,viarows*EV)
+    X2 = 1.65
+    length = max(3,(N/2)*E+0.5,Y2+0.5)
+    return dict(N=N,E=E,X2=X2,Y2=Y2,C=2.9,X=0.25,Y=0.85,V=V,EV=EV,
+                modulename="BENCH-{0}_{1}V".format(N,numthermalvias),
+                description="benchmark",datasheet="none",
+                centerpad=True,numthermalvias=numthermalvias,
+                package_dimensions=(length,2))
+
+
+def measure(func,repeat=5,mintime=0.05):
+    """ measure a callable
+        @param func: callable without arguments
+        @param repeat: number of timing rounds, the best round is taken
+        @param mintime: each round calls func until this many seconds have passed
+        @return: dict with time per call in seconds, the peak memory of one call and the memory still held by its result
+    """
+    best = None
+    for i in range(repeat):
+        calls = 0
+        t0 = time.perf_counter()
+        while True:
+            func()
+            calls += 1
+            elapsed = time.perf_counter()-t0
+            if elapsed >= mintime:
+                break
+        if best is None or elapsed/calls < best:
+            best = elapsed/calls
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        result = func()
+        size,peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+    return {"time":best,
+            "peak_bytes":peak-start,
+            "retained_bytes":size-start,
+            }
+
+
+def optimize_thermal_layout_uncached(epsize):
+    footprintthermal._LAYOUT_CACHE.clear()#measure the search, not the cache
+    return footprintthermal.optimize_thermal_layout(epsize,drill=0.3,min_pitch=1.0)
+
+
+def get_cases(quick=False):
+    """ return the benchmark cases as a list of (name,callable,output size or None) """
+    cases = []
+    pincounts = QUICK_PIN_COUNTS if quick else PIN_COUNTS
+    viacounts = QUICK_VIA_COUNTS if quick else VIA_COUNTS
+    for N in pincounts:
+        cases.append(("get_posxy_for_span N={0}".format(N),lambda N=N: get_posxy_for_span(pinnum=N,spanx=0.5,spany=2.9),None))
+        cases.append(("get_dual_layout N={0}".format(N),lambda N=N: get_dual_layout(pinnum=N,pitch=0.5,span=2.9),None))
+        cases.append(("get_quad_layout N={0}".format(N),lambda N=N: get_quad_layout(N//4,N//4,pitch=0.5,spanx=N/8,spany=N/8),None))
+    for balls in [10,45] if quick else [10,20,32,45]:
+        cases.append(("get_grid_layout {0}x{0}".format(balls),lambda balls=balls: get_grid_layout(balls,balls,0.8),None))
+        cases.append(("get_grid_layout {0}x{0} depopulated".format(balls),
+                      lambda balls=balls: get_grid_layout(balls,balls,0.8,center_hole=(balls//3,balls//3)),None))
+    for epsize in [(1.8,1.65),(5,5),(9,9)]:
+        cases.append(("optimize_thermal_layout EP{0}x{1}".format(*epsize),lambda epsize=epsize: optimize_thermal_layout_uncached(epsize),None))
+    pad = footprint_pad(1,xypos=(-1.45,-0.75),sizexy=(0.85,0.25),padtype="smd",padshape="oval",layers=["F.Cu","F.Paste","F.Mask"])
+    via = footprint_pad(9,xypos=(0.5,0.5),sizexy=(0.65,0.65),padtype="thru_hole",padshape="circle",layers=["*.Cu",],drill=0.3)
+    cases.append(("footprint_pad.format smd",pad.format,None))
+    cases.append(("footprint_pad.format thru_hole",via.format,None))
+    for N in pincounts:
+        for numthermalvias in viacounts:
+            kwargs = get_stmicro_parameters(N,numthermalvias)
+            fp_obj = build_footprint_stmicro(**kwargs)
+            name = "N={0} vias={1}".format(N,numthermalvias)
+            cases.append(("format_courtyard_lines {0}".format(name),
+                          lambda fp_obj=fp_obj: format_courtyard_lines(fp_obj.pads,package_dimensions=fp_obj.package_dimensions),None))
+            cases.append(("kicad_footprint.format {0}".format(name),fp_obj.format,len(fp_obj.format())))
+            cases.append(("make_footprint_stmicro {0}".format(name),
+                          lambda kwargs=kwargs: build_footprint_stmicro(**kwargs).format(),len(fp_obj.format())))
+            cases.append(("make_footprint_variants_stmicro {0}".format(name),
+                          lambda kwargs=kwargs: [variant.format() for variant in build_footprint_variants_stmicro(**kwargs)],None))
+            cases.append(("render_svg {0}".format(name),lambda fp_obj=fp_obj: render_svg(fp_obj),None))
+    return cases
+
+
+def run_benchmarks(quick=False,pattern=None,repeat=5,mintime=0.05,verbose=True):
+    """ run the benchmark cases
+        @param quick: run a reduced sweep
+        @param pattern: only run cases whose name contains this text
+        @return: dict case name -> result dict
+    """
+    results = {}
+    for name,func,outputsize in get_cases(quick=quick):
+        if pattern and pattern not in name:
+            continue
+        result = measure(func,repeat=repeat,mintime=mintime)
+        if outputsize is not None:
+            result["output_bytes"] = outputsize
+        results[name] = result
+        if verbose:
+            print(format_result(name,result))
+    return results
+
+
+def format_result(name,result):
+    line = "{0:<50} {1:>10.1f}us {2:>10} B peak {3:>10} B retained".format(name,result["time"]*1e6,result["peak_bytes"],result["retained_bytes"])
+    if "output_bytes" in result:
+        line += " {0:>10} B output".format(result["output_bytes"])
+    return line
+
+
+def save_results(filepath,results):
+    data = {"version":makefootprint.__version__,
+            "python":platform.python_version(),
+            "platform":platform.platform(),
+            "results":results}
+    with open(filepath,"w") as f:
+        json.dump(data,f,indent=1,sort_keys=True)
+
+
+def load_results(filepath):
+    with open(filepath) as f:
+        return json.load(f)["results"]
+
+
+def compare_results(baseline,results,threshold=0.2,keys=["time","peak_bytes","output_bytes"]):
+    """ compare results against a baseline
+        @param threshold: relative increase that counts as a regression, 0.2 is 20%
+        @return: list of (case name,key,baseline value,new value)
+    """
+    regressions = []
+    for name,result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for key in keys:
+            old = baseline[name].get(key)
+            new = result.get(key)
+            if old and new is not None and new > old*(1+threshold):
+                regressions.append((name,key,old,new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark footprint generation across pin and thermal via counts")
+    parser.add_argument("--quick",action="store_true",help="run a reduced sweep")
+    parser.add_argument("-k","--pattern",default=None,help="only run cases whose name contains this text")
+    parser.add_argument("-r","--repeat",type=int,default=5,help="number of timing rounds per case")
+    parser.add_argument("--save",default=None,help="write the results to this json file, e.g. a new baseline")
+    parser.add_argument("--compare",default=None,help="compare the results against this baseline json file")
+    parser.add_argument("--threshold",type=float,default=0.2,help="relative increase that counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick,pattern=args.pattern,repeat=args.repeat)
+    if args.save:
+        save_results(args.save,results)
+    if args.compare:
+        regressions = compare_results(load_results(args.compare),results,threshold=args.threshold)
+        for name,key,old,new in regressions:
+            print("REGRESSION {0} {1}: {2:.6g} -> {3:.6g} ({4:+.0%})".format(name,key,old,new,new/old-1))
+        if regressions:
+            return 1
+        print("no regressions beyond {0:.0%}".format(args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
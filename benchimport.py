@@ -0,0 +1,65 @@
+#file: benchimport.py
+#purpose: import time benchmark, makes sure the core generator imports without matplotlib
+#author: Patrick Menschel (C)2018
+
+import subprocess
+import sys
+import os
+import argparse
+
+#modules that make up the core geometry and formatting api
+CORE_MODULES = ["makefootprint","batchfootprint"]
+#modules that must never be loaded by importing the core
+FORBIDDEN_MODULES = ["matplotlib"]
+
+CHECK_SCRIPT = """
+import sys,time
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+print(t1-t0)
+print(",".join(sorted(set(name.split(".")[0] for name in sys.modules))))
+"""
+
+
+def measure_import(module,repeat=5):
+    """ import a module in a fresh interpreter and measure the time
+        @param module: name of the module to import
+        @param repeat: number of fresh interpreters to start, the best time is taken
+        @return: best import time in seconds, set of top level modules loaded afterwards
+    """
+    best = None
+    loaded = set()
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    for i in range(repeat):
+        out = subprocess.run([sys.executable,"-c",CHECK_SCRIPT.format(module=module)],
+                             cwd=cwd,check=True,stdout=subprocess.PIPE,universal_newlines=True).stdout.splitlines()
+        t = float(out[0])
+        loaded = set(out[1].split(","))
+        if best is None or t < best:
+            best = t
+    return best,loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import time of the core modules")
+    parser.add_argument("-n","--repeat",type=int,default=5,help="number of fresh interpreters per module")
+    parser.add_argument("--limit",type=float,default=None,help="fail if an import takes longer than this many seconds")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in CORE_MODULES:
+        t,loaded = measure_import(module,repeat=args.repeat)
+        forbidden = [name for name in FORBIDDEN_MODULES if name in loaded]
+        print("{0}: {1:.1f}ms".format(module,t*1000))
+        if forbidden:
+            print("  FAIL: importing {0} loaded {1}".format(module,", ".join(forbidden)))
+            failed = True
+        if args.limit is not None and t > args.limit:
+            print("  FAIL: import took longer than {0:.1f}ms".format(args.limit*1000))
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+#file: footprintcache.py
+#purpose: content addressed incremental build cache for generated footprints
+#author: Patrick Menschel (C)2018
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from makefootprint import __version__ as GENERATOR_VERSION
+
+DEFAULT_CACHE_FILENAME = ".footprintcache.json"
+
+
+def get_text_digest(text):
+    """ return the sha256 hex digest of a text """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_file_digest(filepath):
+    """ return the sha256 hex digest of a text file or None if it does not exist """
+    try:
+        with open(filepath) as f:
+            return get_text_digest(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def get_parameter_key(kwargs,version=GENERATOR_VERSION):
+    """ return the cache key for a set of make_footprint_stmicro arguments
+        @param kwargs: keyword arguments for make_footprint_stmicro
+        @param version: generator version, a new version invalidates all keys
+        @return: sha256 hex digest of the arguments and the version
+    """
+    data = json.dumps({"version":version,"kwargs":kwargs},sort_keys=True)
+    return get_text_digest(data)
+
+
+class footprint_cache():
+
+
+    def __init__(self,filepath,max_entries=100000):
+        """ A persistent cache that maps the parameters of a footprint to its output file and output hash.
+            Entries are kept in least recently used order and the oldest ones are dropped
+            when there are more than max_entries.
+            @param filepath: path to the json file that holds the cache
+            @param max_entries: maximum number of entries
+        """
+        self.filepath = filepath
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filepath) as f:
+                data = json.load(f)
+        except (FileNotFoundError,ValueError):#a missing or broken cache is just an empty cache
+            return
+        if data.get("version") != GENERATOR_VERSION:
+            return
+        self.entries = OrderedDict((key,tuple(entry)) for key,entry in data.get("entries",[]))
+
+    def save(self):
+        """ write the cache atomically """
+        tmppath = "{0}.tmp".format(self.filepath)
+        with open(tmppath,"w") as f:
+            json.dump({"version":GENERATOR_VERSION,"entries":[[key,list(entry)] for key,entry in self.entries.items()]},f)
+        os.replace(tmppath,self.filepath)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self,key,filepath,verify=False):
+        """ check if the output for a key is up to date
+            @param key: cache key from get_parameter_key
+            @param filepath: the output file that is expected
+            @param verify: recheck the hash of the output file instead of only checking that it exists
+            @return: True if the footprint does not need to be generated again
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        cachedpath,digest = entry
+        if cachedpath != filepath or not os.path.exists(filepath):
+            return False
+        if verify and get_file_digest(filepath) != digest:
+            return False
+        self.entries.move_to_end(key)
+        return True
+
+    def store(self,key,filepath,digest):
+        """ remember the output of a key and evict the least recently used entries """
+        self.entries[key] = (filepath,digest)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
@@ -0,0 +1,281 @@
+#file: footprintdrc.py
+#purpose: design rule checks for generated footprints backed by a uniform grid spatial index
+#author: Patrick Menschel (C)2018
+
+import math
+import argparse
+
+from makefootprint import footprint_pad_array, mm_to_nm, nm_to_mm
+
+#a pad on one of these layers has copper on the given side, *.Cu has copper on all sides
+COPPER_LAYERS = {"F.Cu":{"F.Cu"},"B.Cu":{"B.Cu"},"*.Cu":{"F.Cu","B.Cu"}}
+
+
+class spatial_grid():
+
+
+    def __init__(self,cellsize):
+        """ A uniform grid spatial index over bounding boxes
+            each item is stored in all cells its bounding box touches, a query only looks at the cells
+            of the query box, so finding the neighbours of all n items is about O(n) instead of O(n^2)
+            @param cellsize: size of a cell, in the same unit as the boxes
+        """
+        self.cellsize = max(int(cellsize),1)
+        self.cells = {}
+
+    def _get_cells(self,bbox):
+        minx,miny,maxx,maxy = bbox
+        cellsize = self.cellsize
+        for cx in range(minx//cellsize,maxx//cellsize+1):
+            for cy in range(miny//cellsize,maxy//cellsize+1):
+                yield cx,cy
+
+    def insert(self,item,bbox):
+        """ add an item with its bounding box (minx,miny,maxx,maxy) """
+        for cell in self._get_cells(bbox):
+            self.cells.setdefault(cell,[]).append(item)
+
+    def query(self,bbox):
+        """ return the set of items whose cells touch a bounding box """
+        found = set()
+        for cell in self._get_cells(bbox):
+            found.update(self.cells.get(cell,()))
+        return found
+
+
+class drc_violation():
+
+
+    def __init__(self,rule,message,location=None):
+        """ A class to represent a single design rule violation
+            @param rule: short name of the rule, e.g. "pad_clearance"
+            @param message: human readable description
+            @param location: (x,y) in mm where the violation is
+        """
+        self.rule = rule
+        self.message = message
+        self.location = location
+
+    def __repr__(self):
+        if self.location is None:
+            return "{0}: {1}".format(self.rule,self.message)
+        return "{0}: {1} at ({2:.3f},{3:.3f})".format(self.rule,self.message,*self.location)
+
+
+def get_pad_bboxes(pads):
+    """ return the bounding boxes (minx,miny,maxx,maxy) of all pads in nanometres """
+    bboxes = []
+    for posx,posy,sizex,sizey in zip(pads.posx,pads.posy,pads.sizex,pads.sizey):
+        bboxes.append((posx-sizex//2,posy-sizey//2,posx+sizex-sizex//2,posy+sizey-sizey//2))
+    return bboxes
+
+
+def get_bbox_gap(a,b):
+    """ return the distance between two bounding boxes, 0 if they touch or overlap """
+    dx = max(0,a[0]-b[2],b[0]-a[2])
+    dy = max(0,a[1]-b[3],b[1]-a[3])
+    return math.hypot(dx,dy)
+
+
+def get_point_bbox_distance(x,y,bbox):
+    dx = max(0,bbox[0]-x,x-bbox[2])
+    dy = max(0,bbox[1]-y,y-bbox[3])
+    return math.hypot(dx,dy)
+
+
+def get_point_segment_distance(x,y,start,end):
+    sx,sy = start
+    ex,ey = end
+    dx = ex-sx
+    dy = ey-sy
+    length2 = dx*dx+dy*dy
+    if not length2:
+        return math.hypot(x-sx,y-sy)
+    t = max(0,min(1,((x-sx)*dx+(y-sy)*dy)/length2))
+    return math.hypot(x-(sx+t*dx),y-(sy+t*dy))
+
+
+def get_segment_bbox_distance(start,end,bbox):
+    """ return the distance between a line segment and a bounding box, 0 if they intersect """
+    minx,miny,maxx,maxy = bbox
+    #clip the segment to the box (Liang-Barsky), if anything is left they intersect
+    t0,t1 = 0.0,1.0
+    dx = end[0]-start[0]
+    dy = end[1]-start[1]
+    inside = True
+    for p,q in [(-dx,start[0]-minx),(dx,maxx-start[0]),(-dy,start[1]-miny),(dy,maxy-start[1])]:
+        if p == 0:
+            if q < 0:
+                inside = False
+                break
+        else:
+            t = q/p
+            if p < 0:
+                t0 = max(t0,t)
+            else:
+                t1 = min(t1,t)
+            if t0 > t1:
+                inside = False
+                break
+    if inside:
+        return 0.0
+    corners = [(minx,miny),(minx,maxy),(maxx,maxy),(maxx,miny)]
+    return min([get_point_bbox_distance(start[0],start[1],bbox),get_point_bbox_distance(end[0],end[1],bbox)]+
+               [get_point_segment_distance(cx,cy,start,end) for cx,cy in corners])
+
+
+def get_pad_gap(pads,bboxes,idx,other):
+    """ return the copper gap between two pads in nanometres, circles are handled exactly, other shapes by their bounding box """
+    circle_a = pads.padshape_table[pads.padshapes[idx]] == "circle"
+    circle_b = pads.padshape_table[pads.padshapes[other]] == "circle"
+    if circle_a and circle_b:
+        distance = math.hypot(pads.posx[idx]-pads.posx[other],pads.posy[idx]-pads.posy[other])
+        return max(0,distance-pads.sizex[idx]/2-pads.sizex[other]/2)
+    if circle_a or circle_b:
+        circle,box = (idx,other) if circle_a else (other,idx)
+        return max(0,get_point_bbox_distance(pads.posx[circle],pads.posy[circle],bboxes[box])-pads.sizex[circle]/2)
+    return get_bbox_gap(bboxes[idx],bboxes[other])
+
+
+def check_pad_clearance(pads,bboxes,grid,pad_clearance):
+    """ check the copper clearance between pads with different pad numbers on a shared copper layer """
+    violations = []
+    clearance_nm = mm_to_nm(pad_clearance)
+    copper = [set().union(*[COPPER_LAYERS.get(layer,set()) for layer in layers]) for layers in pads.layers_table]
+    for idx,bbox in enumerate(bboxes):
+        if not copper[pads.layers[idx]]:
+            continue
+        query = (bbox[0]-clearance_nm,bbox[1]-clearance_nm,bbox[2]+clearance_nm,bbox[3]+clearance_nm)
+        for other in grid.query(query):
+            if other <= idx:
+                continue#every pair once
+            if pads.padnums[idx] == pads.padnums[other] and pads.padnums[idx] is not None:
+                continue#same net
+            if not copper[pads.layers[idx]] & copper[pads.layers[other]]:
+                continue
+            gap = get_pad_gap(pads,bboxes,idx,other)
+            if gap < clearance_nm:
+                violations.append(drc_violation("pad_clearance",
+                                                "pads {0} and {1} are {2:.3f}mm apart, minimum is {3:.3f}mm".format(pads.padnums[idx],pads.padnums[other],nm_to_mm(gap),pad_clearance),
+                                                location=(nm_to_mm(pads.posx[idx]),nm_to_mm(pads.posy[idx]))))
+    return violations
+
+
+def check_silkscreen(pads,bboxes,grid,lines,silk_clearance):
+    """ check that silkscreen lines do not overlap front copper or paste """
+    violations = []
+    clearance_nm = mm_to_nm(silk_clearance)
+    front = [bool({"F.Cu","*.Cu","F.Paste","F.Mask"} & set(layers)) for layers in pads.layers_table]
+    for startpoint,endpoint,layer,width in lines:
+        if layer != "F.SilkS":
+            continue
+        start = (mm_to_nm(startpoint[0]),mm_to_nm(startpoint[1]))
+        end = (mm_to_nm(endpoint[0]),mm_to_nm(endpoint[1]))
+        margin = clearance_nm+mm_to_nm((width or 0)/2)
+        query = (min(start[0],end[0])-margin,min(start[1],end[1])-margin,max(start[0],end[0])+margin,max(start[1],end[1])+margin)
+        for idx in sorted(grid.query(query)):
+            if not front[pads.layers[idx]]:
+                continue
+            gap = get_segment_bbox_distance(start,end,bboxes[idx])-mm_to_nm((width or 0)/2)
+            if gap < clearance_nm:
+                violations.append(drc_violation("silkscreen_over_pad",
+                                                "silkscreen line {0}-{1} is {2:.3f}mm from pad {3}".format(startpoint,endpoint,nm_to_mm(max(gap,0)),pads.padnums[idx]),
+                                                location=(nm_to_mm(pads.posx[idx]),nm_to_mm(pads.posy[idx]))))
+    return violations
+
+
+def check_courtyard(pads,bboxes,lines):
+    """ check that all pads and fab lines are inside the courtyard """
+    courtyard = [point for startpoint,endpoint,layer,width in lines if layer == "F.CrtYd" for point in (startpoint,endpoint)]
+    if not courtyard:
+        return [drc_violation("courtyard","footprint has no courtyard")]
+    crtyd = (mm_to_nm(min(pt[0] for pt in courtyard)),mm_to_nm(min(pt[1] for pt in courtyard)),
+             mm_to_nm(max(pt[0] for pt in courtyard)),mm_to_nm(max(pt[1] for pt in courtyard)))
+    violations = []
+    for idx,bbox in enumerate(bboxes):
+        if bbox[0] < crtyd[0] or bbox[1] < crtyd[1] or bbox[2] > crtyd[2] or bbox[3] > crtyd[3]:
+            violations.append(drc_violation("courtyard","pad {0} is outside of the courtyard".format(pads.padnums[idx]),
+                                            location=(nm_to_mm(pads.posx[idx]),nm_to_mm(pads.posy[idx]))))
+    for startpoint,endpoint,layer,width in lines:
+        if layer != "F.Fab":
+            continue
+        for point in (startpoint,endpoint):
+            x,y = mm_to_nm(point[0]),mm_to_nm(point[1])
+            if x < crtyd[0] or y < crtyd[1] or x > crtyd[2] or y > crtyd[3]:
+                violations.append(drc_violation("courtyard","fab line point {0} is outside of the courtyard".format(point),location=point))
+    return violations
+
+
+def check_via_paste(pads,bboxes,grid,via_paste_clearance):
+    """ check that no drill hole of a thermal via is under a paste aperture """
+    violations = []
+    clearance_nm = mm_to_nm(via_paste_clearance)
+    paste = [("F.Paste" in layers or "B.Paste" in layers) for layers in pads.layers_table]
+    for idx,drill in enumerate(pads.drills):
+        if not drill:
+            continue
+        radius = drill/2
+        posx,posy = pads.posx[idx],pads.posy[idx]
+        margin = int(radius)+clearance_nm+1
+        for other in sorted(grid.query((posx-margin,posy-margin,posx+margin,posy+margin))):
+            if other == idx or not paste[pads.layers[other]]:
+                continue
+            gap = get_point_bbox_distance(posx,posy,bboxes[other])-radius
+            if gap < clearance_nm:
+                violations.append(drc_violation("via_in_paste",
+                                                "drill of via {0} is {1:.3f}mm from a paste aperture".format(pads.padnums[idx],nm_to_mm(max(gap,0))),
+                                                location=(nm_to_mm(posx),nm_to_mm(posy))))
+    return violations
+
+
+def check_footprint(fp_obj,pad_clearance=0.1,silk_clearance=0.0,via_paste_clearance=0.0):
+    """ run all design rule checks on a footprint
+        @param fp_obj: a kicad_footprint, generated or read with footprintparser
+        @param pad_clearance: minimum copper gap between pads of different pad numbers in mm
+        @param silk_clearance: minimum gap between silkscreen lines and front pads in mm
+        @param via_paste_clearance: minimum gap between via drills and paste apertures in mm
+        @return: list of drc_violation
+    """
+    pads = fp_obj.pads
+    if not isinstance(pads,footprint_pad_array):
+        pads = footprint_pad_array(pads)
+    if not len(pads):
+        return []
+    bboxes = get_pad_bboxes(pads)
+    #cells about the size of a typical pad keep the number of candidates per query small
+    sizes = sorted(max(bbox[2]-bbox[0],bbox[3]-bbox[1]) for bbox in bboxes)
+    grid = spatial_grid(sizes[len(sizes)//2]+mm_to_nm(max(pad_clearance,silk_clearance,via_paste_clearance)))
+    for idx,bbox in enumerate(bboxes):
+        grid.insert(idx,bbox)
+    lines = fp_obj.get_lines()
+    violations = []
+    violations.extend(check_pad_clearance(pads,bboxes,grid,pad_clearance))
+    violations.extend(check_silkscreen(pads,bboxes,grid,lines,silk_clearance))
+    violations.extend(check_courtyard(pads,bboxes,lines))
+    violations.extend(check_via_paste(pads,bboxes,grid,via_paste_clearance))
+    return violations
+
+
+def main(argv=None):
+    from footprintparser import read_footprint
+    parser = argparse.ArgumentParser(description="Run design rule checks on .kicad_mod files")
+    parser.add_argument("files",nargs="+",help=".kicad_mod files")
+    parser.add_argument("--pad-clearance",type=float,default=0.1,help="minimum gap between pads in mm")
+    parser.add_argument("--silk-clearance",type=float,default=0.0,help="minimum gap between silkscreen and pads in mm")
+    parser.add_argument("--via-paste-clearance",type=float,default=0.0,help="minimum gap between via drills and paste in mm")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for filepath in args.files:
+        violations = check_footprint(read_footprint(filepath),pad_clearance=args.pad_clearance,
+                                     silk_clearance=args.silk_clearance,via_paste_clearance=args.via_paste_clearance)
+        for violation in violations:
+            print("{0}: {1}".format(filepath,violation))
+        if violations:
+            failed += 1
+    print("{0} footprints checked, {1} with violations".format(len(args.files),failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
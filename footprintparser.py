@@ -0,0 +1,484 @@
+#file: footprintparser.py
+#purpose: read .kicad_mod files back into kicad_footprint objects and index footprint libraries
+#author: Patrick Menschel (C)2018
+
+import re
+import os
+import mmap
+import json
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from makefootprint import kicad_footprint, footprint_pad_array, fp_line, fp_text, fp_model, primitive_pool, nm_to_mm
+
+#one token is an opening or closing bracket, a quoted string or an atom
+TOKEN_PATTERN = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+MODEL_PREFIX = "${KISYS3DMOD}/"
+INDEX_VERSION = 1
+#the items and sub-items that the primitives keep, any other item makes a footprint unwritable instead of being dropped by format()
+FOOTPRINT_ITEMS = ["layer","tedit","descr","tags","attr","fp_text","fp_line","pad","model"]
+ORDERED_ITEMS = ["fp_text","fp_line","pad","model"]#written in the order of the file, see kicad_footprint.item_order
+PAD_ITEMS = ["at","size","drill","layers"]
+TEXT_ITEMS = ["at","layer","effects","hide"]
+FONT_ITEMS = ["size","thickness"]
+LINE_ITEMS = ["start","end","layer","width","stroke"]
+STROKE_ITEMS = ["width","type"]
+MODEL_ITEMS = ["at","offset","scale","rotate"]
+
+
+def parse_sexpr(data):
+    """ parse an s-expression into nested lists of strings
+        quoted strings keep their quotes, so "" can be told apart from an atom
+        @param data: bytes, bytearray or mmap
+        @return: the first top level expression as nested lists
+    """
+    stack = []
+    current = None
+    for match in TOKEN_PATTERN.finditer(data):
+        token = match.group()
+        if token == b"(":
+            newlist = []
+            if current is not None:
+                current.append(newlist)
+                stack.append(current)
+            current = newlist
+        elif token == b")":
+            if current is None:
+                raise ValueError("Unexpected ) at offset {0}".format(match.start()))
+            if not stack:
+                return current
+            current = stack.pop()
+        else:
+            if current is None:
+                raise ValueError("Unexpected atom at offset {0}".format(match.start()))
+            current.append(token.decode("utf-8"))
+    raise ValueError("Unexpected end of data")
+
+
+def unquote(value):
+    """ remove the quotes from a quoted string token """
+    if len(value) >= 2 and value[0] == "\"" and value[-1] == "\"":
+        return value[1:-1].replace("\\\"","\"")
+    return value
+
+
+def get_nodes(tree,name):
+    """ return all child nodes of a tree with a given name """
+    return [node for node in tree if isinstance(node,list) and node and node[0] == name]
+
+
+def get_node(tree,name):
+    """ return the first child node of a tree with a given name or None """
+    for node in tree:
+        if isinstance(node,list) and node and node[0] == name:
+            return node
+    return None
+
+
+def get_floats(node):
+    """ return the numeric values of a node like (at 1.0 2.0) """
+    values = []
+    for value in node[1:]:
+        if isinstance(value,list):
+            break
+        try:
+            values.append(float(value))
+        except ValueError:
+            continue#e.g. (drill oval 1 2)
+    return values
+
+
+def parse_padnum(value):
+    value = unquote(value)
+    if value == "":
+        return None
+    if value.isdigit():
+        return int(value)
+    return value
+
+
+def get_unsupported_items(node,kept,start=1,atoms=(),prefix=None):
+    """ return the names of the sub-items of a node that are not kept, like "pad roundrect_rratio"
+        @param kept: names of the sub-nodes that are kept
+        @param start: index of the first child that is checked
+        @param atoms: atoms that are kept, e.g. "hide"
+        @param prefix: put before the names, the name of the node if None, "" for the bare names
+    """
+    if prefix is None:
+        prefix = "{0} ".format(node[0])
+    unsupported = []
+    for child in node[start:]:
+        if isinstance(child,list):
+            if not child or child[0] not in kept:
+                unsupported.append("{0}{1}".format(prefix,child[0] if child else "()"))
+        elif child not in atoms:
+            unsupported.append("{0}{1}".format(prefix,child))
+    return unsupported
+
+
+def get_unsupported_pad_items(node):
+    """ return the names of everything of a pad that footprint_pad does not keep """
+    unsupported = get_unsupported_items(node,PAD_ITEMS,start=4)
+    at = get_node(node,"at") or ["at"]
+    atvalues = get_floats(at)
+    if len(atvalues) != len(at)-1 or not 2 <= len(atvalues) <= 3:
+        unsupported.append("pad at {0}".format(" ".join(str(value) for value in at[1:])))
+    elif len(atvalues) == 3 and atvalues[2]:
+        unsupported.append("rotated pad")
+    if node[3] == "custom":
+        unsupported.append("custom pad")
+    drill = get_node(node,"drill")
+    if drill is not None and len(drill) != 2:
+        unsupported.append("oval or offset drill")
+    return unsupported
+
+
+def get_unsupported_text_items(node):
+    """ return the names of everything of a text that fp_text does not keep """
+    unsupported = get_unsupported_items(node,TEXT_ITEMS,start=3,atoms=("hide",))
+    at = get_node(node,"at")
+    if at is None or len(get_floats(at)) != len(at)-1 or len(at) > 4:
+        unsupported.append("fp_text at {0}".format(" ".join(value for value in (at or [])[1:] if isinstance(value,str))))
+    effects = get_node(node,"effects")
+    if effects is not None:
+        unsupported.extend(get_unsupported_items(effects,["font"]))
+        unsupported.extend(get_unsupported_items(get_node(effects,"font") or ["font"],FONT_ITEMS))
+    return unsupported
+
+
+def get_unsupported_line_items(node):
+    """ return the names of everything of a line that fp_line does not keep, a solid stroke is the same as a width """
+    unsupported = get_unsupported_items(node,LINE_ITEMS)
+    stroke = get_node(node,"stroke")
+    if stroke is not None:
+        unsupported.extend(get_unsupported_items(stroke,STROKE_ITEMS))
+        stroketype = get_node(stroke,"type")
+        if stroketype is not None and stroketype[1:] not in (["solid"],["default"]):
+            unsupported.append("stroke type {0}".format(" ".join(str(value) for value in stroketype[1:])))
+    return unsupported
+
+
+def get_xyz(node,name,default):
+    """ return the values of a model node like (scale (xyz 1 1 1)) """
+    xyz = get_node(get_node(node,name) or [],"xyz")
+    return tuple(get_floats(xyz)) if xyz else default
+
+
+def tree_to_footprint(tree,pool=None):
+    """ convert a parsed module to a kicad_footprint
+        @param tree: nested lists from parse_sexpr
+        @param pool: a primitive_pool to share equal lines, texts and models with other footprints
+        @return: a kicad_footprint, fp_line, fp_text and fp_model items are in its lines, texts and model attributes
+    """
+    if not tree or tree[0] not in ["module","footprint"]:
+        raise ValueError("Not a footprint {0}".format(tree[0] if tree else None))
+    name = unquote(tree[1])
+    layer = get_node(tree,"layer")
+    tedit = get_node(tree,"tedit")
+    descr = get_node(tree,"descr")
+    tags = get_node(tree,"tags")
+    attr = get_node(tree,"attr")
+    desc = unquote(descr[1]) if descr else ""
+    datasheet = ""
+    if desc.endswith(")") and " (" in desc:#the generator writes "description (datasheet)"
+        desc,datasheet = desc[:-1].rsplit(" (",1)
+
+    unsupported = get_unsupported_items(tree,FOOTPRINT_ITEMS,start=2,prefix="")
+    item_order = []
+    for node in tree[2:]:
+        if isinstance(node,list) and node and node[0] in ORDERED_ITEMS:
+            if item_order and item_order[-1][0] == node[0]:
+                item_order[-1][1] += 1
+            else:
+                item_order.append([node[0],1])
+    pads = footprint_pad_array()
+    for node in get_nodes(tree,"pad"):
+        unsupported.extend(get_unsupported_pad_items(node))
+        drill = get_node(node,"drill")
+        drillvalues = get_floats(drill) if drill else []
+        at = get_floats(get_node(node,"at"))
+        pads.add(parse_padnum(node[1]),
+                 xypos=tuple(at[:2]),
+                 sizexy=tuple(get_floats(get_node(node,"size"))[:2]),
+                 padtype=node[2],
+                 padshape=node[3],
+                 layers=[unquote(layer) for layer in get_node(node,"layers")[1:]],
+                 drill=drillvalues[0] if drillvalues else None)
+
+    lines = []
+    for node in get_nodes(tree,"fp_line"):
+        unsupported.extend(get_unsupported_line_items(node))
+        width = get_node(node,"width") or get_node(get_node(node,"stroke") or [],"width")
+        lines.append(fp_line(get_floats(get_node(node,"start")),
+                             get_floats(get_node(node,"end")),
+                             unquote(get_node(node,"layer")[1]),
+                             get_floats(width)[0] if width else None))
+    texts = []
+    for node in get_nodes(tree,"fp_text"):
+        unsupported.extend(get_unsupported_text_items(node))
+        at = get_floats(get_node(node,"at"))
+        font = get_node(get_node(node,"effects") or [],"font") or []
+        size = get_node(font,"size")
+        thickness = get_node(font,"thickness")
+        texts.append(fp_text(unquote(node[2]),at[:2],unquote(get_node(node,"layer")[1]),
+                             fontsize=get_floats(size)[:2] if size else (1,1),
+                             thickness=get_floats(thickness)[0] if thickness else 0.15,
+                             texttype=node[1],
+                             angle=at[2] if len(at) > 2 else 0,
+                             hide="hide" in node[3:] or (get_node(node,"hide") or [])[1:] == ["yes"]))#kicad 7 writes (hide yes)
+
+    models = get_nodes(tree,"model")
+    model = None
+    model3dname = unquote(models[0][1]) if models else None
+    if model3dname and model3dname.startswith(MODEL_PREFIX):
+        model3dname = model3dname[len(MODEL_PREFIX):]
+    elif model3dname:
+        unsupported.append("model outside of {0}".format(MODEL_PREFIX))
+    if len(models) > 1:
+        unsupported.append("second model")
+    if models:
+        unsupported.extend(get_unsupported_items(models[0],MODEL_ITEMS,start=2))
+    if model3dname:
+        model = fp_model(model3dname,
+                         offset=get_xyz(models[0],"offset",get_xyz(models[0],"at",(0,0,0))),#kicad 6 calls it offset, kicad 5 at
+                         scale=get_xyz(models[0],"scale",(1,1,1)),
+                         rotate=get_xyz(models[0],"rotate",(0,0,0)))
+    if pool is not None:
+        lines = [pool.intern(line) for line in lines]
+        texts = [pool.intern(text) for text in texts]
+        model = pool.intern(model) if model is not None else None
+
+    #the package outline is not stored in the file, take the extent of the fab lines
+    fabpoints = [point for start,end,linelayer,width in lines if linelayer == "F.Fab" for point in (start,end)]
+    if fabpoints:
+        package_dimensions = (max(pt[0] for pt in fabpoints)-min(pt[0] for pt in fabpoints),
+                              max(pt[1] for pt in fabpoints)-min(pt[1] for pt in fabpoints))
+    else:
+        package_dimensions = (0,0)
+
+    fp_obj = kicad_footprint(name=name,desc=desc,datasheet=datasheet,pads=pads,
+                             tedit=tedit[1] if tedit else None,
+                             layers=[unquote(value) for value in layer[1:]] if layer else [],
+                             tags=unquote(tags[1]).split() if tags else [],
+                             attr=attr[1:] if attr else [],
+                             model3dname=model3dname,
+                             package_dimensions=package_dimensions)
+    fp_obj.lines = lines
+    fp_obj.texts = texts
+    fp_obj.model = model
+    fp_obj.unsupported = list(dict.fromkeys(unsupported))#each name once, in the order of the file
+    fp_obj.item_order = [tuple(item) for item in item_order]
+    return fp_obj
+
+
+def read_footprint(filepath,pool=None):
+    """ read a .kicad_mod file into a kicad_footprint
+        @param filepath: path to the file
+        @param pool: a primitive_pool, see tree_to_footprint
+        @return: a kicad_footprint
+    """
+    with open(filepath,"rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("Empty file {0}".format(filepath))
+        with mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as data:
+            return tree_to_footprint(parse_sexpr(data),pool=pool)
+
+
+def get_footprint_paths(libdirs):
+    """ return the paths of all .kicad_mod files in libraries, the directories are searched recursively """
+    filepaths = []
+    for libdir in libdirs:
+        for dirpath,dirnames,filenames in os.walk(libdir):
+            filepaths.extend(os.path.join(dirpath,filename) for filename in filenames if filename.endswith(".kicad_mod"))
+    return filepaths
+
+
+def is_in_directory(filepath,dirpath):
+    """ return True if filepath is inside dirpath, compared on whole path components, so lib2/a is not inside lib """
+    dirpath = os.path.abspath(dirpath)
+    try:
+        return os.path.commonpath([os.path.abspath(filepath),dirpath]) == dirpath
+    except ValueError:#different drives
+        return False
+
+
+def read_library(libdirs,pool=None):
+    """ read all footprints of libraries into memory, e.g. to diff or check them
+        equal lines, texts and models of all footprints are shared through a primitive_pool
+        @param libdirs: list of directories, usually .pretty folders
+        @param pool: a primitive_pool, a new one if None, pass the same pool to share primitives between calls
+        @return: dict of path -> kicad_footprint
+    """
+    if pool is None:
+        pool = primitive_pool()
+    return dict((filepath,read_footprint(filepath,pool=pool)) for filepath in get_footprint_paths(libdirs))
+
+
+def get_pitch(pads):
+    """ return the smallest distance between two signal pads in the same row or column or None
+        pads that share their number, like the exposed pad and its thermal vias, are ignored
+    """
+    rows = {}
+    cols = {}
+    padnumcount = Counter(pads.padnums)
+    for posx,posy,padnum in zip(pads.posx,pads.posy,pads.padnums):
+        if padnum is None or padnumcount[padnum] > 1:
+            continue
+        rows.setdefault(posy,[]).append(posx)
+        cols.setdefault(posx,[]).append(posy)
+    pitch = None
+    for group in list(rows.values())+list(cols.values()):
+        group = sorted(set(group))
+        for pos,nextpos in zip(group,group[1:]):
+            if pitch is None or nextpos-pos < pitch:
+                pitch = nextpos-pos
+    if pitch is None:
+        return None
+    return nm_to_mm(pitch)
+
+
+def get_ep_size(pads):
+    """ return the size of the exposed pad, the biggest numbered front copper pad in the center, or None """
+    epsize = None
+    for idx in range(len(pads)):
+        if pads.padnums[idx] is None or pads.posx[idx] or pads.posy[idx]:
+            continue
+        if "F.Cu" not in pads.layers_table[pads.layers[idx]]:
+            continue
+        sizexy = (nm_to_mm(pads.sizex[idx]),nm_to_mm(pads.sizey[idx]))
+        if epsize is None or sizexy[0]*sizexy[1] > epsize[0]*epsize[1]:
+            epsize = sizexy
+    return epsize
+
+
+def get_index_entry(filepath):
+    """ read a footprint file and return its index entry
+        @return: dict with name, pad count, pitch, extents and ep size
+    """
+    stat = os.stat(filepath)
+    fp_obj = read_footprint(filepath)
+    pads = fp_obj.pads
+    minxy,maxxy = fp_obj.get_outer_dimensions()
+    padnums = set(padnum for padnum in pads.padnums if padnum is not None)
+    return {"path":filepath,
+            "mtime":stat.st_mtime,
+            "size":stat.st_size,
+            "name":fp_obj.name,
+            "padcount":len(padnums),
+            "pitch":get_pitch(pads),
+            "extents":[list(minxy),list(maxxy)],
+            "epsize":get_ep_size(pads),
+            }
+
+
+class footprint_index():
+
+
+    def __init__(self,filepath=None):
+        """ A persistent index of footprint libraries for fast lookup of matching footprints
+            @param filepath: path to the json file that holds the index, None for an in memory index
+        """
+        self.filepath = filepath
+        self.entries = {}#path -> entry
+        self.errors = {}#path -> error message of the last update
+        self._lookup = None
+        if filepath is not None:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.filepath) as f:
+                data = json.load(f)
+        except (FileNotFoundError,ValueError):
+            return
+        if data.get("version") == INDEX_VERSION:
+            self.entries = dict((entry["path"],entry) for entry in data["entries"])
+            self._lookup = None
+
+    def save(self):
+        tmppath = "{0}.tmp".format(self.filepath)
+        with open(tmppath,"w") as f:
+            json.dump({"version":INDEX_VERSION,"entries":list(self.entries.values())},f)
+        os.replace(tmppath,self.filepath)
+
+    def update(self,libdirs,max_workers=None):
+        """ scan footprint libraries and (re)read all files that are new or changed since the last update
+            @param libdirs: list of directories, usually .pretty folders, they are searched recursively
+            @param max_workers: number of threads that read files
+            @return: number of files that were read
+        """
+        filepaths = get_footprint_paths(libdirs)
+        found = set(filepaths)
+        for filepath in list(self.entries):
+            if filepath not in found and any(is_in_directory(filepath,libdir) for libdir in libdirs):
+                del self.entries[filepath]
+        changed = []
+        for filepath in filepaths:
+            entry = self.entries.get(filepath)
+            stat = os.stat(filepath)
+            if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+                changed.append(filepath)
+        self.errors = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for filepath,future in [(filepath,executor.submit(get_index_entry,filepath)) for filepath in changed]:
+                try:
+                    self.entries[filepath] = future.result()
+                except Exception as e:#a broken file must not stop the scan
+                    self.entries.pop(filepath,None)
+                    self.errors[filepath] = "{0}: {1}".format(type(e).__name__,e)
+        self._lookup = None
+        return len(changed)
+
+    def _get_lookup(self):
+        if self._lookup is None:
+            self._lookup = {}
+            for entry in self.entries.values():
+                self._lookup.setdefault(entry["padcount"],[]).append(entry)
+        return self._lookup
+
+    def find(self,padcount,pitch=None,epsize=None,tolerance=0.005):
+        """ find footprints that match a pad count and optionally pitch and ep size
+            @param padcount: number of distinct pad numbers
+            @param pitch: pad pitch
+            @param epsize: (x,y) of the exposed pad, the orientation is ignored
+            @param tolerance: allowed difference for pitch and ep size
+            @return: list of index entries
+        """
+        matches = []
+        for entry in self._get_lookup().get(padcount,[]):
+            if pitch is not None and (entry["pitch"] is None or abs(entry["pitch"]-pitch) > tolerance):
+                continue
+            if epsize is not None:
+                if entry["epsize"] is None:
+                    continue
+                if not all(abs(a-b) <= tolerance for a,b in zip(sorted(entry["epsize"]),sorted(epsize))):
+                    continue
+            matches.append(entry)
+        return matches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index kicad footprint libraries and look up matching footprints")
+    parser.add_argument("libdirs",nargs="+",help="footprint library directories")
+    parser.add_argument("--index",default="footprintindex.json",help="index file")
+    parser.add_argument("-j","--jobs",type=int,default=None,help="number of threads")
+    parser.add_argument("--padcount",type=int,default=None,help="look up footprints with this number of pads")
+    parser.add_argument("--pitch",type=float,default=None,help="look up footprints with this pitch")
+    parser.add_argument("--epsize",type=float,nargs=2,default=None,help="look up footprints with this exposed pad size")
+    args = parser.parse_args(argv)
+
+    index = footprint_index(args.index)
+    numread = index.update(args.libdirs,max_workers=args.jobs)
+    index.save()
+    for filepath,error in sorted(index.errors.items()):
+        print("{0}: {1}".format(filepath,error))
+    print("{0} footprints indexed, {1} read, {2} failed".format(len(index.entries),numread,len(index.errors)))
+    if args.padcount is not None:
+        for entry in index.find(args.padcount,pitch=args.pitch,epsize=args.epsize):
+            print(entry["path"])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,367 @@
+#file: footprintpreview.py
+#purpose: headless previews of footprints as svg or png and a contact sheet for reviewing whole libraries
+#author: Patrick Menschel (C)2018
+
+#svg is written without any dependency, matplotlib is optional and only imported when a png is actually requested
+#so importing makefootprint stays fast and does not probe for a gui backend
+#previews use micrometres as svg user units, the geometry is held in integer nanometres so all coordinates are plain integers
+
+import argparse
+import html
+import os
+from concurrent.futures import ProcessPoolExecutor
+from operator import floordiv, sub
+
+from makefootprint import footprint_pad_array
+from footprintwriter import write_file_atomic
+
+#layers in drawing order with their kicad like colors
+PREVIEW_LAYERS = [("B.Cu","#4d7fc4"),("F.Cu","#c83434"),("F.Paste","#b4b4b4"),("Drill","#e3b72e"),
+                  ("F.Fab","#afafaf"),("F.SilkS","#f2eda1"),("F.CrtYd","#ff26e2")]
+PREVIEW_BACKGROUND = "#001023"
+PREVIEW_MARGIN = 500#um around the footprint
+
+
+def get_pyplot(headless=False):
+    """ import matplotlib.pyplot on demand
+        @param headless: select the Agg backend, for writing files without a display
+        @return: the matplotlib.pyplot module
+    """
+    try:
+        import matplotlib
+        if headless:
+            matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError as e:
+        raise ImportError("matplotlib is required for png previews, install it with 'pip install matplotlib'") from e
+    return plt
+
+
+def plot_points(points,figname,filepath=None):
+    """ draw a polygon and annotate its points into an svg file, for debugging only
+        @param points: list of (x,y) points in mm, the polygon is closed automatically
+        @param figname: title of the drawing
+        @param filepath: svg file to write, <figname>.svg if None
+        @return: the path of the svg file
+    """
+    pts = [(int(round(x*1000)),int(round(y*1000))) for x,y in points]
+    minx = min(x for x,y in pts)-PREVIEW_MARGIN
+    miny = min(y for x,y in pts)-PREVIEW_MARGIN
+    width = max(x for x,y in pts)+PREVIEW_MARGIN-minx
+    height = max(y for x,y in pts)+PREVIEW_MARGIN-miny
+    lines = [get_svg_header(minx,miny,width,height,figname),
+             "<polygon points=\"{0}\" fill=\"none\" stroke=\"#c83434\" stroke-width=\"40\"/>".format(" ".join("{0},{1}".format(x,y) for x,y in pts))]
+    for idx,(point,(x,y)) in enumerate(zip(points,pts)):
+        lines.append("<circle cx=\"{0}\" cy=\"{1}\" r=\"60\" fill=\"#f2eda1\"/>".format(x,y))
+        lines.append("<text x=\"{0}\" y=\"{1}\" font-size=\"150\" fill=\"#f2eda1\">PT{2} ({3},{4})</text>".format(x+80,y-80,idx,point[0],point[1]))
+    lines.append("</svg>")
+    if filepath is None:
+        filepath = "{0}.svg".format(figname)
+    with open(filepath,"w") as f:
+        f.write("\n".join(lines))
+    return filepath
+
+
+def get_preview_items(fp_obj):
+    """ return the shapes of a footprint in drawing units of micrometres
+        @param fp_obj: a kicad_footprint, generated or read with footprintparser
+        @return: (items,bounds) with items a dict layer -> list of ("rect",x,y,w,h,radius), ("circle",cx,cy,r) or ("line",x1,y1,x2,y2,width)
+                 and bounds (minx,miny,maxx,maxy)
+    """
+    pads = fp_obj.pads
+    if not isinstance(pads,footprint_pad_array):
+        pads = footprint_pad_array(pads)
+    items = dict((layer,[]) for layer,color in PREVIEW_LAYERS)
+    targets = get_pad_targets(pads)
+    shapes = pads.padshape_table
+    bounds = [0,0,0,0]
+    for posx,posy,sizex,sizey,drill,shape,layers in zip(pads.posx,pads.posy,pads.sizex,pads.sizey,pads.drills,pads.padshapes,pads.layers):
+        x = (posx-sizex//2)//1000
+        y = (posy-sizey//2)//1000
+        w = sizex//1000
+        h = sizey//1000
+        shapename = shapes[shape]
+        if shapename == "circle":
+            item = ("circle",posx//1000,posy//1000,w//2)
+        elif shapename == "oval":
+            item = ("rect",x,y,w,h,min(w,h)//2)
+        elif shapename == "roundrect":
+            item = ("rect",x,y,w,h,min(w,h)//4)
+        else:
+            item = ("rect",x,y,w,h,0)
+        for layer in targets[layers]:
+            items[layer].append(item)
+        if drill:
+            items["Drill"].append(("circle",posx//1000,posy//1000,drill//2000))
+        bounds[0] = min(bounds[0],x)
+        bounds[1] = min(bounds[1],y)
+        bounds[2] = max(bounds[2],x+w)
+        bounds[3] = max(bounds[3],y+h)
+    for startpoint,endpoint,layer,width in fp_obj.get_lines():
+        if layer not in items:
+            continue
+        x1,y1 = int(round(startpoint[0]*1000)),int(round(startpoint[1]*1000))
+        x2,y2 = int(round(endpoint[0]*1000)),int(round(endpoint[1]*1000))
+        items[layer].append(("line",x1,y1,x2,y2,int(round((width or 0.1)*1000))))
+        bounds[0] = min(bounds[0],x1,x2)
+        bounds[1] = min(bounds[1],y1,y2)
+        bounds[2] = max(bounds[2],x1,x2)
+        bounds[3] = max(bounds[3],y1,y2)
+    return items,bounds
+
+
+def get_pad_targets(pads):
+    """ return for each entry of the layers table of a footprint_pad_array the preview layers it is drawn on """
+    targets = []
+    for layers in pads.layers_table:
+        target = []
+        if "F.Cu" in layers or "*.Cu" in layers:
+            target.append("F.Cu")
+        elif "B.Cu" in layers:
+            target.append("B.Cu")
+        if "F.Paste" in layers:
+            target.append("F.Paste")
+        targets.append(target)
+    return targets
+
+
+def get_pad_template(shapename,sizex,sizey):
+    """ return the svg element of a pad as format string of its (x,y) in micrometres, x and y are the corner or the center for circles """
+    w = sizex//1000
+    h = sizey//1000
+    if shapename == "circle":
+        return "<circle cx=\"{{0}}\" cy=\"{{1}}\" r=\"{0}\"/>".format(w//2)
+    if shapename == "oval":
+        radius = min(w,h)//2
+    elif shapename == "roundrect":
+        radius = min(w,h)//4
+    else:
+        radius = 0
+    if radius:
+        return "<rect x=\"{{0}}\" y=\"{{1}}\" width=\"{0}\" height=\"{1}\" rx=\"{2}\"/>".format(w,h,radius)
+    return "<rect x=\"{{0}}\" y=\"{{1}}\" width=\"{0}\" height=\"{1}\"/>".format(w,h)
+
+
+def get_svg_elements(fp_obj):
+    """ return the svg elements of a footprint, same drawing as get_preview_items but built straight from the pad columns,
+        pads of the same shape and size share one template
+        @return: (elements,bounds) with elements a dict layer -> list of svg element strings
+    """
+    pads = fp_obj.pads
+    if not isinstance(pads,footprint_pad_array):
+        pads = footprint_pad_array(pads)
+    elements = dict((layer,[]) for layer,color in PREVIEW_LAYERS)
+    targets = [[elements[layer] for layer in target] for target in get_pad_targets(pads)]
+    shapes = pads.padshape_table
+    drills = elements["Drill"]
+    templates = {}
+    for posx,posy,sizex,sizey,drill,shape,layers in zip(pads.posx,pads.posy,pads.sizex,pads.sizey,pads.drills,pads.padshapes,pads.layers):
+        key = (shape,sizex,sizey)
+        try:
+            template,centered = templates[key]
+        except KeyError:
+            template,centered = templates[key] = (get_pad_template(shapes[shape],sizex,sizey),shapes[shape] == "circle")
+        if centered:#circles are placed by their center
+            element = template.format(posx//1000,posy//1000)
+        else:
+            element = template.format((posx-sizex//2)//1000,(posy-sizey//2)//1000)
+        for target in targets[layers]:
+            target.append(element)
+        if drill:
+            drills.append("<circle cx=\"{0}\" cy=\"{1}\" r=\"{2}\"/>".format(posx//1000,posy//1000,drill//2000))
+    bounds = [0,0,0,0]
+    if len(pads):
+        halfx = list(map(floordiv,pads.sizex,[2]*len(pads)))
+        halfy = list(map(floordiv,pads.sizey,[2]*len(pads)))
+        minx = min(map(sub,pads.posx,halfx))//1000
+        miny = min(map(sub,pads.posy,halfy))//1000
+        bounds = [min(0,minx),min(0,miny),
+                  max(0,max(((posx-half)//1000+size//1000 for posx,half,size in zip(pads.posx,halfx,pads.sizex)))),
+                  max(0,max(((posy-half)//1000+size//1000 for posy,half,size in zip(pads.posy,halfy,pads.sizey))))]
+    for startpoint,endpoint,layer,width in fp_obj.get_lines():
+        if layer not in elements:
+            continue
+        x1,y1 = int(round(startpoint[0]*1000)),int(round(startpoint[1]*1000))
+        x2,y2 = int(round(endpoint[0]*1000)),int(round(endpoint[1]*1000))
+        elements[layer].append("<line x1=\"{0}\" y1=\"{1}\" x2=\"{2}\" y2=\"{3}\" stroke-width=\"{4}\"/>".format(x1,y1,x2,y2,int(round((width or 0.1)*1000))))
+        bounds[0] = min(bounds[0],x1,x2)
+        bounds[1] = min(bounds[1],y1,y2)
+        bounds[2] = max(bounds[2],x1,x2)
+        bounds[3] = max(bounds[3],y1,y2)
+    return elements,bounds
+
+
+def get_svg_header(minx,miny,width,height,title,scale=0.1):
+    """ return the opening svg tag with a background, scale is pixels per micrometre """
+    return ("<svg xmlns=\"http://www.w3.org/2000/svg\" viewBox=\"{0} {1} {2} {3}\" width=\"{4}\" height=\"{5}\">\n"
+            "<title>{6}</title>\n"
+            "<rect x=\"{0}\" y=\"{1}\" width=\"{2}\" height=\"{3}\" fill=\"{7}\"/>").format(minx,miny,width,height,int(width*scale),int(height*scale),
+                                                                                         html.escape(str(title)),PREVIEW_BACKGROUND)
+
+
+def render_svg(fp_obj,scale=0.1):
+    """ render a footprint to svg
+        @param fp_obj: a kicad_footprint
+        @param scale: pixels per micrometre of the svg size, 0.1 is 100 pixels per mm
+        @return: the svg text
+    """
+    elements,bounds = get_svg_elements(fp_obj)
+    minx = bounds[0]-PREVIEW_MARGIN
+    miny = bounds[1]-PREVIEW_MARGIN
+    width = bounds[2]+PREVIEW_MARGIN-minx
+    height = bounds[3]+PREVIEW_MARGIN-miny
+    lines = [get_svg_header(minx,miny,width,height,fp_obj.name,scale=scale)]
+    for layer,color in PREVIEW_LAYERS:
+        if not elements[layer]:
+            continue
+        if layer in ["F.Fab","F.SilkS","F.CrtYd"]:
+            lines.append("<g id=\"{0}\" stroke=\"{1}\" stroke-linecap=\"round\">".format(layer,color))
+        else:
+            lines.append("<g id=\"{0}\" fill=\"{1}\" fill-opacity=\"0.8\">".format(layer,color))
+        lines.extend(elements[layer])
+        lines.append("</g>")
+    lines.append("<text x=\"{0}\" y=\"{1}\" font-size=\"{2}\" fill=\"#afafaf\" font-family=\"sans-serif\">{3}</text>".format(minx+PREVIEW_MARGIN//4,miny+height-PREVIEW_MARGIN//4,
+                                                                                                                        PREVIEW_MARGIN//2,html.escape(str(fp_obj.name))))
+    lines.append("</svg>")
+    return "\n".join(lines)
+
+
+def render_png(fp_obj,filepath,pixels_per_mm=100):
+    """ render a footprint to png with matplotlib, same drawing as render_svg
+        @param fp_obj: a kicad_footprint
+        @param filepath: png file to write
+        @param pixels_per_mm: resolution
+    """
+    plt = get_pyplot(headless=True)
+    from matplotlib.patches import Circle, FancyBboxPatch, Rectangle
+    items,bounds = get_preview_items(fp_obj)
+    minx = bounds[0]-PREVIEW_MARGIN
+    miny = bounds[1]-PREVIEW_MARGIN
+    width = bounds[2]+PREVIEW_MARGIN-minx
+    height = bounds[3]+PREVIEW_MARGIN-miny
+    dpi = 100
+    fig = plt.figure(figsize=(width/1000*pixels_per_mm/dpi,height/1000*pixels_per_mm/dpi),dpi=dpi)
+    ax = fig.add_axes([0,0,1,1])
+    ax.set_facecolor(PREVIEW_BACKGROUND)
+    ax.set_xlim(minx,minx+width)
+    ax.set_ylim(miny+height,miny)#y points down like in kicad
+    ax.set_axis_off()
+    fig.patch.set_facecolor(PREVIEW_BACKGROUND)
+    linescale = 72/1000*pixels_per_mm/dpi#um to points
+    for layer,color in PREVIEW_LAYERS:
+        for item in items[layer]:
+            if item[0] == "rect":
+                kind,x,y,w,h,radius = item
+                if radius:
+                    ax.add_patch(FancyBboxPatch((x+radius,y+radius),w-2*radius,h-2*radius,boxstyle="round,pad={0}".format(radius),color=color,alpha=0.8,lw=0))
+                else:
+                    ax.add_patch(Rectangle((x,y),w,h,color=color,alpha=0.8,lw=0))
+            elif item[0] == "circle":
+                ax.add_patch(Circle((item[1],item[2]),item[3],color=color,alpha=0.8,lw=0))
+            else:
+                ax.plot([item[1],item[3]],[item[2],item[4]],color=color,lw=item[5]*linescale,solid_capstyle="round")
+    fig.savefig(filepath,dpi=dpi,facecolor=PREVIEW_BACKGROUND)
+    plt.close(fig)
+
+
+def get_preview_path(outdir,name,fmt="svg"):
+    return os.path.join(outdir,"{0}.{1}".format(name,fmt))
+
+
+def write_preview(fp_obj,outdir,fmt="svg"):
+    """ write the preview of a footprint into a directory
+        @return: the path of the preview file
+    """
+    filepath = get_preview_path(outdir,fp_obj.name,fmt)
+    if fmt == "svg":
+        write_file_atomic(filepath,render_svg(fp_obj))
+    elif fmt == "png":
+        render_png(fp_obj,filepath)
+    else:
+        raise ValueError("Unknown preview format {0}".format(fmt))
+    return filepath
+
+
+def render_file_job(filepath,outdir,fmt="svg"):
+    """ read a .kicad_mod file and write its preview, this runs in a worker process
+        @return: (name,preview path,error)
+    """
+    from footprintparser import read_footprint
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    try:
+        return name,write_preview(read_footprint(filepath),outdir,fmt=fmt),None
+    except Exception as e:#one broken file must not abort the contact sheet
+        return name,None,"{0}: {1}".format(type(e).__name__,e)
+
+
+def _render_file_job(args):
+    return render_file_job(*args)
+
+
+def render_files(filepaths,outdir,fmt="svg",max_workers=None):
+    """ write previews of .kicad_mod files in a process pool
+        @param max_workers: number of worker processes, None for the number of cpus, 0 to run in this process
+        @return: list of (name,preview path,error) in the order of filepaths
+    """
+    os.makedirs(outdir,exist_ok=True)
+    jobs = [(filepath,outdir,fmt) for filepath in filepaths]
+    if max_workers == 0:
+        return [_render_file_job(job) for job in jobs]
+    workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        #previews are about as quick as parsing, chunks keep the pool overhead per file small
+        return list(executor.map(_render_file_job,jobs,chunksize=max(1,len(jobs)//(4*workers))))
+
+
+def write_index(entries,outdir,title="Footprint previews"):
+    """ write a contact sheet index.html that shows all previews of a directory on one page
+        @param entries: list of (name,preview path,error), failed entries are listed at the top
+        @return: the path of index.html
+    """
+    lines = ["<!DOCTYPE html>",
+             "<html><head><meta charset=\"utf-8\"><title>{0}</title>".format(html.escape(title)),
+             "<style>body{background:#222;color:#ddd;font-family:sans-serif}"
+             ".sheet{display:grid;grid-template-columns:repeat(auto-fill,minmax(240px,1fr));gap:8px}"
+             "figure{margin:0;padding:4px;background:#001023}img{width:100%;height:200px;object-fit:contain}"
+             "figcaption{font-size:11px;word-break:break-all}.error{color:#ff6060}</style></head><body>",
+             "<h1>{0}</h1>".format(html.escape(title)),
+             "<p>{0} footprints, {1} failed</p>".format(len(entries),sum(1 for name,filepath,error in entries if error))]
+    for name,filepath,error in entries:
+        if error:
+            lines.append("<p class=\"error\">{0}: {1}</p>".format(html.escape(name),html.escape(error)))
+    lines.append("<div class=\"sheet\">")
+    for name,filepath,error in sorted(entries,key=lambda entry: entry[0]):
+        if error:
+            continue
+        src = html.escape(os.path.relpath(filepath,outdir),quote=True)
+        lines.append("<figure><a href=\"{0}\"><img src=\"{0}\" loading=\"lazy\" alt=\"{1}\"></a><figcaption>{1}</figcaption></figure>".format(src,html.escape(name)))
+    lines.append("</div></body></html>")
+    indexpath = os.path.join(outdir,"index.html")
+    write_file_atomic(indexpath,"\n".join(lines))
+    return indexpath
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render previews of .kicad_mod files and a contact sheet index.html")
+    parser.add_argument("paths",nargs="+",help=".kicad_mod files or .pretty directories")
+    parser.add_argument("-o","--outdir",default="preview",help="output directory")
+    parser.add_argument("--png",action="store_true",help="render png with matplotlib instead of svg")
+    parser.add_argument("-j","--jobs",type=int,default=None,help="number of worker processes, 0 to run in this process")
+    args = parser.parse_args(argv)
+
+    filepaths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            filepaths.extend(sorted(os.path.join(path,filename) for filename in os.listdir(path) if filename.endswith(".kicad_mod")))
+        else:
+            filepaths.append(path)
+    entries = render_files(filepaths,args.outdir,fmt="png" if args.png else "svg",max_workers=args.jobs)
+    for name,filepath,error in entries:
+        if error:
+            print("{0}: {1}".format(name,error))
+    print(write_index(entries,args.outdir))
+    return 1 if any(error for name,filepath,error in entries) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,285 @@
+#file: footprintserver.py
+#purpose: resident json lines service for footprint generation, avoids interpreter startup and imports per part
+#author: Patrick Menschel (C)2018
+
+#protocol: one json object per line in each direction
+#request  {"id":1,"params":{...columns of a batch table...}}                  -> {"id":1,"ok":true,"modulename":..,"text":..,"violations":[..],"cached":false,"elapsed_ms":..}
+#request  {"id":2,"params":{...},"outdir":"Package_DFN_QFN.pretty"}          -> {"id":2,"ok":true,"modulename":..,"filepath":..,"digest":..,"skipped":false,...}
+#request  {"id":3,"op":"stats"}                                               -> {"id":3,"ok":true,"stats":{"requests":..,"p50_ms":..,...}}
+#request  {"op":"ping"} / {"op":"shutdown"}
+#errors are answered with {"id":..,"ok":false,"error":"..."}, the service keeps running
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
+from batchfootprint import row_to_kwargs, make_footprint_job
+from footprintcache import get_parameter_key, get_text_digest
+from footprintdrc import check_footprint
+from makefootprint import build_footprint_stmicro
+
+
+def make_footprint_text(kwargs,drc=True):
+    """ generate a footprint as text, this runs in a worker process
+        @return: (text,violations as text)
+    """
+    footprint = build_footprint_stmicro(**kwargs)
+    violations = [repr(violation) for violation in check_footprint(footprint)] if drc else []
+    return footprint.format(),violations
+
+
+def _warm_up():
+    #run a small footprint once, so imports and format caches of a fresh worker are warm before the first request
+    make_footprint_text(dict(N=8,E=0.5,X2=1.65,Y2=1.8,C=2.9,X=0.25,Y=0.85,V=0.3,EV=1.0,modulename="warmup",description="",datasheet="",
+                             centerpad=True,numthermalvias=4,package_dimensions=(3,2)))
+
+
+class latency_stats():
+
+
+    def __init__(self,window=10000):
+        """ A class to collect the latency of requests, percentiles are taken over the last window requests """
+        self.window = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.total = 0.0
+
+    def add(self,elapsed,ok=True,cached=False):
+        self.window.append(elapsed)
+        self.requests += 1
+        self.total += elapsed
+        if not ok:
+            self.errors += 1
+        if cached:
+            self.cache_hits += 1
+
+    def to_dict(self):
+        data = {"requests":self.requests,"errors":self.errors,"cache_hits":self.cache_hits,
+                "mean_ms":self.total/self.requests*1000 if self.requests else 0.0}
+        values = sorted(self.window)
+        for name,fraction in [("p50",0.5),("p90",0.9),("p99",0.99),("max",1.0)]:
+            data["{0}_ms".format(name)] = values[min(int(fraction*len(values)),len(values)-1)]*1000 if values else 0.0
+        return data
+
+
+class footprint_service():
+
+
+    def __init__(self,max_workers=0,outdir=None,drc=True,cache_size=1024):
+        """ A class that answers footprint requests and keeps its caches and workers between requests
+            @param max_workers: number of worker processes, 0 to generate in this process which has the lowest latency for single requests
+            @param outdir: default output directory for requests that ask for files, None to answer with text
+            @param drc: default for running the design rule checks
+            @param cache_size: number of generated texts that are kept, keyed by the hash of the parameters
+        """
+        self.outdir = outdir
+        self.drc = drc
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.metrics = latency_stats()
+        self.lock = threading.Lock()
+        self.max_workers = max_workers
+        self.executor = None
+        if max_workers:
+            self.executor = ProcessPoolExecutor(max_workers=max_workers)
+            for future in [self.executor.submit(_warm_up) for idx in range(max_workers)]:
+                future.result()
+        else:
+            _warm_up()
+        self.stopped = threading.Event()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def _run(self,func,*args):
+        if self.executor is None:
+            return func(*args)
+        return self.executor.submit(func,*args).result()
+
+    def handle(self,request):
+        """ answer a request dict with a response dict, never raises """
+        t0 = perf_counter()
+        response = {"id":request.get("id") if isinstance(request,dict) else None}
+        op = request.get("op","make") if isinstance(request,dict) else None
+        cached = False
+        try:
+            if op is None:
+                raise ValueError("A request must be a json object")
+            if op == "make":
+                cached = self._make(request,response)
+            elif op == "stats":
+                with self.lock:
+                    response["stats"] = self.metrics.to_dict()
+                    response["stats"]["cache_entries"] = len(self.cache)
+            elif op == "ping":
+                pass
+            elif op == "shutdown":
+                self.stopped.set()
+            else:
+                raise ValueError("Unknown op {0}".format(op))
+            response["ok"] = True
+        except Exception as e:#a bad request must not stop the service
+            response["ok"] = False
+            response["error"] = "{0}: {1}".format(type(e).__name__,e)
+        elapsed = perf_counter()-t0
+        response["elapsed_ms"] = elapsed*1000
+        if op not in ["stats","ping","shutdown"]:#only footprint requests count for the latency
+            with self.lock:
+                self.metrics.add(elapsed,ok=response["ok"],cached=cached)
+        return response
+
+    def _make(self,request,response):
+        kwargs = row_to_kwargs(request["params"])
+        drc = request.get("drc",self.drc)
+        outdir = request.get("outdir",self.outdir)
+        response["modulename"] = kwargs["modulename"]
+        if outdir is not None:
+            #files go through the batch job, it leaves files with unchanged content untouched
+            os.makedirs(outdir,exist_ok=True)
+            result = self._run(make_footprint_job,0,kwargs,outdir,True,False,drc)
+            if not result.ok():
+                raise RuntimeError(result.error)
+            response.update(filepath=result.filepath,digest=result.digest,skipped=result.skipped,violations=result.violations)
+            return False
+        key = (get_parameter_key(kwargs),drc)
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.cache.move_to_end(key)
+        cached = entry is not None
+        if not cached:
+            entry = self._run(make_footprint_text,kwargs,drc)
+            with self.lock:
+                self.cache[key] = entry
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        text,violations = entry
+        response.update(text=text,digest=get_text_digest(text),violations=violations,cached=cached)
+        return cached
+
+
+def handle_line(service,line):
+    """ answer one line of the protocol with one line, without line ending """
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return json.dumps({"id":None,"ok":False,"error":"ValueError: {0}".format(e)})
+    return json.dumps(service.handle(request))
+
+
+def is_shutdown_request(line):
+    """ return True if a line of the protocol is a shutdown request """
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return False
+    return isinstance(request,dict) and request.get("op") == "shutdown"
+
+
+def serve_stdio(service,infile=None,outfile=None):
+    """ answer requests from stdin on stdout until eof or a shutdown request
+        with worker processes requests are answered as they finish, match them by id,
+        a shutdown request is answered after all requests before it
+    """
+    infile = infile or sys.stdin
+    outfile = outfile or sys.stdout
+    writelock = threading.Lock()
+
+    def answer(line):
+        response = handle_line(service,line)
+        with writelock:
+            outfile.write(response)
+            outfile.write("\n")
+            outfile.flush()
+
+    threads = ThreadPoolExecutor(max_workers=service.max_workers*2) if service.executor is not None else None
+    try:
+        for line in infile:
+            if not line.strip():
+                continue
+            if threads is not None and is_shutdown_request(line):
+                #answer it in this thread, so the loop stops without waiting for another line
+                threads.shutdown()
+                threads = None
+            if threads is None:
+                answer(line)
+            else:
+                threads.submit(answer,line)
+            if service.stopped.is_set():
+                break
+    finally:
+        if threads is not None:
+            threads.shutdown()
+
+
+class _request_handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(handle_line(self.server.service,line.decode("utf-8")).encode("utf-8")+b"\n")
+            self.wfile.flush()
+            if self.server.service.stopped.is_set():
+                threading.Thread(target=self.server.shutdown).start()
+                break
+
+
+class _unix_server(socketserver.ThreadingMixIn,socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_unix(service,path):
+    """ answer requests on a unix socket, one thread per connection, until a shutdown request """
+    if os.path.exists(path):
+        os.unlink(path)#a stale socket of a previous run
+    server = _unix_server(path,_request_handler)
+    server.service = service
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+def call(path,request):
+    """ send a single request to a service on a unix socket and return the response, for scripts and tools """
+    with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        with sock.makefile("rwb") as f:
+            f.write(json.dumps(request).encode("utf-8")+b"\n")
+            f.flush()
+            return json.loads(f.readline())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resident json lines service for footprint generation, on stdin/stdout or a unix socket")
+    parser.add_argument("--socket",default=None,help="listen on this unix socket instead of stdin/stdout")
+    parser.add_argument("-j","--jobs",type=int,default=0,help="number of worker processes, 0 to generate in the service process")
+    parser.add_argument("-o","--outdir",default=None,help="write files to this directory instead of answering with the text")
+    parser.add_argument("--no-drc",action="store_true",help="do not run the design rule checks")
+    parser.add_argument("--cache-size",type=int,default=1024,help="number of generated footprints kept in memory")
+    args = parser.parse_args(argv)
+
+    service = footprint_service(max_workers=args.jobs,outdir=args.outdir,drc=not args.no_drc,cache_size=args.cache_size)
+    try:
+        if args.socket:
+            serve_unix(service,args.socket)
+        else:
+            serve_stdio(service)
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
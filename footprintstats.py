@@ -0,0 +1,211 @@
+#file: footprintstats.py
+#purpose: opt-in per stage timing and counters for footprint generation
+#author: Patrick Menschel (C)2018
+
+#the instrumentation is disabled by default, then every hook is a single "is None" check
+#enable() installs a footprint_stats object that collects wall time, calls and bytes per stage
+#and free counters like the number of pads, vias and paste apertures
+
+import marshal
+from time import perf_counter
+
+_active = None
+
+
+class footprint_stats():
+
+
+    def __init__(self):
+        """ A class to collect timing and counters of footprint generation stages
+            stages maps a stage name to [calls, seconds, bytes]
+            counters maps a counter name to a number
+        """
+        self.stages = {}
+        self.counters = {}
+
+    def add(self,name,elapsed,nbytes=0,calls=1):
+        """ add a measurement to a stage """
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = [0,0.0,0]
+        stage[0] += calls
+        stage[1] += elapsed
+        stage[2] += nbytes
+
+    def count(self,name,value=1):
+        """ add to a counter """
+        self.counters[name] = self.counters.get(name,0)+value
+
+    def merge(self,other):
+        """ add the stages and counters of another footprint_stats or its to_dict() """
+        if isinstance(other,dict):
+            stages,counters = other["stages"],other["counters"]
+        else:
+            stages,counters = other.stages,other.counters
+        for name,(calls,elapsed,nbytes) in stages.items():
+            self.add(name,elapsed,nbytes=nbytes,calls=calls)
+        for name,value in counters.items():
+            self.count(name,value)
+
+    def to_dict(self):
+        return {"stages":dict((name,list(stage)) for name,stage in self.stages.items()),
+                "counters":dict(self.counters)}
+
+    def to_json(self):
+        import json#only needed for exporting, keep the import of makefootprint light
+        data = {"stages":dict((name,{"calls":calls,"time":elapsed,"bytes":nbytes}) for name,(calls,elapsed,nbytes) in self.stages.items()),
+                "counters":self.counters}
+        return json.dumps(data,indent=1,sort_keys=True)
+
+    def format_summary(self):
+        """ return a table like the one of pstats, sorted by time """
+        lines = ["{0:>9} {1:>9} {2:>9} {3:>12}  {4}".format("ncalls","tottime","percall","bytes","stage")]
+        for name,(calls,elapsed,nbytes) in sorted(self.stages.items(),key=lambda item: -item[1][1]):
+            lines.append("{0:>9} {1:>9.4f} {2:>9.6f} {3:>12}  {4}".format(calls,elapsed,elapsed/calls if calls else 0,nbytes,name))
+        for name,value in sorted(self.counters.items()):
+            lines.append("{0:>9} {1}".format(value,name))
+        return "\n".join(lines)
+
+    def dump_stats(self,filepath):
+        """ write the stages in the marshal format of cProfile, so pstats.Stats(filepath) and profile viewers can read them
+            each stage is written as a function named after the stage in a pseudo file "footprint"
+        """
+        data = {}
+        for name,(calls,elapsed,nbytes) in self.stages.items():
+            data[("footprint",0,name)] = (calls,calls,elapsed,elapsed,{})
+        with open(filepath,"wb") as f:
+            marshal.dump(data,f)
+
+
+class _null_stage():
+    #shared context manager that does nothing, used while the instrumentation is disabled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        return False
+
+_NULL_STAGE = _null_stage()
+
+
+class _timed_stage():
+
+    def __init__(self,stats,name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = perf_counter()
+        return self
+
+    def __exit__(self,*args):
+        self.stats.add(self.name,perf_counter()-self.t0)
+        return False
+
+
+class _null_lap_timer():
+
+    def lap(self,name):
+        pass
+
+_NULL_LAP_TIMER = _null_lap_timer()
+
+
+class _lap_timer():
+
+    def __init__(self,stats):
+        self.stats = stats
+        self.t0 = perf_counter()
+
+    def lap(self,name):
+        """ count the time since the last lap as a stage """
+        t = perf_counter()
+        self.stats.add(name,t-self.t0)
+        self.t0 = t
+
+
+def enable(stats=None):
+    """ enable the instrumentation
+        @param stats: footprint_stats to collect into, a new one if None
+        @return: the active footprint_stats
+    """
+    global _active
+    _active = stats if stats is not None else footprint_stats()
+    return _active
+
+
+def disable():
+    """ disable the instrumentation
+        @return: the footprint_stats that was active or None
+    """
+    global _active
+    stats = _active
+    _active = None
+    return stats
+
+
+def get_active():
+    return _active
+
+
+def stage(name):
+    """ return a context manager that times a block as a stage """
+    if _active is None:
+        return _NULL_STAGE
+    return _timed_stage(_active,name)
+
+
+def lap_timer():
+    """ return a timer whose lap(name) method counts the time since the previous lap as a stage,
+        handy for consecutive blocks of a long function
+    """
+    if _active is None:
+        return _NULL_LAP_TIMER
+    return _lap_timer(_active)
+
+
+def count(name,value=1):
+    """ add to a counter if the instrumentation is enabled """
+    if _active is not None:
+        _active.count(name,value)
+
+
+def run_stage(name,func,*args,**kwargs):
+    """ call a function as a stage, the bytes of the returned lines are counted """
+    if _active is None:
+        return func(*args,**kwargs)
+    stats = _active
+    t0 = perf_counter()
+    ret = func(*args,**kwargs)
+    elapsed = perf_counter()-t0
+    if isinstance(ret,str):
+        nbytes = len(ret)
+    else:
+        nbytes = sum(len(item) for item in ret if isinstance(item,str))
+    stats.add(name,elapsed,nbytes=nbytes)
+    return ret
+
+
+def iter_stage(name,iterable):
+    """ iterate lines as a stage, only the time spent producing the lines is counted """
+    if _active is None:
+        return iterable
+    return _iter_timed(_active,name,iterable)
+
+
+def _iter_timed(stats,name,iterable):
+    elapsed = 0.0
+    nbytes = 0
+    it = iter(iterable)
+    while True:
+        t0 = perf_counter()
+        try:
+            line = next(it)
+        except StopIteration:
+            elapsed += perf_counter()-t0
+            break
+        elapsed += perf_counter()-t0
+        nbytes += len(line)
+        yield line
+    stats.add(name,elapsed,nbytes=nbytes)
@@ -0,0 +1,246 @@
+#file: footprintthermal.py
+#purpose: search thermal via grids and paste aperture tilings for an exposed pad
+#author: Patrick Menschel (C)2018
+
+#the exposed pad is tiled with an nx*ny grid of equal paste apertures separated by webs,
+#apertures that come closer to a via drill than the keepout are left out.
+#via grid and tiling are both symmetric products of two axes, so the gap between a tile and the nearest via
+#is hypot(nearest gap along x,nearest gap along y). The gaps are tabulated once per axis and tiling
+#and a whole tiling is then counted with a bisect per tile column instead of checking every tile against every via.
+
+from array import array
+from bisect import bisect_left
+
+from makefootprint import mm_to_nm, nm_to_mm, get_span_positions_nm
+
+GRID_NM = 10000#output has 2 decimals in mm
+COVERAGE_STEP = 0.05#coverages closer than this to the target are equally good, the aperture shape decides
+_LAYOUT_CACHE = {}
+_LAYOUT_CACHE_SIZE = 4096
+
+
+class thermal_layout():
+
+
+    def __init__(self,ep_size,drill,via_diameter,via_pitch,via_cols,via_rows,paste_cols,paste_rows,web,keepout,coverage,aperture_count):
+        """ A class to represent the result of optimize_thermal_layout, all sizes in mm
+            @param ep_size: (x,y) size of the exposed pad
+            @param via_pitch: pitch of the via grid
+            @param via_cols: via columns, 0 if there are no vias
+            @param paste_cols: paste tile columns before the apertures at the vias are left out
+            @param web: gap between paste apertures
+            @param keepout: distance between a drill and the paste
+            @param coverage: paste area / exposed pad area
+            @param aperture_count: number of paste apertures that are left
+        """
+        self.ep_size = ep_size
+        self.drill = drill
+        self.via_diameter = via_diameter
+        self.via_pitch = via_pitch
+        self.via_cols = via_cols
+        self.via_rows = via_rows
+        self.paste_cols = paste_cols
+        self.paste_rows = paste_rows
+        self.web = web
+        self.keepout = keepout
+        self.coverage = coverage
+        self.aperture_count = aperture_count
+
+    def get_via_count(self):
+        return self.via_cols*self.via_rows
+
+    def get_via_layout(self):
+        """ return the vias as layout (padnums,posx,posy) for footprint_pad_array.add_layout, row by row """
+        pitch_nm = mm_to_nm(self.via_pitch)
+        xpos = get_span_positions_nm(self.via_cols,pitch_nm)
+        ypos = get_span_positions_nm(self.via_rows,pitch_nm)
+        posx = xpos*self.via_rows
+        posy = array("q",[posy for posy in ypos for col in range(self.via_cols)])
+        return [None]*len(posx),posx,posy
+
+    def get_aperture_size(self):
+        """ return the (x,y) size of one paste aperture in mm """
+        return tuple(nm_to_mm(size) for size in self._get_tile_sizes_nm())
+
+    def _get_tile_sizes_nm(self):
+        web_nm = mm_to_nm(self.web)
+        return tuple(get_tile_size_nm(mm_to_nm(length),count,web_nm) for length,count in zip(self.ep_size,(self.paste_cols,self.paste_rows)))
+
+    def get_paste_layout(self):
+        """ return the paste apertures as layout (padnums,posx,posy), all apertures have get_aperture_size() """
+        web_nm = mm_to_nm(self.web)
+        tilex,tiley = self._get_tile_sizes_nm()
+        pitch_nm = mm_to_nm(self.via_pitch)
+        vias_x = get_span_positions_nm(self.via_cols,pitch_nm)
+        vias_y = get_span_positions_nm(self.via_rows,pitch_nm)
+        tiles_x = get_span_positions_nm(self.paste_cols,tilex+web_nm)
+        tiles_y = get_span_positions_nm(self.paste_rows,tiley+web_nm)
+        gaps_x = get_tile_gaps_nm(tiles_x,tilex,vias_x)
+        gaps_y = get_tile_gaps_nm(tiles_y,tiley,vias_y)
+        keepout2 = get_keepout_nm(self.drill,self.keepout)**2
+        posx = array("q")
+        posy = array("q")
+        for row,y in enumerate(tiles_y):
+            for col,x in enumerate(tiles_x):
+                if gaps_x[col]+gaps_y[row] >= keepout2:
+                    posx.append(x)
+                    posy.append(y)
+        return [None]*len(posx),posx,posy
+
+    def __repr__(self):
+        return "{0}x{1} vias pitch {2}mm, {3}x{4} paste tiles {5} apertures, coverage {6:.1%}".format(self.via_cols,self.via_rows,self.via_pitch,
+                                                                                               self.paste_cols,self.paste_rows,self.aperture_count,self.coverage)
+
+
+def get_keepout_nm(drill,keepout):
+    """ return the doubled distance between a via center and the paste in nm, doubled like the gaps of get_tile_gaps_nm """
+    return mm_to_nm(drill)+2*mm_to_nm(keepout)
+
+
+def get_tile_size_nm(length_nm,count,web_nm):
+    """ return the size of one of count tiles with webs in between that fill length_nm,
+        tile plus web is snapped to twice the output grid so tile edges and centers land on the grid
+    """
+    step = 2*GRID_NM
+    return ((length_nm-(count-1)*web_nm)//count+web_nm)//step*step-web_nm
+
+
+def get_tile_gaps_nm(tiles,tile_nm,vias):
+    """ return for each tile the squared doubled gap to the nearest via along one axis, doubled to stay in integers
+        @param tiles: tile center positions in nm
+        @param tile_nm: tile size in nm
+        @param vias: via positions in nm, no vias gives an infinite gap
+    """
+    if not len(vias):
+        return [float("inf")]*len(tiles)
+    gaps = []
+    for tile in tiles:
+        gap = max(0,2*min(abs(tile-via) for via in vias)-tile_nm)
+        gaps.append(gap*gap)
+    return gaps
+
+
+def _get_axis_table(length_nm,web_nm,min_aperture_nm,max_aperture_nm,max_tiles,vias):
+    """ return the possible tilings of one axis as list of (count,tile size nm,sorted squared gaps) """
+    table = []
+    for count in range(1,max_tiles+1):
+        tile_nm = get_tile_size_nm(length_nm,count,web_nm)
+        if tile_nm < min_aperture_nm:
+            break
+        if tile_nm > max_aperture_nm:
+            continue#more tiles get smaller
+        tiles = get_span_positions_nm(count,tile_nm+web_nm)
+        table.append((count,tile_nm,sorted(get_tile_gaps_nm(tiles,tile_nm,vias))))
+    return table
+
+
+def is_balanced_grid(cols,rows,length_x,length_y):
+    """ return True if a via grid follows the shape of the pad, cols and rows may differ by one from the proportions of the pad,
+        e.g. 3x3 or 3x4 on a square pad but not 2x6
+    """
+    return abs(cols-round(rows*length_x/length_y)) <= 1 or abs(rows-round(cols*length_y/length_x)) <= 1
+
+
+def _get_via_grids(length_x_nm,length_y_nm,via_diameter_nm,min_pitch_nm,pitch_step_nm,pitch_steps,max_vias):
+    """ return the via grids (vias,cols,rows,pitch nm) that fit on the pad and follow its shape, most vias first """
+    grids = []
+    if max_vias != 0:
+        for step in range(pitch_steps):
+            pitch_nm = min_pitch_nm+step*pitch_step_nm
+            max_cols = (length_x_nm-via_diameter_nm)//pitch_nm+1
+            max_rows = (length_y_nm-via_diameter_nm)//pitch_nm+1
+            for cols in range(1,max_cols+1):
+                for rows in range(1,max_rows+1):
+                    if (max_vias is None or cols*rows <= max_vias) and is_balanced_grid(cols,rows,length_x_nm,length_y_nm):
+                        grids.append((cols*rows,cols,rows,pitch_nm))
+    grids.sort(key=lambda grid: (-grid[0],grid[3],grid[1]))
+    if not grids:
+        grids.append((0,0,0,min_pitch_nm))
+    return grids
+
+
+def optimize_thermal_layout(ep_size,drill,min_pitch,via_diameter=None,max_vias=None,coverage=(0.5,0.8),keepout=0.1,web=0.2,
+                            min_aperture=0.3,max_aperture=2.0,max_tiles=8,pitch_step=0.05,pitch_steps=5):
+    """ find the thermal via grid and paste aperture tiling for an exposed pad
+        only via grids that follow the shape of the pad are tried, see is_balanced_grid,
+        the layout with the most vias whose paste coverage is within the target range wins,
+        ties go to the coverage closest to the middle of the range in steps of COVERAGE_STEP,
+        then to the most square apertures and then to fewer apertures
+        @param ep_size: (x,y) size of the exposed pad in mm
+        @param drill: via drill in mm, a paste aperture keeps drill/2+keepout away from each via center
+        @param min_pitch: smallest via pitch in mm, up to pitch_steps pitches of pitch_step are tried above it
+        @param via_diameter: via copper diameter in mm, drill+0.3 if None, the vias must fit on the exposed pad
+        @param max_vias: maximum number of vias, None for no limit, 0 for a paste only layout
+        @param coverage: (min,max) paste area / exposed pad area
+        @param keepout: distance between a drill and the paste in mm
+        @param web: gap between paste apertures in mm
+        @param min_aperture: smallest paste aperture size in mm
+        @param max_aperture: largest paste aperture size in mm, large pads are split into several apertures
+        @param max_tiles: maximum paste tiles per axis
+        @return: a thermal_layout
+        @raise ValueError: if no layout meets the coverage range
+    """
+    if via_diameter is None:
+        via_diameter = drill+0.3
+    key = (tuple(ep_size),drill,min_pitch,via_diameter,max_vias,tuple(coverage),keepout,web,min_aperture,max_aperture,max_tiles,pitch_step,pitch_steps)
+    layout = _LAYOUT_CACHE.get(key)
+    if layout is None:
+        layout = _optimize_thermal_layout(*key)
+        if len(_LAYOUT_CACHE) >= _LAYOUT_CACHE_SIZE:
+            _LAYOUT_CACHE.clear()
+        _LAYOUT_CACHE[key] = layout
+    return layout
+
+
+def _optimize_thermal_layout(ep_size,drill,min_pitch,via_diameter,max_vias,coverage,keepout,web,min_aperture,max_aperture,max_tiles,pitch_step,pitch_steps):
+    length_x_nm,length_y_nm = mm_to_nm(ep_size[0]),mm_to_nm(ep_size[1])
+    web_nm = mm_to_nm(web)
+    min_aperture_nm = mm_to_nm(min_aperture)
+    max_aperture_nm = mm_to_nm(max_aperture)
+    keepout2 = get_keepout_nm(drill,keepout)**2
+    ep_area = length_x_nm*length_y_nm
+    lo,hi = coverage
+    target = (lo+hi)/2
+    axis_tables = {}
+    best = None
+    best_vias = None
+    closest = None
+    for vias,cols,rows,pitch_nm in _get_via_grids(length_x_nm,length_y_nm,mm_to_nm(via_diameter),mm_to_nm(min_pitch),mm_to_nm(pitch_step),pitch_steps,max_vias):
+        if best is not None and vias < best_vias:
+            break#grids come with the most vias first, fewer vias can not win anymore
+        tables = []
+        for length_nm,count in ((length_x_nm,cols),(length_y_nm,rows)):
+            axis_key = (length_nm,count,pitch_nm)
+            if axis_key not in axis_tables:
+                axis_tables[axis_key] = _get_axis_table(length_nm,web_nm,min_aperture_nm,max_aperture_nm,max_tiles,get_span_positions_nm(count,pitch_nm))
+            tables.append(axis_tables[axis_key])
+        table_x,table_y = tables
+        for paste_cols,tilex,gaps_x in table_x:
+            for paste_rows,tiley,gaps_y in table_y:
+                #count the tiles that keep out of all vias, gaps_y is sorted so each column is a bisect
+                apertures = 0
+                for gap_x in gaps_x:
+                    if gap_x >= keepout2:
+                        apertures += paste_rows
+                    else:
+                        apertures += paste_rows-bisect_left(gaps_y,keepout2-gap_x)
+                if not apertures:
+                    continue
+                cov = apertures*tilex*tiley/ep_area
+                score = (-round(abs(cov-target)/COVERAGE_STEP),-max(tilex,tiley)/min(tilex,tiley),-apertures)
+                candidate = (score,cols,rows,pitch_nm,paste_cols,paste_rows,cov,apertures)
+                if lo <= cov <= hi:
+                    if best is None or score > best[0]:
+                        best = candidate
+                        best_vias = vias
+                elif closest is None or abs(cov-target) < abs(closest[6]-target):
+                    closest = candidate
+    if best is None:
+        if closest is None:
+            raise ValueError("No paste aperture of {0} to {1}mm fits on a {2}x{3}mm pad".format(min_aperture,max_aperture,*ep_size))
+        raise ValueError("No layout meets a paste coverage of {0:.0%} to {1:.0%}, closest is {2:.1%}".format(lo,hi,closest[6]))
+    score,cols,rows,pitch_nm,paste_cols,paste_rows,cov,apertures = best
+    layout = thermal_layout(ep_size=tuple(ep_size),drill=drill,via_diameter=via_diameter,via_pitch=nm_to_mm(pitch_nm),
+                            via_cols=cols,via_rows=rows,paste_cols=paste_cols,paste_rows=paste_rows,web=web,keepout=keepout,
+                            coverage=cov,aperture_count=apertures)
+    return layout
@@ -0,0 +1,218 @@
+#file: footprintwriter.py
+#purpose: atomic output of footprint files into a .pretty directory or a zip/tar archive with a background writer thread
+#author: Patrick Menschel (C)2018
+
+import io
+import os
+import queue
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+ARCHIVE_MODES = [(".zip",None),(".tar.gz","w:gz"),(".tgz","w:gz"),(".tar.bz2","w:bz2"),(".tar.xz","w:xz"),(".tar","w")]
+
+
+@contextmanager
+def atomic_write(filepath):
+    """ open a text file for writing, the content goes to a temporary file in the same directory that replaces filepath on success,
+        so readers never see a half written file and an interrupted run leaves the old file
+    """
+    dirpath = os.path.dirname(filepath) or "."
+    fd,tmppath = tempfile.mkstemp(prefix=".{0}.".format(os.path.basename(filepath)),suffix=".tmp",dir=dirpath)
+    try:
+        with os.fdopen(fd,"w") as f:
+            yield f
+        os.chmod(tmppath,0o644)#mkstemp creates 0600, use what open() would
+        os.replace(tmppath,filepath)
+    except BaseException:
+        os.unlink(tmppath)
+        raise
+
+
+def write_file_atomic(filepath,text):
+    """ write a text file with atomic_write """
+    with atomic_write(filepath) as f:
+        f.write(text)
+
+
+def get_archive_mode(path):
+    """ return (extension,tarfile mode) if path names an archive, None for a directory, tarfile mode is None for zip """
+    lowerpath = path.lower()
+    for extension,mode in ARCHIVE_MODES:
+        if lowerpath.endswith(extension):
+            return extension,mode
+    return None
+
+
+def is_archive(path):
+    return get_archive_mode(path) is not None
+
+
+def get_library_name(path):
+    """ return the .pretty directory name that is used inside an archive, e.g. "Package_DFN_QFN.pretty" for "Package_DFN_QFN.pretty.zip" """
+    name = os.path.basename(path)
+    archive_mode = get_archive_mode(path)
+    if archive_mode is not None:
+        name = name[:-len(archive_mode[0])]
+    if not name.endswith(".pretty"):
+        name = "{0}.pretty".format(name)
+    return name
+
+
+class pretty_writer():
+
+
+    def __init__(self,outdir):
+        """ A class to write footprint files into a .pretty directory, each file is replaced atomically
+            @param outdir: the directory, created if needed
+        """
+        self.outdir = outdir
+        os.makedirs(outdir,exist_ok=True)
+
+    def get_member_name(self,filename):
+        """ return the path of a file, named like archive_writer.get_member_name """
+        return os.path.join(self.outdir,filename)
+
+    def write(self,filename,text):
+        """ write a file, returns its path """
+        filepath = self.get_member_name(filename)
+        write_file_atomic(filepath,text)
+        return filepath
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class archive_writer():
+
+
+    def __init__(self,path):
+        """ A class to stream footprint files into a zip or tar archive
+            the archive is written to a temporary file that replaces path on close(), abort() drops it
+            entries are stored as <library>.pretty/<filename> with the time the archive was opened
+            @param path: archive path, the type is taken from the extension, see ARCHIVE_MODES
+        """
+        archive_mode = get_archive_mode(path)
+        if archive_mode is None:
+            raise ValueError("Not an archive {0}".format(path))
+        self.path = path
+        self.libname = get_library_name(path)
+        self.mtime = time.time()
+        dirpath = os.path.dirname(path) or "."
+        os.makedirs(dirpath,exist_ok=True)
+        fd,self.tmppath = tempfile.mkstemp(prefix=".{0}.".format(os.path.basename(path)),suffix=".tmp",dir=dirpath)
+        os.close(fd)
+        mode = archive_mode[1]
+        import tarfile, zipfile#only needed for archives, keep the import of batchfootprint light
+        if mode is None:
+            self.zipfile = zipfile.ZipFile(self.tmppath,"w",compression=zipfile.ZIP_DEFLATED)
+            self.tarfile = None
+        else:
+            self.zipfile = None
+            self.tarfile = tarfile.open(self.tmppath,mode)
+
+    def get_member_name(self,filename):
+        return "{0}/{1}".format(self.libname,filename)
+
+    def write(self,filename,text):
+        """ add a file, returns its name inside the archive """
+        membername = self.get_member_name(filename)
+        data = text.encode("utf-8")
+        import tarfile, zipfile
+        if self.zipfile is not None:
+            info = zipfile.ZipInfo(membername,date_time=time.localtime(self.mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self.zipfile.writestr(info,data)
+        else:
+            info = tarfile.TarInfo(membername)
+            info.size = len(data)
+            info.mtime = self.mtime
+            info.mode = 0o644
+            self.tarfile.addfile(info,io.BytesIO(data))
+        return membername
+
+    def _close_archive(self):
+        if self.zipfile is not None:
+            self.zipfile.close()
+        else:
+            self.tarfile.close()
+
+    def close(self):
+        self._close_archive()
+        os.chmod(self.tmppath,0o644)
+        os.replace(self.tmppath,self.path)
+
+    def abort(self):
+        try:
+            self._close_archive()
+        finally:
+            os.unlink(self.tmppath)
+
+
+def open_output(path):
+    """ return a pretty_writer or an archive_writer for an output path, archives are recognized by their extension """
+    if is_archive(path):
+        return archive_writer(path)
+    return pretty_writer(path)
+
+
+class background_writer():
+
+
+    def __init__(self,sink,maxsize=64):
+        """ A class that hands writes to a thread, so formatting the next footprint overlaps with writing the last one
+            the queue is bounded, a producer that is faster than the disk waits instead of holding all texts in memory
+            a file that fails is recorded in errors and the next files are still written, like a failed row of a batch
+            @param sink: a pretty_writer or archive_writer
+            @param maxsize: number of queued files
+        """
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.errors = {}#filename -> exception of a failed write
+        self.written = []
+        self.thread = threading.Thread(target=self._run,name="footprintwriter",daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            filename,text = item
+            try:
+                self.written.append(self.sink.write(filename,text))
+            except Exception as e:#one bad file must not abort the others
+                self.errors[filename] = e
+
+    def write(self,filename,text):
+        """ queue a file, see errors for the outcome """
+        self.queue.put((filename,text))
+
+    def close(self):
+        """ wait for all queued files and close the sink, files that failed are left out and listed in errors
+            @return: list of the written paths or archive member names
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self.sink.close()
+        return self.written
+
+    def abort(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.sink.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
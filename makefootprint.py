@@ -2,21 +2,105 @@
 #purpose:helper function script for kicad footprint generation 
 #author: Patrick Menschel (C)2018
 
+__version__ = "0.2.0"#bump this whenever the generated output changes, it invalidates footprintcache
+
 #import re
 #import math
+import sys
+from array import array
+from collections import namedtuple
+from itertools import islice
+
+import footprintstats
+
+#fixed point coordinates
+#geometry is held as integer nanometres like kicad does internally, snapping and rounding are done on integers
+#so identical dimensions always give identical output, regardless of how a float was computed
+NM_PER_MM = 1000000
+_FORMAT_CACHE = {}#float mm -> string
+_NM_FORMAT_CACHE = {}#integer nm -> string
+_FORMAT_CACHE_SIZE = 65536
+
+def mm_to_nm(value):
+    """ convert mm to integer nanometres """
+    return int(round(value*NM_PER_MM))
+
+def nm_to_mm(value):
+    """ convert integer nanometres to mm """
+    return value/NM_PER_MM
+
+def snap_nm_outward(value,grid_nm):
+    """ snap a nanometre value to a grid, away from zero """
+    if value < 0:
+        return -((grid_nm-1-value)//grid_nm)*grid_nm
+    return ((value+grid_nm-1)//grid_nm)*grid_nm
+
+def format_nm(value,decimals=2):
+    """ format integer nanometres as mm with a fixed number of decimals, halves are rounded to even like str.format does """
+    scale = 10**(6-decimals)
+    if value < 0:
+        sign = "-"
+        value = -value
+    else:
+        sign = ""
+    quotient,remainder = divmod(value,scale)
+    if remainder*2 > scale or (remainder*2 == scale and quotient & 1):
+        quotient += 1
+    units,frac = divmod(quotient,10**decimals)
+    if not decimals:
+        return "{0}{1}".format(sign,units)
+    if not units and not frac:
+        sign = ""
+    return "{0}{1}.{2:0{3}d}".format(sign,units,frac,decimals)
+
+def format_nm_cached(value):
+    """ format_nm with 2 decimals and a cache of the strings """
+    try:
+        return _NM_FORMAT_CACHE[value]
+    except KeyError:
+        pass
+    ret = format_nm(value)
+    if len(_NM_FORMAT_CACHE) >= _FORMAT_CACHE_SIZE:
+        _NM_FORMAT_CACHE.clear()
+    _NM_FORMAT_CACHE[value] = ret
+    return ret
+
+def format_nm_exact(value):
+    """ format integer nanometres as mm with all decimals that are needed and no trailing zeros like kicad writes them, e.g. -1.905 or 1 """
+    sign = "-" if value < 0 else ""
+    units,frac = divmod(abs(value),NM_PER_MM)
+    if not frac:
+        return "{0}{1}".format(sign,units)
+    return "{0}{1}.{2}".format(sign,units,"{0:06d}".format(frac).rstrip("0"))
+
+def format_mm_exact(value):
+    """ format a number read from a file with up to 10 decimals and no trailing zeros like kicad writes it, see format_nm_exact """
+    ret = "{0:.10f}".format(value).rstrip("0").rstrip(".")
+    if ret == "-0":
+        return "0"
+    return ret
+
+def format_mm(value):
+    """ format a dimension in mm with 2 decimals, the fast replacement of "{:.2f}".format(value)
+        the strings are cached, footprints repeat the same few dimensions over and over
+    """
+    try:
+        return _FORMAT_CACHE[value]
+    except KeyError:
+        pass
+    ret = format_nm(mm_to_nm(value))
+    if len(_FORMAT_CACHE) >= _FORMAT_CACHE_SIZE:
+        _FORMAT_CACHE.clear()
+    _FORMAT_CACHE[value] = ret
+    return ret
+
 
-import matplotlib.pyplot as plt
 def plot_points(points,figname):
-    pts = points.copy()
-    pts.append(points[0])
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-    line, = ax.plot([pt[0] for pt in pts],[pt[1] for pt in pts],lw=2,marker='o')
-    for i in range(len(pts)-1):
-        ax.annotate("PT{0} ({1},{2})".format(i,pts[i][0],pts[i][1]),xy=pts[i])
-    ax.set_title(figname)    
-    plt.show()
-    return
+    """ debug helper, draw a polygon into <figname>.svg, see footprintpreview.py
+        @return: the path of the svg file
+    """
+    from footprintpreview import plot_points as _plot_points
+    return _plot_points(points,figname)
 
 def format_pad(padnum,padtype,padshape,posx,posy,sizex,sizey,layers):
     ret = "(pad {0} {1} {2} (at {3} {4}) (size {5} {6}) (layers {7}))".format(padnum, padtype, padshape,posx,posy,sizex,sizey," ".join(layers) )
@@ -30,13 +114,122 @@ def get_posxy_for_span(pinnum,spanx,spany):
     return pts
 
 
+#pad layout engine
+#a layout is a tuple (padnums,posx,posy) with posx and posy as arrays of integer nanometres,
+#whole rows and columns are computed at once and the pads are added with footprint_pad_array.add_layout
+
+BGA_ROW_LETTERS = "ABCDEFGHJKLMNPRTUVWY"#JEDEC row names, I O Q S X Z are not used
+
+
+def get_span_positions_nm(pinnum,pitch_nm):
+    """ return the positions of pinnum pins with a pitch centered around 0 in integer nanometres """
+    start = -(((pinnum-1)*pitch_nm)//2)
+    return array("q",range(start,start+pinnum*pitch_nm,pitch_nm)) if pinnum > 0 else array("q")
+
+
+def get_dual_layout(pinnum,pitch,span):
+    """ return the layout of a dual row package (DFN, SOIC), pin 1 is top left,
+        the left row is numbered downwards and the right row upwards like get_posxy_for_span
+        @param pinnum: number of pins of both rows
+        @param pitch: pin pitch in mm
+        @param span: distance of the row centers in mm
+        @return: layout (padnums,posx,posy), the left row first, both rows sorted by y
+        @raise ValueError: if pinnum is odd
+    """
+    if pinnum % 2:
+        raise ValueError("A dual row layout needs an even number of pins, got {0}".format(pinnum))
+    rowpins = int(pinnum/2)
+    ypos = get_span_positions_nm(rowpins,mm_to_nm(pitch))
+    span_nm = mm_to_nm(span)
+    posx = array("q",[-(span_nm//2)])*rowpins+array("q",[span_nm-(span_nm//2)])*rowpins
+    posy = ypos+ypos
+    padnums = list(range(1,rowpins+1))+list(range(2*rowpins,rowpins,-1))
+    return padnums,posx,posy
+
+
+def get_quad_layout(pinnum_x,pinnum_y,pitch,spanx,spany):
+    """ return the layouts of the four sides of a quad package (QFN, QFP), pin 1 is the top of the left side,
+        numbering runs counterclockwise: left side downwards, bottom side to the right, right side upwards, top side to the left
+        @param pinnum_x: number of pins on the top and on the bottom side
+        @param pinnum_y: number of pins on the left and on the right side
+        @param pitch: pin pitch in mm
+        @param spanx: distance of the left and right pad centers in mm
+        @param spany: distance of the top and bottom pad centers in mm
+        @return: list of (side,layout) with side in "left","bottom","right","top",
+                 pads of the top and bottom side need their size rotated by the caller
+    """
+    pitch_nm = mm_to_nm(pitch)
+    spanx_nm = mm_to_nm(spanx)
+    spany_nm = mm_to_nm(spany)
+    xpos = get_span_positions_nm(pinnum_x,pitch_nm)
+    ypos = get_span_positions_nm(pinnum_y,pitch_nm)
+    left = spanx_nm//2
+    top = spany_nm//2
+    sides = []
+    first = 1
+    sides.append(("left",(list(range(first,first+pinnum_y)),array("q",[-left])*pinnum_y,array("q",ypos))))
+    first += pinnum_y
+    sides.append(("bottom",(list(range(first,first+pinnum_x)),array("q",xpos),array("q",[spany_nm-top])*pinnum_x)))
+    first += pinnum_x
+    sides.append(("right",(list(range(first,first+pinnum_y)),array("q",[spanx_nm-left])*pinnum_y,array("q",reversed(ypos)))))
+    first += pinnum_y
+    sides.append(("top",(list(range(first,first+pinnum_x)),array("q",reversed(xpos)),array("q",[-top])*pinnum_x)))
+    return sides
+
+
+def get_bga_row_name(row):
+    """ return the JEDEC name of a ball row, A..Y then AA..AY, BA.. """
+    letters = len(BGA_ROW_LETTERS)
+    if row < letters:
+        return BGA_ROW_LETTERS[row]
+    return get_bga_row_name(row//letters-1)+BGA_ROW_LETTERS[row%letters]
+
+
+def get_grid_layout(cols,rows,pitchx,pitchy=None,depopulated=None,center_hole=None):
+    """ return the layout of a full or depopulated grid array (BGA, LGA), ball A1 is top left
+        @param cols: number of columns
+        @param rows: number of rows
+        @param pitchx: column pitch in mm
+        @param pitchy: row pitch in mm, same as pitchx if None
+        @param depopulated: optional set of ball names like "A1" that are left out
+        @param center_hole: optional (cols,rows) of an empty block in the center
+        @return: layout (padnums,posx,posy), row by row
+    """
+    if pitchy is None:
+        pitchy = pitchx
+    xpos = get_span_positions_nm(cols,mm_to_nm(pitchx))
+    ypos = get_span_positions_nm(rows,mm_to_nm(pitchy))
+    rownames = [get_bga_row_name(row) for row in range(rows)]
+    colnames = [str(col+1) for col in range(cols)]
+    if not depopulated and not center_hole:
+        padnums = [rowname+colname for rowname in rownames for colname in colnames]
+        posx = xpos*rows
+        posy = array("q",[posy for posy in ypos for col in range(cols)])
+        return padnums,posx,posy
+    keep_cols = [True]*cols
+    keep_rows = [True]*rows
+    hole = set()
+    if center_hole:
+        holecols,holerows = center_hole
+        firstcol = (cols-holecols)//2
+        firstrow = (rows-holerows)//2
+        hole = set((row,col) for row in range(firstrow,firstrow+holerows) for col in range(firstcol,firstcol+holecols))
+    depopulated = set(depopulated or [])
+    cells = [(row,col) for row in range(rows) for col in range(cols)
+             if (row,col) not in hole and rownames[row]+colnames[col] not in depopulated]
+    padnums = [rownames[row]+colnames[col] for row,col in cells]
+    posx = array("q",[xpos[col] for row,col in cells])
+    posy = array("q",[ypos[row] for row,col in cells])
+    return padnums,posx,posy
+
+
 def format_pads(pinnum,spanx,spany,padtype,padshape,sizex,sizey,layers):
-    ret = ""
-    for padnum,(posx,posy) in enumerate(get_posxy_for_span(pinnum,spanx,spany)):
-        ret += "{0}\n".format(format_pad(padnum+1,padtype,padshape,posx,posy,sizex,sizey,layers))
+    ret = "".join("{0}\n".format(format_pad(padnum+1,padtype,padshape,posx,posy,sizex,sizey,layers)) for padnum,(posx,posy) in enumerate(get_posxy_for_span(pinnum,spanx,spany)))
     return ret
 
 def get_outer_dimensions_of_pads(pads):
+    if isinstance(pads,footprint_pad_array):
+        return pads.get_outer_dimensions()
     minxy = [0,0]
     maxxy = [0,0]
     for pad in pads:
@@ -56,6 +249,8 @@ def get_points_from_dimensions(dims):
     return pts
 
 def get_center_dimensions_of_pads(pads):
+    if isinstance(pads,footprint_pad_array):
+        return pads.get_center_dimensions()
     minxy = [0,0]
     maxxy = [0,0]
     for pad in pads:
@@ -64,13 +259,18 @@ def get_center_dimensions_of_pads(pads):
         maxxy = list(max(maxxy[i],padxypos[i]) for i in range(2))
     return minxy,maxxy
 
-def format_courtyard_lines(pads,package_dimensions,package_offset=0.25,linewidth=0.05,grid=0.01):
+def get_courtyard_points(pads,package_dimensions,package_offset=0.25,grid=0.01,outer_dimensions=None,package_points=None):
+    """ return the 4 corner points of the courtyard rectangle around pads and package
+        @param outer_dimensions: precomputed get_outer_dimensions_of_pads(pads), optional
+        @param package_points: precomputed get_package_points(package_dimensions), optional
+    """
     points = []
-    courtyard_lines = []
-    grid_decimals = 2
-    outer_pad_points = get_points_from_dimensions(get_outer_dimensions_of_pads(pads))
+    if outer_dimensions is None:
+        outer_dimensions = get_outer_dimensions_of_pads(pads)
+    outer_pad_points = get_points_from_dimensions(outer_dimensions)
 #     plot_points(outer_pad_points,"outer_pad_points")
-    package_points = get_package_points(package_dimensions)
+    if package_points is None:
+        package_points = get_package_points(package_dimensions)
     
     outerpoints = []
     for i in range(4):
@@ -84,29 +284,37 @@ def format_courtyard_lines(pads,package_dimensions,package_offset=0.25,linewidth
 #                 print("Package wins at Point {0} dim {1}".format(i,j))
         outerpoints.append(thispt)
             
+    #add the offset and snap outwards to the grid in integer nanometres
+    offset_nm = mm_to_nm(package_offset)
+    grid_nm = mm_to_nm(grid)
     for point in outerpoints:
-        x,y = point
-        if x < 0:
-            thisx = round(x-package_offset-(grid/2),grid_decimals)
-        else:
-            thisx = round(x+package_offset+(grid/2),grid_decimals)
-        if y < 0:
-            thisy = round(y-package_offset-(grid/2),grid_decimals)
-        else:
-            thisy = round(y+package_offset+(grid/2),grid_decimals)
-            
-        points.append((thisx,thisy))
+        thispt = []
+        for dim in point:
+            dim_nm = mm_to_nm(dim)
+            if dim_nm < 0:
+                thispt.append(nm_to_mm(snap_nm_outward(dim_nm-offset_nm,grid_nm)))
+            else:
+                thispt.append(nm_to_mm(snap_nm_outward(dim_nm+offset_nm,grid_nm)))
+        points.append(tuple(thispt))
     
 #     plot_points(package_points,"package_points")
 #     
 #     plot_points(points,"courtard after rounding")
 #     
-    for idx in range(len(points)-1):
-        startpoint,endpoint = points[idx:idx+2]
+    return points
+
+
+def format_courtyard_lines(pads,package_dimensions,package_offset=0.25,linewidth=0.05,grid=0.01,courtyard_points=None):
+    """ return the lines for the courtyard rectangle
+        @param courtyard_points: precomputed get_courtyard_points(pads,package_dimensions), optional
+    """
+    courtyard_lines = []
+    if courtyard_points is None:
+        points = get_courtyard_points(pads,package_dimensions,package_offset=package_offset,grid=grid)
+    else:
+        points = courtyard_points
+    for startpoint,endpoint in get_polygon_segments(points):
         courtyard_lines.append(format_fpline(startpoint,endpoint,"F.CrtYd",linewidth))
-    startpoint = points[-1] 
-    endpoint = points[0]
-    courtyard_lines.append(format_fpline(startpoint,endpoint,"F.CrtYd",linewidth))
     return courtyard_lines
 
 
@@ -120,15 +328,27 @@ def get_package_points(package_dimensions):
     rearrangedpoints[2] = points[3]
     return rearrangedpoints
 
-def format_fab_lines(package_dimensions,linewidth=0.1):
-    """ return the lines (as in newline ) for the fabrication layer (geometrical) lines
+def get_polygon_segments(points):
+    """ return the (startpoint,endpoint) segments of a closed polygon """
+    segments = []
+    for idx in range(len(points)-1):
+        startpoint,endpoint = points[idx:idx+2]
+        segments.append((startpoint,endpoint))
+    segments.append((points[-1],points[0]))
+    return segments
+
+
+def get_fab_points(package_dimensions,package_points=None):
+    """ return the points of the fabrication layer outline, the package rectangle with a cutted edge as pin 1 indicator
         @param package_dimensions: size of the component (x,y)
-        @return: lines for the fabrication layer rectangle with cutted edge as pin 1 indicator
+        @param package_points: precomputed get_package_points(package_dimensions), optional
     """
-    fab_lines = []
     # 4 points package rectangle
     
-    points = get_package_points(package_dimensions) 
+    if package_points is None:
+        points = get_package_points(package_dimensions) 
+    else:
+        points = list(package_points)#copy, the points are altered below
                     
     bevel = max(0.1,min(package_dimensions)*0.25)
     
@@ -137,21 +357,36 @@ def format_fab_lines(package_dimensions,linewidth=0.1):
     points[0] = (points[0][0],points[0][1]+bevel)
     
 #     plot_points(points,"fab lines")
-    for idx in range(len(points)-1):
-        startpoint,endpoint = points[idx:idx+2]
-        fab_lines.append(format_fpline(startpoint,endpoint,"F.Fab",linewidth))
-    startpoint = points[-1] 
-    endpoint = points[0]
-    fab_lines.append(format_fpline(startpoint,endpoint,"F.Fab",linewidth))
-    return fab_lines
+    return points
 
 
-def format_silks_lines(pads,package_dimensions,distance_to_fablines=0.12,distance_to_pads=0.2,linewidth=0.12):
-    silks_lines = []
-    minxy,maxxy = get_outer_dimensions_of_pads(pads)
-    cminxy,cmaxxy = get_center_dimensions_of_pads(pads)
+def format_fab_lines(package_dimensions,linewidth=0.1,package_points=None):
+    """ return the lines (as in newline ) for the fabrication layer (geometrical) lines
+        @param package_dimensions: size of the component (x,y)
+        @param package_points: precomputed get_package_points(package_dimensions), optional
+        @return: lines for the fabrication layer rectangle with cutted edge as pin 1 indicator
+    """
+    points = get_fab_points(package_dimensions,package_points=package_points)
+    return [format_fpline(startpoint,endpoint,"F.Fab",linewidth) for startpoint,endpoint in get_polygon_segments(points)]
+
+
+def get_silks_segments(pads,package_dimensions,distance_to_fablines=0.12,distance_to_pads=0.2,linewidth=0.12,outer_dimensions=None,center_dimensions=None,package_points=None):
+    """ return the (startpoint,endpoint) segments of the silkscreen lines above and below the pads
+        @param outer_dimensions: precomputed get_outer_dimensions_of_pads(pads), optional
+        @param center_dimensions: precomputed get_center_dimensions_of_pads(pads), optional
+        @param package_points: precomputed get_package_points(package_dimensions), optional
+    """
+    segments = []
+    if outer_dimensions is None:
+        outer_dimensions = get_outer_dimensions_of_pads(pads)
+    if center_dimensions is None:
+        center_dimensions = get_center_dimensions_of_pads(pads)
+    if package_points is None:
+        package_points = get_package_points(package_dimensions)
+    minxy,maxxy = outer_dimensions
+    cminxy,cmaxxy = center_dimensions
     
-    faby = [p[1] for p in get_package_points(package_dimensions)]
+    faby = [p[1] for p in package_points]
     fabminy = min(faby) 
     fabmaxy = max(faby)
 #     print(minxy,fabminy,fabmaxy)
@@ -159,65 +394,102 @@ def format_silks_lines(pads,package_dimensions,distance_to_fablines=0.12,distanc
     startpoint = minxy[0]+(linewidth/2),min(minxy[1]-distance_to_pads,fabminy-distance_to_fablines)
     endpoint = cmaxxy[0],min(minxy[1]-distance_to_pads,fabminy-distance_to_fablines)
 #     print(startpoint,endpoint)
-    silks_lines.append(format_fpline(startpoint,endpoint,"F.SilkS",linewidth))
+    segments.append((startpoint,endpoint))
     
     startpoint = cminxy[0],max(maxxy[1]+distance_to_pads,fabmaxy+distance_to_fablines)
     endpoint = cmaxxy[0],max(maxxy[1]+distance_to_pads,fabmaxy+distance_to_fablines)
 #     print(startpoint,endpoint)
-    silks_lines.append(format_fpline(startpoint,endpoint,"F.SilkS",linewidth))
-    return silks_lines
+    segments.append((startpoint,endpoint))
+    return segments
 
-def format_3dmodel_lines(model3dname):
+
+def format_silks_lines(pads,package_dimensions,distance_to_fablines=0.12,distance_to_pads=0.2,linewidth=0.12,outer_dimensions=None,center_dimensions=None,package_points=None):
+    """ return the silkscreen lines above and below the pads, see get_silks_segments """
+    segments = get_silks_segments(pads,package_dimensions,distance_to_fablines=distance_to_fablines,distance_to_pads=distance_to_pads,linewidth=linewidth,
+                                  outer_dimensions=outer_dimensions,center_dimensions=center_dimensions,package_points=package_points)
+    return [format_fpline(startpoint,endpoint,"F.SilkS",linewidth) for startpoint,endpoint in segments]
+
+def format_3dmodel_lines(model3dname,offset=(0,0,0),scale=(1,1,1),rotate=(0,0,0),fmt=None):
+    """ @param fmt: function that formats a number, "{0:g}".format if None """
+    fmt = fmt or "{0:g}".format
     lines = []
     sublines = []
-    sublines.append("(at (xyz 0 0 0))")
-    sublines.append("(scale (xyz 1 1 1))")
-    sublines.append("(rotate (xyz 0 0 0))")
-    lines.append(r"(model ${{KISYS3DMOD}}/{0}".format(model3dname))
+    for name,values in [("at",offset),("scale",scale),("rotate",rotate)]:
+        sublines.append("({0} (xyz {1}))".format(name," ".join(map(fmt,values))))
+    lines.append("(model {0}".format(quote_atom(r"${{KISYS3DMOD}}/{0}".format(model3dname))))
     lines.extend("  {0}".format(subline) for subline in sublines)
     lines.append(")")
     return lines
     
     
-def format_fpline(startpoint,endpoint,layer,width):
-    ret =  "(fp_line (start {0}) (end {1}) (layer {2}) (width {3}))".format(" ".join("{:.2f}".format(dim) for dim in startpoint),
-                                                                            " ".join("{:.2f}".format(dim) for dim in endpoint),
+def format_fpline(startpoint,endpoint,layer,width,fmt=format_mm):
+    ret =  "(fp_line (start {0}) (end {1}) (layer {2}) (width {3}))".format(" ".join(map(fmt,startpoint)),
+                                                                            " ".join(map(fmt,endpoint)),
                                                                             layer,
                                                                             width)
     return ret        
 
 
-def format_fp_text(text,posxy,layer,fontsize=(1,1),thickness=0.15,texttype="reference",angle=0):
+def quote_atom(value):
+    """ return value as an s-expression atom, quoted if it is empty or has spaces, brackets or quotes """
+    if value and not any(char in value for char in " \t\n()\""):
+        return value
+    return "\"{0}\"".format(value.replace("\"","\\\""))
+
+
+def format_fp_text(text,posxy,layer,fontsize=(1,1),thickness=0.15,texttype="reference",angle=0,hide=False,fmt=format_mm):
     lines = []
     sublines = []
     poscontents = list(posxy)
     if angle:
         poscontents.append(angle)
-    sublines.append("(effects (font (size {0}) (thickness {1:.2f})))".format(" ".join(["{:.2f}".format(I) for I in fontsize]),thickness))
-    lines.append("(fp_text {0} {1} (at {2:}) (layer {3:})".format(texttype,text," ".join(["{:.2f}".format(I) for I in poscontents]),layer))
+    sublines.append("(effects (font (size {0}) (thickness {1})))".format(" ".join(map(fmt,fontsize)),fmt(thickness)))
+    lines.append("(fp_text {0} {1} (at {2:}) (layer {3:}){4}".format(texttype,quote_atom(text)," ".join(map(fmt,poscontents)),layer," hide" if hide else ""))
     lines.extend("  {0}".format(subline) for subline in sublines)
     lines.append(")")
     return lines
 
 
+def freeze(value):
+    """ turn nested lists into nested tuples, e.g. to use dimensions as a dict key """
+    if isinstance(value,(list,tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
 def calc_fab_ref_text_scaling(text,sizexy,charsize=(1,1)):
     textdim = (charsize[0]*len(text),charsize[1])
     scalingxy = [min(abs(sizexy[I]/textdim[I]),1) for I in range(len(sizexy))] 
     return scalingxy 
     
 
-class footprint_pad():
+#compact primitives: pads, lines, texts and models are immutable tuples without a per instance dict,
+#equal items compare and hash equal, so they can be shared between footprints, see primitive_pool
+_LAYERS_CACHE = {}#layer list -> shared tuple
+
+
+def intern_layers(layers):
+    """ return a shared tuple of layer names, all pads with the same layers hold the same tuple """
+    layers = tuple(layers)
+    try:
+        return _LAYERS_CACHE[layers]
+    except KeyError:
+        pass
+    ret = tuple(sys.intern(layer) for layer in layers)
+    if len(_LAYERS_CACHE) >= _FORMAT_CACHE_SIZE:
+        _LAYERS_CACHE.clear()
+    _LAYERS_CACHE[layers] = ret
+    return ret
+
+
+class footprint_pad(namedtuple("footprint_pad","padnum xypos sizexy padtype padshape layers drill")):
 
     
-    def __init__(self, padnum, xypos, sizexy, padtype, padshape,layers,drill=None):
-        """ A class to represent a footprint and implement helper functions """
-        self.padnum = padnum
-        self.xypos = xypos
-        self.sizexy = sizexy
-        self.padtype = padtype
-        self.padshape = padshape
-        self.layers = layers       
-        self.drill = drill
+    __slots__ = ()
+    
+    def __new__(cls, padnum, xypos, sizexy, padtype, padshape,layers,drill=None):
+        """ A class to represent a pad and implement helper functions, pads are immutable and hashable """
+        return super().__new__(cls,padnum,tuple(xypos),tuple(sizexy),padtype,padshape,intern_layers(layers),drill)
         
     def get_outer_dimensions(self):
         """ return the outer dimensions of a pad """
@@ -228,26 +500,26 @@ class footprint_pad():
     def get_xypos(self):
         return self.xypos
     
-    def format(self):
+    def format(self,fmt=format_mm):
         #TODO make this nice later
         if self.padnum == None:
             padnum_str = "\"\""#escaped ""
         else:
             padnum_str = self.padnum
         if self.drill:
-            ret = "(pad {0} {1} {2} (at {3}) (size {4}) (drill {5:.2f}) (layers {6}))".format(padnum_str,
+            ret = "(pad {0} {1} {2} (at {3}) (size {4}) (drill {5}) (layers {6}))".format(padnum_str,
                                                                                               self.padtype,
                                                                                               self.padshape,
-                                                                                              " ".join("{0:.2f}".format(dim) for dim in self.xypos),
-                                                                                              " ".join("{0:.2f}".format(dim) for dim in self.sizexy),
-                                                                                              self.drill,
+                                                                                              " ".join(map(fmt,self.xypos)),
+                                                                                              " ".join(map(fmt,self.sizexy)),
+                                                                                              fmt(self.drill),
                                                                                               " ".join(self.layers) )
         else:
             ret = "(pad {0} {1} {2} (at {3}) (size {4}) (layers {5}))".format(padnum_str,
                                                                                self.padtype,
                                                                                self.padshape,
-                                                                               " ".join("{0:.2f}".format(dim) for dim in self.xypos),
-                                                                               " ".join("{0:.2f}".format(dim) for dim in self.sizexy),
+                                                                               " ".join(map(fmt,self.xypos)),
+                                                                               " ".join(map(fmt,self.sizexy)),
                                                                                " ".join(self.layers) )
         return ret
     
@@ -257,15 +529,268 @@ class footprint_pad():
         else:
             raise NotImplementedError("Shape not handled yet {0}".format(self.padshape))
         return ret 
-        
-        
 
 
+class fp_line(namedtuple("fp_line","start end layer width")):
+
+
+    __slots__ = ()
+    
+    def __new__(cls,start,end,layer,width):
+        """ A class to represent a graphic line, immutable and hashable like footprint_pad """
+        return super().__new__(cls,tuple(start),tuple(end),sys.intern(layer),width)
+    
+    def format(self,fmt=format_mm):
+        #a file without a width uses the default, the width is written like kicad writes numbers
+        return format_fpline(self.start,self.end,self.layer,format_mm_exact(self.width or 0),fmt=fmt)
+
+
+class fp_text(namedtuple("fp_text","text posxy layer fontsize thickness texttype angle hide")):
+
+
+    __slots__ = ()
+    
+    def __new__(cls,text,posxy,layer,fontsize=(1,1),thickness=0.15,texttype="reference",angle=0,hide=False):
+        """ A class to represent a text, same arguments as format_fp_text """
+        return super().__new__(cls,text,tuple(posxy),sys.intern(layer),tuple(fontsize),thickness,texttype,angle,hide)
+    
+    def format(self,fmt=format_mm):
+        """ return the lines of the text, see format_fp_text """
+        return format_fp_text(*self,fmt=fmt)
+
+
+class fp_model(namedtuple("fp_model","name offset scale rotate")):
+
+
+    __slots__ = ()
+    
+    def __new__(cls,name,offset=(0,0,0),scale=(1,1,1),rotate=(0,0,0)):
+        """ A class to represent a 3d model, name is relative to ${KISYS3DMOD} """
+        return super().__new__(cls,name,tuple(offset),tuple(scale),tuple(rotate))
+    
+    def format(self,fmt=None):
+        """ return the lines of the model, see format_3dmodel_lines """
+        return format_3dmodel_lines(*self,fmt=fmt)
+
+
+class primitive_pool():
+
+
+    def __init__(self):
+        """ A class to share equal primitives between footprints, e.g. when a whole library is held in memory
+            intern() returns the first equal item that was interned, the points of lines are shared as well
+        """
+        self.items = {}
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def intern(self,item):
+        """ return the shared item that is equal to item, items of different types are never shared """
+        key = (item.__class__,item)
+        try:
+            return self.items[key]
+        except KeyError:
+            pass
+        if isinstance(item,fp_line):
+            item = item._replace(start=self.intern(item.start),end=self.intern(item.end))
+        self.items[key] = item
+        return item
+        
+        
+class footprint_pad_array():
+    
+    
+    def __init__(self, pads=None):
+        """ A columnar container of pads for high pin count packages
+            positions, sizes and drills are stored in flat arrays of integer nanometres, pad types, shapes and layers
+            are stored as indexes into small tables, so bounding box and area queries run over plain arrays
+            instead of a list of footprint_pad objects.
+            Indexing and iterating returns footprint_pad views in mm, so kicad_footprint.format keeps working.
+            @param pads: optional iterable of footprint_pad to start with
+        """
+        self.padnums = []
+        self.posx = array("q")
+        self.posy = array("q")
+        self.sizex = array("q")
+        self.sizey = array("q")
+        self.drills = array("q")#0 means no drill
+        self.padtypes = array("B")
+        self.padshapes = array("B")
+        self.layers = array("H")
+        self.padtype_table = []
+        self.padshape_table = []
+        self.layers_table = []
+        self.version = 0#incremented on every change, used by kicad_footprint to invalidate its geometry cache
+        self._formatted = None#(version,lines) of get_formatted_lines
+        if pads is not None:
+            self.extend(pads)
+    
+    def _get_table_index(self,table,value):
+        try:
+            return table.index(value)
+        except ValueError:
+            table.append(value)
+            return len(table)-1
+    
+    def add(self, padnum, xypos, sizexy, padtype, padshape,layers,drill=None):
+        """ add a pad, same arguments as footprint_pad, dimensions in mm """
+        self.padnums.append(padnum)
+        self.posx.append(mm_to_nm(xypos[0]))
+        self.posy.append(mm_to_nm(xypos[1]))
+        self.sizex.append(mm_to_nm(sizexy[0]))
+        self.sizey.append(mm_to_nm(sizexy[1]))
+        self.drills.append(mm_to_nm(drill or 0))
+        self.padtypes.append(self._get_table_index(self.padtype_table,padtype))
+        self.padshapes.append(self._get_table_index(self.padshape_table,padshape))
+        self.layers.append(self._get_table_index(self.layers_table,intern_layers(layers)))
+        self.version += 1
+        
+    def add_layout(self,layout,sizexy,padtype,padshape,layers,drill=None,padnum=None):
+        """ add all pads of a layout at once, they share size, type, shape and layers
+            @param layout: (padnums,posx,posy) from get_dual_layout, get_quad_layout or get_grid_layout, positions in nanometres
+            @param padnum: use this pad number for all pads instead of the numbers of the layout, e.g. for thermal vias
+        """
+        padnums,posx,posy = layout
+        count = len(posx)
+        if padnum is not None:
+            self.padnums.extend([padnum]*count)
+        else:
+            self.padnums.extend(padnums)
+        self.posx.extend(posx)
+        self.posy.extend(posy)
+        self.sizex.extend(array("q",[mm_to_nm(sizexy[0])])*count)
+        self.sizey.extend(array("q",[mm_to_nm(sizexy[1])])*count)
+        self.drills.extend(array("q",[mm_to_nm(drill or 0)])*count)
+        self.padtypes.extend(array("B",[self._get_table_index(self.padtype_table,padtype)])*count)
+        self.padshapes.extend(array("B",[self._get_table_index(self.padshape_table,padshape)])*count)
+        self.layers.extend(array("H",[self._get_table_index(self.layers_table,intern_layers(layers))])*count)
+        self.version += 1
+        
+    def append(self,pad):
+        """ add a footprint_pad """
+        self.add(pad.padnum,pad.xypos,pad.sizexy,pad.padtype,pad.padshape,pad.layers,drill=pad.drill)
+        
+    def extend(self,pads):
+        """ add an iterable of footprint_pad or another footprint_pad_array """
+        if isinstance(pads,footprint_pad_array):
+            #copy the columns and remap the table indexes
+            self.padnums.extend(pads.padnums)
+            self.posx.extend(pads.posx)
+            self.posy.extend(pads.posy)
+            self.sizex.extend(pads.sizex)
+            self.sizey.extend(pads.sizey)
+            self.drills.extend(pads.drills)
+            for column,table,othercolumn,othertable in [(self.padtypes,self.padtype_table,pads.padtypes,pads.padtype_table),
+                                                        (self.padshapes,self.padshape_table,pads.padshapes,pads.padshape_table),
+                                                        (self.layers,self.layers_table,pads.layers,pads.layers_table)]:
+                remap = [self._get_table_index(table,value) for value in othertable]
+                column.extend(remap[idx] for idx in othercolumn)
+            self.version += 1
+        else:
+            for pad in pads:
+                self.append(pad)
+    
+    def __len__(self):
+        return len(self.padnums)
+    
+    def __getitem__(self,idx):
+        """ return a footprint_pad view of a single pad """
+        if idx < 0:
+            idx += len(self)
+        drill = self.drills[idx]
+        #the columns are already tuples and interned layers, so skip the conversions of footprint_pad.__new__
+        return footprint_pad._make((self.padnums[idx],
+                                    (nm_to_mm(self.posx[idx]),nm_to_mm(self.posy[idx])),
+                                    (nm_to_mm(self.sizex[idx]),nm_to_mm(self.sizey[idx])),
+                                    self.padtype_table[self.padtypes[idx]],
+                                    self.padshape_table[self.padshapes[idx]],
+                                    self.layers_table[self.layers[idx]],
+                                    nm_to_mm(drill) if drill else None))
+    
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+    
+    def iter_format(self,fmt=format_nm_cached):
+        """ yield the formatted pads straight from the columns, same output as footprint_pad.format
+            @param fmt: function that formats integer nanometres, format_nm_exact for pads read from a file
+        """
+        padtypes = self.padtype_table
+        padshapes = self.padshape_table
+        layers_strs = [" ".join(layers) for layers in self.layers_table]
+        for padnum,padtype,padshape,posx,posy,sizex,sizey,drill,layers in zip(self.padnums,self.padtypes,self.padshapes,
+                                                                                self.posx,self.posy,self.sizex,self.sizey,
+                                                                                self.drills,self.layers):
+            if padnum is None:
+                padnum = "\"\""#escaped ""
+            if drill:
+                yield "(pad {0} {1} {2} (at {3} {4}) (size {5} {6}) (drill {7}) (layers {8}))".format(padnum,padtypes[padtype],padshapes[padshape],
+                                                                                                   fmt(posx),fmt(posy),fmt(sizex),fmt(sizey),
+                                                                                                   fmt(drill),layers_strs[layers])
+            else:
+                yield "(pad {0} {1} {2} (at {3} {4}) (size {5} {6}) (layers {7}))".format(padnum,padtypes[padtype],padshapes[padshape],
+                                                                                         fmt(posx),fmt(posy),fmt(sizex),fmt(sizey),
+                                                                                         layers_strs[layers])
+    
+    def get_formatted_lines(self):
+        """ return the formatted pads as a list, it is kept until the pads change,
+            so pads that go into several footprints are formatted once
+        """
+        if self._formatted is None or self._formatted[0] != self.version:
+            self._formatted = (self.version,list(self.iter_format()))
+        return self._formatted[1]
+    
+    def get_outer_dimensions_nm(self):
+        """ return the outer dimensions of all pads in half nanometres, including the origin """
+        if not len(self):
+            return [0,0],[0,0]
+        minxy = [min(0,min(2*pos-size for pos,size in zip(self.posx,self.sizex))),
+                 min(0,min(2*pos-size for pos,size in zip(self.posy,self.sizey)))]
+        maxxy = [max(0,max(2*pos+size for pos,size in zip(self.posx,self.sizex))),
+                 max(0,max(2*pos+size for pos,size in zip(self.posy,self.sizey)))]
+        return minxy,maxxy
+    
+    def get_outer_dimensions(self):
+        """ return the outer dimensions of all pads in mm, including the origin like get_outer_dimensions_of_pads """
+        minxy,maxxy = self.get_outer_dimensions_nm()
+        return [nm_to_mm(dim/2) for dim in minxy],[nm_to_mm(dim/2) for dim in maxxy]
+    
+    def get_center_dimensions(self):
+        """ return the extent of the pad centers in mm, including the origin like get_center_dimensions_of_pads """
+        if not len(self):
+            return [0,0],[0,0]
+        minxy = [nm_to_mm(min(0,min(self.posx))),nm_to_mm(min(0,min(self.posy)))]
+        maxxy = [nm_to_mm(max(0,max(self.posx))),nm_to_mm(max(0,max(self.posy)))]
+        return minxy,maxxy
+    
+    def get_areas(self,layer=None):
+        """ return the area of each pad in mm^2
+            @param layer: only return the pads on this layer, e.g. "F.Paste"
+        """
+        if layer is None:
+            selected = range(len(self))
+        else:
+            on_layer = [layer in layers for layers in self.layers_table]
+            selected = [idx for idx,layers in enumerate(self.layers) if on_layer[layers]]
+        for padshape in set(self.padshapes[idx] for idx in selected):
+            if self.padshape_table[padshape] != "rect":
+                raise NotImplementedError("Shape not handled yet {0}".format(self.padshape_table[padshape]))
+        return array("d",(self.sizex[idx]*self.sizey[idx]/(NM_PER_MM*NM_PER_MM) for idx in selected))
+    
+    def get_area(self,layer=None):
+        """ return the sum of the pad areas in mm^2
+            @param layer: only count pads on this layer, e.g. "F.Paste"
+        """
+        return sum(self.get_areas(layer=layer))
+    
+    
 
 class kicad_footprint:
     
      
-    def __init__(self,name,desc,datasheet,pads,tedit="5AA01C76",layers=["F.Cu",],tags=["TDFN",],attr=["smd",],model3dname="Package_DFN_QFN.3dshapes/DFN-14-1EP_3x4.5mm_P0.65mm.wrl",package_dimensions=(1,1)):
+    def __init__(self,name,desc,datasheet,pads,tedit="5AA01C76",layers=["F.Cu",],tags=["TDFN",],attr=["smd",],model3dname="Package_DFN_QFN.3dshapes/DFN-14-1EP_3x4.5mm_P0.65mm.wrl",package_dimensions=(1,1),
+                 fragments=None,pad_groups=None):
         self.name = name
         self.desc = desc
         self.datasheet = datasheet
@@ -276,55 +801,247 @@ class kicad_footprint:
         self.attr = attr
         self.model3dname=model3dname
         self.package_dimensions = package_dimensions
+        self._geometry = {}
+        self._geometry_key = None
+        self.lines = None#fp_line items read from a file, see footprintparser.py, None for a generated footprint
+        self.texts = None#fp_text items read from a file, None for a generated footprint
+        self.model = None#fp_model read from a file, otherwise made from model3dname
+        self.unsupported = []#names of the items of a file that are not kept, such a footprint can not be written
+        self.item_order = None#[(item name,count)] of the texts, lines, pads and model in the order of the file
+        self.fragments = fragments#dict of formatted sections shared between variants of a footprint, see build_footprint_variants_stmicro
+        self.pad_groups = pad_groups#footprint_pad_arrays that make up pads, their formatted lines are reused
+        self._pad_groups_version = getattr(pads,"version",None)#pads changed after construction are formatted from pads again
         #self.pitch = re.compile("_P.*mm").findall(self.name)[0]#TODO: should we noc generate the name instead of RE the pitch out of it?!
         
-    def format(self):
+    #geometry cache: the extents of the pads and the package are used by several layers,
+    #they are computed once and dropped when pads or package_dimensions change
+    def invalidate_geometry(self):
+        """ drop all cached geometry, this is not needed after changing pads or package_dimensions, they are part of the cache key """
+        self._geometry = {}
+        self._geometry_key = None
+    
+    def _get_geometry_key(self):
+        if isinstance(self.pads,footprint_pad_array):
+            pads_key = (id(self.pads),self.pads.version)
+        else:
+            pads_key = tuple(self.pads)#footprint_pad is immutable, so the contents of a plain list are the key
+        return (pads_key,tuple(self.package_dimensions))
+    
+    def _get_cached_geometry(self,name,func):
+        key = self._get_geometry_key()
+        if key != self._geometry_key:
+            self._geometry = {}
+            self._geometry_key = key
+        try:
+            return self._geometry[name]
+        except KeyError:
+            value = self._geometry[name] = footprintstats.run_stage("geometry",func)
+            return value
+    
+    def get_outer_dimensions(self):
+        """ return the cached outer dimensions of the pads, do not modify the result """
+        return self._get_cached_geometry("outer_dimensions",lambda: get_outer_dimensions_of_pads(self.pads))
+    
+    def get_center_dimensions(self):
+        """ return the cached extent of the pad centers, do not modify the result """
+        return self._get_cached_geometry("center_dimensions",lambda: get_center_dimensions_of_pads(self.pads))
+    
+    def get_package_points(self):
+        """ return the cached corner points of the package, do not modify the result """
+        return self._get_cached_geometry("package_points",lambda: get_package_points(self.package_dimensions))
+    
+    def get_courtyard_points(self):
+        """ return the cached corner points of the courtyard, do not modify the result """
+        return self._get_cached_geometry("courtyard_points",lambda: get_courtyard_points(self.pads,self.package_dimensions,
+                                                                                        outer_dimensions=self.get_outer_dimensions(),
+                                                                                        package_points=self.get_package_points()))
+    
+    def _get_fragment(self,name,key,func,*args,**kwargs):
+        """ run a formatting stage, with shared fragments the lines are formatted once for all footprints with the same key """
+        if self.fragments is None:
+            return footprintstats.run_stage(name,func,*args,**kwargs)
+        try:
+            return self.fragments[(name,key)]
+        except KeyError:
+            value = self.fragments[(name,key)] = footprintstats.run_stage(name,func,*args,**kwargs)
+            return value
+    
+    def get_lines(self):
+        """ return the graphic lines as (startpoint,endpoint,layer,width) tuples
+            for a footprint read from a file these are the lines of the file, otherwise the fab, silkscreen and
+            courtyard lines that format() writes
+        """
+        if self.lines is not None:
+            return self.lines
+        lines = []
+        for startpoint,endpoint in get_polygon_segments(get_fab_points(self.package_dimensions,package_points=self.get_package_points())):
+            lines.append(fp_line(startpoint,endpoint,"F.Fab",0.1))
+        for startpoint,endpoint in get_silks_segments(self.pads,package_dimensions=self.package_dimensions,
+                                                      outer_dimensions=self.get_outer_dimensions(),
+                                                      center_dimensions=self.get_center_dimensions(),
+                                                      package_points=self.get_package_points()):
+            lines.append(fp_line(startpoint,endpoint,"F.SilkS",0.12))
+        for startpoint,endpoint in get_polygon_segments(self.get_courtyard_points()):
+            lines.append(fp_line(startpoint,endpoint,"F.CrtYd",0.05))
+        return lines
+    
+    def get_texts(self):
+        """ return the texts as fp_text, for a footprint read from a file these are the texts of the file,
+            otherwise the value and the references that format() writes
+        """
+        if self.texts is not None:
+            return self.texts
+        return list(self.get_generated_texts())
+    
+    def get_generated_texts(self):
+        """ return the (value,fab reference,silkscreen reference) fp_text that format() writes """
         fabrication_layer_value_distance_to_pads = 1#TODO: STUB - automate / calculate this value
-        items = []#list of items to be placed in the format string
-        items.append("module {0} (layer {1}) (tedit {2})".format(self.name," ".join(self.layers),self.tedit))#module definition line
-        subitems = []
-        subitems.append("(descr \"{0} ({1})\")".format(self.desc,self.datasheet))
-        subitems.append("(tags \"{0}\")".format(" ".join(self.tags)))
-        subitems.append("(attr {0})".format(" ".join(self.attr)))
-        
-        #Fab layer
-        subitems.extend(format_fab_lines(package_dimensions=self.package_dimensions))        
-        maxxy = get_outer_dimensions_of_pads(self.pads)[1]
-        refpos = (0,maxxy[1]+fabrication_layer_value_distance_to_pads)
-        subitems.extend(format_fp_text(text=self.name,posxy=refpos,layer="F.Fab",texttype="value"))
+        minxy,maxxy = self.get_outer_dimensions()
+        value_text = fp_text(text=self.name,posxy=(0,maxxy[1]+fabrication_layer_value_distance_to_pads),layer="F.Fab",texttype="value")
         #scaling = calc_text_scaling(text="REF**",sizexy=get_center_dimensions_of_pads(self.pads))#actually we're calculating %R but it translates to REF**
-        scaling = calc_fab_ref_text_scaling(text="REF**",sizexy=self.package_dimensions)
-#         print("Scaling {0}".format(scaling))
+        scaling = footprintstats.run_stage("text_scaling",calc_fab_ref_text_scaling,text="REF**",sizexy=self.package_dimensions)
         angle=0
         if scaling[1] < scaling[0]:
             angle=90#use 90deg angle if the y dim is bigger than x, so we have more space
         fontsize=(min(scaling),)*2#keep aspect ratio
-#         print("Fontsize {0}".format(fontsize))
         thickness = 0.15*fontsize[0]
-#         thickness = 0.15*(self.package_dimensions[1]/self.package_dimensions[0])
-#         print("package_dims {0} ratio {1}".format(self.package_dimensions,self.package_dimensions[1]/self.package_dimensions[0]))
-#         print("Thickness {0}".format(thickness))
-        subitems.extend(format_fp_text(text="%R",posxy=(0,0),layer="F.Fab",texttype="user",fontsize=fontsize,angle=angle,thickness=thickness))
+        fab_ref_text = fp_text(text="%R",posxy=(0,0),layer="F.Fab",texttype="user",fontsize=fontsize,angle=angle,thickness=thickness)
+        distance_to_pads = 1#TODO: write a function that returns the required distance to the pads, this is nasty
+        silk_ref_text = fp_text(text="REF**",posxy=(0,minxy[1]-distance_to_pads),layer="F.SilkS")
+        return value_text,fab_ref_text,silk_ref_text
+    
+    def get_model(self):
+        """ return the 3d model as fp_model, None if there is none """
+        if self.model is not None:
+            return self.model
+        if self.model3dname is None:
+            return None
+        return fp_model(self.model3dname)
+    
+    def is_read_from_file(self):
+        """ return True for a footprint read by footprintparser.py, format() then writes the items of the file
+            instead of generating them
+        """
+        return self.lines is not None
+    
+    def iter_header(self):
+        if self.is_read_from_file():
+            yield from self.iter_file_header()
+            return
+        yield "(descr \"{0} ({1})\")".format(self.desc,self.datasheet)
+        yield "(tags \"{0}\")".format(" ".join(self.tags))
+        yield "(attr {0})".format(" ".join(self.attr))
+    
+    def iter_file_header(self):
+        desc = "{0} ({1})".format(self.desc,self.datasheet) if self.datasheet else self.desc
+        if desc:
+            yield "(descr {0})".format(quote_atom(desc))
+        if self.tags:
+            yield "(tags {0})".format(quote_atom(" ".join(self.tags)))
+        if self.attr:
+            yield "(attr {0})".format(" ".join(self.attr))
+    
+    def iter_file_subitems(self):
+        """ yield the items of a footprint read from a file like kicad writes them, in the order of the file
+            and with the numbers at full precision, items added later follow the items of the file
+            @raise ValueError: if the file has items that are not kept, see footprintparser.py
+        """
+        if self.unsupported:
+            raise ValueError("Footprint {0} can not be written, its file has items that are not kept: {1}".format(self.name,", ".join(self.unsupported)))
+        yield from self.iter_header()
+        if isinstance(self.pads,footprint_pad_array):
+            padlines = self.pads.iter_format(fmt=format_nm_exact)
+        else:
+            padlines = (pad.format(fmt=format_mm_exact) for pad in self.pads)
+        model = self.get_model()
+        items = {"fp_text":(text.format(fmt=format_mm_exact) for text in self.texts),
+                 "fp_line":([line.format(fmt=format_mm_exact)] for line in self.lines),
+                 "pad":([padline] for padline in padlines),
+                 "model":(model.format(fmt=format_mm_exact) for model in ([model] if model is not None else [])),
+                 }
+        for name,count in (self.item_order or []):
+            for lines in islice(items[name],count):
+                yield from lines
+        for name in ["fp_text","fp_line","pad","model"]:
+            for lines in items[name]:
+                yield from lines
+    
+    def iter_subitems(self):
+        """ yield the items inside the module section by section, without indentation """
+        if self.is_read_from_file():
+            yield from self.iter_file_subitems()
+            return
+        yield from footprintstats.iter_stage("header",self.iter_header())
+        value_text,fab_ref_text,silk_ref_text = self.get_generated_texts()
+        
+        #Fab layer
+        yield from self._get_fragment("fab_lines",tuple(self.package_dimensions),format_fab_lines,package_dimensions=self.package_dimensions,package_points=self.get_package_points())
+        yield from footprintstats.run_stage("fab_text",value_text.format)
+        yield from self._get_fragment("fab_text",fab_ref_text,fab_ref_text.format)#texts are hashable, so they are their own key
         
         #SilkS layer
-        minxy,maxxy = get_outer_dimensions_of_pads(self.pads)
-        distance_to_pads = 1#TODO: write a function that returns the required distance to the pads, this is nasty
-        refpos = (0,minxy[1]-distance_to_pads)
-        subitems.extend(format_fp_text(text="REF**",posxy=refpos,layer="F.SilkS"))
-        subitems.extend(format_silks_lines(self.pads,package_dimensions=self.package_dimensions))
+        yield from self._get_fragment("silk_text",silk_ref_text,silk_ref_text.format)
+        yield from self._get_fragment("silk_lines",freeze((self.package_dimensions,self.get_outer_dimensions(),self.get_center_dimensions())),
+                                      format_silks_lines,self.pads,package_dimensions=self.package_dimensions,
+                                      outer_dimensions=self.get_outer_dimensions(),
+                                      center_dimensions=self.get_center_dimensions(),
+                                      package_points=self.get_package_points())
         
-        subitems.extend(format_courtyard_lines(self.pads,package_dimensions=self.package_dimensions))
-#         subitems.extend(format_courtyard_lines(self.pads))#testing        
-        subitems.extend([pad.format() for pad in self.pads])
-        subitems.extend(format_3dmodel_lines(self.model3dname))
-        [items.append("  {0}".format(subitem)) for subitem in subitems]
-        ret = "({0}\n)".format("\n".join(items))
-        return ret
+        courtyard_points = self.get_courtyard_points()
+        yield from self._get_fragment("courtyard",freeze(courtyard_points),format_courtyard_lines,self.pads,package_dimensions=self.package_dimensions,courtyard_points=courtyard_points)
+#         yield from format_courtyard_lines(self.pads)#testing        
+        if self.pad_groups is not None and getattr(self.pads,"version",None) == self._pad_groups_version:
+            padlines = (line for group in self.pad_groups for line in group.get_formatted_lines())
+        elif isinstance(self.pads,footprint_pad_array):
+            padlines = self.pads.iter_format()
+        else:
+            padlines = (pad.format() for pad in self.pads)
+        yield from footprintstats.iter_stage("pads",padlines)
+        model = self.get_model()
+        if model is not None:
+            yield from self._get_fragment("model",model,model.format)
     
+    def iter_lines(self):
+        """ yield the lines of the footprint file without line endings
+            the lines are produced one at a time, so memory stays flat for footprints with many pads
+        """
+        if self.tedit is None:
+            yield "(module {0} (layer {1})".format(quote_atom(self.name)," ".join(self.layers))
+        else:
+            yield "(module {0} (layer {1}) (tedit {2})".format(quote_atom(self.name)," ".join(self.layers),self.tedit)#module definition line
+        for subitem in self.iter_subitems():
+            yield "  {0}".format(subitem)
+        yield ")"
     
+    def write(self,fileobj):
+        """ stream the footprint into a file object, the output is the same as format()
+            @param fileobj: a writable text file object
+        """
+        lines = self.iter_lines()
+        fileobj.write(next(lines))
+        for line in lines:
+            fileobj.write("\n")
+            fileobj.write(line)
     
-def make_footprint_stmicro(N,E,X2,Y2,C,X,Y,V,EV,modulename,description,datasheet,centerpad,numthermalvias,package_dimensions,generate_thermalvias=True):
+    def format(self):
+        return "\n".join(self.iter_lines())
+    
+    
+    
+def make_footprint_stmicro(N,E,X2,Y2,C,X,Y,V,EV,modulename,description,datasheet,centerpad,numthermalvias,package_dimensions,generate_thermalvias=True,
+                           optimize_thermal=False,paste_coverage=(0.5,0.8)):
     """ make a kicad footprint from a st micro footprint description
+        same parameters as build_footprint_stmicro
+        @return:   a concated string that can be written to a footprint file
+    """
+    fp_obj = build_footprint_stmicro(N,E,X2,Y2,C,X,Y,V,EV,modulename,description,datasheet,centerpad,numthermalvias,package_dimensions,generate_thermalvias=generate_thermalvias,
+                                     optimize_thermal=optimize_thermal,paste_coverage=paste_coverage)
+    return footprintstats.run_stage("format",fp_obj.format)
+
+
+def build_footprint_stmicro(N,E,X2,Y2,C,X,Y,V,EV,modulename,description,datasheet,centerpad,numthermalvias,package_dimensions,generate_thermalvias=True,
+                            optimize_thermal=False,paste_coverage=(0.5,0.8)):
+    """ build a kicad footprint object from a st micro footprint description
         @param N: number of terminals(pads) in this footprint
         @param E: contact pitch
         @param X2: center pad width
@@ -337,42 +1054,69 @@ def make_footprint_stmicro(N,E,X2,Y2,C,X,Y,V,EV,modulename,description,datasheet
         @param modulename: reference name that kicad uses
         @param description: description in datasheet
         @param datasheet: href to datasheet 
-        @return:   a concated string that can be written to a footprint file
+        @param optimize_thermal: search the via grid and the paste apertures with footprintthermal instead of the fixed cross,
+                                 numthermalvias is then the maximum number of vias, None for no limit, EV the minimum via pitch
+        @param paste_coverage: (min,max) paste area / center pad area for optimize_thermal
+        @return:   a kicad_footprint object, use format() or write() to serialize it
+        @raise ValueError: if N or, without optimize_thermal, numthermalvias is odd, the pads are placed in two rows
         
     """
-    pads = []
-    thermalvia_pads = []
-    paste_pads = []    
-    for idx,xypos in enumerate(get_posxy_for_span(pinnum=N,spanx=E,spany=C)):
-        if idx >= N/2:
-            padnum = N - idx + int(N/2) 
-        else:
-            padnum=idx+1        
-        pads.append(footprint_pad(padnum,
-                                  xypos=(xypos[1],xypos[0]),
-                                  sizexy=(Y,X),
-                                  padtype="smd", padshape="oval",layers = ["F.Cu","F.Paste","F.Mask"]))
+    groups = ["thermalvias","paste"] if generate_thermalvias else ["paste"]
+    return build_footprint_variants_stmicro(N,E,X2,Y2,C,X,Y,V,EV,modulename,description,datasheet,centerpad,numthermalvias,package_dimensions,
+                                            variants=[(modulename,groups)],optimize_thermal=optimize_thermal,paste_coverage=paste_coverage)[0]
+
+
+def build_pad_groups_stmicro(N,E,X2,Y2,C,X,Y,V,EV,centerpad,numthermalvias,optimize_thermal=False,paste_coverage=(0.5,0.8)):
+    """ build the pads of a st micro footprint description as separate groups, same parameters as build_footprint_stmicro
+        @return: (pads,thermalvia_pads,paste_pads), the signal pads with the center pad, the thermal vias with the back side pad
+                 and the paste apertures of the center pad, all footprint_pad_array
+    """
+    timer = footprintstats.lap_timer()
+    pads = footprint_pad_array()
+    thermalvia_pads = footprint_pad_array()
+    paste_pads = footprint_pad_array()    
+    pads.add_layout(get_dual_layout(pinnum=N,pitch=E,span=C),
+                    sizexy=(Y,X),
+                    padtype="smd", padshape="oval",layers = ["F.Cu","F.Paste","F.Mask"])
+    timer.lap("signal_pads")
     if centerpad and X2 and Y2:
         ep = footprint_pad(N+1,
                            xypos=(0,0),
                            sizexy=(Y2,X2),
                            padtype="smd", padshape="rect",layers = ["F.Cu","F.Mask"])
         pads.append(ep)
-    if numthermalvias and V and EV:
+    if optimize_thermal and centerpad and X2 and Y2:
+        from footprintthermal import optimize_thermal_layout#only needed for optimized footprints
+        thermal = optimize_thermal_layout(ep_size=(Y2,X2),drill=V,min_pitch=EV,max_vias=numthermalvias if V and EV else 0,coverage=paste_coverage)
+        timer.lap("thermal_optimizer")
+        numthermalvias = thermal.get_via_count()
+        if numthermalvias:
+            thermalvia_pads.add_layout(thermal.get_via_layout(),
+                                       sizexy=(thermal.via_diameter,)*2,
+                                       padtype="thru_hole", padshape="circle",layers=["*.Cu",],drill=V,padnum=N+1)
+            thermalvia_pads.add(N+1,#one big thermal pad on the back like below
+                                xypos=(0,0),
+                                sizexy=(Y2,X2),
+                                padtype="smd", padshape="rect",layers = ["B.Cu",])
+            timer.lap("thermal_vias")
+        paste_pads.add_layout(thermal.get_paste_layout(),
+                              sizexy=thermal.get_aperture_size(),
+                              padtype="smd", padshape="rect",layers = ["F.Paste",])
+        timer.lap("paste_pads")
+    elif numthermalvias and V and EV:
         #TODO: calculate the number of thermal vias
-        for padnum,xypos in enumerate(get_posxy_for_span(pinnum=numthermalvias,spanx=EV,spany=EV)):#TODO: how do we know the Number of thermalvias from spec sheet variables? 
-            
-            #add the thermal via
-            diameter = min(Y2-EV,X2-EV)
-            thermalvia_pads.append(footprint_pad(N+1,
-                        xypos=(xypos[1],xypos[0]),
-                        sizexy=(diameter,)*2,
-                        padtype="thru_hole", padshape="circle",layers=["*.Cu",],drill=V))
+        #TODO: how do we know the Number of thermalvias from spec sheet variables? 
+        #add the thermal vias
+        diameter = min(Y2-EV,X2-EV)
+        thermalvia_pads.add_layout(get_dual_layout(pinnum=numthermalvias,pitch=EV,span=EV),
+                                   sizexy=(diameter,)*2,
+                                   padtype="thru_hole", padshape="circle",layers=["*.Cu",],drill=V,padnum=N+1)
             
-        thermalvia_pads.append(footprint_pad(N+1,#FIXUP: one big thermal pad on the back.
-                               xypos=(0,0),
-                               sizexy=(Y2,X2),
-                               padtype="smd", padshape="rect",layers = ["B.Cu",]))
+        thermalvia_pads.add(N+1,#FIXUP: one big thermal pad on the back.
+                            xypos=(0,0),
+                            sizexy=(Y2,X2),
+                            padtype="smd", padshape="rect",layers = ["B.Cu",])
+        timer.lap("thermal_vias")
         
         
         #shape the paste fields on the center pad around the thermalvias
@@ -380,81 +1124,97 @@ def make_footprint_stmicro(N,E,X2,Y2,C,X,Y,V,EV,modulename,description,datasheet
         #1.calc a rect between all vias
         #    Y2 is the longest dim
         #    use the space X2 - 2V as shortest dim
-        paste_pads.append(footprint_pad(
-                          None,#No pad number
-                          xypos=(0,0),
-                          sizexy=(Y2,EV-V),#FIXME:not the diameter but the drill+margin, what is the margin?
-                          padtype="smd",
-                          padshape="rect",
-                          layers = ["F.Paste",]))
+        paste_pads.add(None,#No pad number
+                       xypos=(0,0),
+                       sizexy=(Y2,EV-V),#FIXME:not the diameter but the drill+margin, what is the margin?
+                       padtype="smd",
+                       padshape="rect",
+                       layers = ["F.Paste",])
         #add the other pads
         for padnum,xypos in enumerate(get_posxy_for_span(pinnum=numthermalvias/2,spanx=EV,spany=EV)):#TODO Check with higher pin count!
-            paste_pads.append(footprint_pad(
-                              None,#No pad number
-                              xypos=xypos,#position is in between the vias
-                              sizexy=(EV-V,X2-EV),
-                              padtype="smd",
-                              padshape="rect",
-                              layers = ["F.Paste",]))
+            paste_pads.add(None,#No pad number
+                           xypos=xypos,#position is in between the vias
+                           sizexy=(EV-V,X2-EV),
+                           padtype="smd",
+                           padshape="rect",
+                           layers = ["F.Paste",])
+        timer.lap("paste_pads")
             
-#         paste_coverage = sum([paste_pad.get_area() for paste_pad in paste_pads])/ep.get_area()
+#         paste_coverage = paste_pads.get_area()/ep.get_area()
 #         print("paste coverage {0:%}".format(paste_coverage))
     else:
         raise NotImplementedError("Not handling paste pad generation if there is no information about thermal vias")
         #shape the paste fields on the center pad without thermal vias
-        
-        
-    if generate_thermalvias:        
-        pads.extend(thermalvia_pads)
-    pads.extend(paste_pads)    
-    
-    fp_obj = kicad_footprint(name=modulename,desc=description,datasheet=datasheet,pads=pads,tags=["TDFN","DFN","{0}mm".format(E)],
-                             model3dname="Package_DFN_QFN.3dshapes/{0}.wrl".format(modulename.replace("_ThermalVias","")),
-                             package_dimensions=package_dimensions)    
-    return fp_obj.format()
-        
+    return pads,thermalvia_pads,paste_pads
 
-if __name__ == "__main__":
-    modulename = "TDFN-8-1EP_3x2mm_P0.5mm_EP1.80x1.65mm_ThermalVias"
-    footprint = make_footprint_stmicro(N=8,
-                                       E=0.5,
-                                       X2=1.65,
-                                       Y2=1.8,
-                                       C=2.9,
-                                       X=0.25,
-                                       Y=0.85,
-                                       V=0.3,
-                                       EV=1.0,
-                                       modulename=modulename,
-                                       description="8-lead plastic dual flat, 2x3x0.75mm size, 0.5mm pitch",
-                                       datasheet="http://ww1.microchip.com/downloads/en/DeviceDoc/8L_TDFN_2x3_MN_C04-0129E-MN.pdf",
-                                       centerpad=True,
-                                       numthermalvias=4,
-                                       package_dimensions=(3,2),#swapped again portrait vs landscape
-                                       )
-    with open("{0}.kicad_mod".format(modulename),"w") as f:
-        f.write(footprint)
-
-    modulename = "TDFN-8-1EP_3x2mm_P0.5mm_EP1.80x1.65mm"
-    footprint = make_footprint_stmicro(N=8,
-                                       E=0.5,
-                                       X2=1.65,
-                                       Y2=1.8,
-                                       C=2.9,
-                                       X=0.25,
-                                       Y=0.85,
-                                       V=0.3,
-                                       EV=1.0,
-                                       modulename=modulename,
-                                       description="8-lead plastic dual flat, 2x3x0.75mm size, 0.5mm pitch",
-                                       datasheet="http://ww1.microchip.com/downloads/en/DeviceDoc/8L_TDFN_2x3_MN_C04-0129E-MN.pdf",
-                                       centerpad=True,
-                                       numthermalvias=4,
-                                       package_dimensions=(3,2),
-                                       generate_thermalvias=False,
-                                       )
-    with open("{0}.kicad_mod".format(modulename),"w") as f:
-        f.write(footprint)
 
+def build_footprint_variants_stmicro(N,E,X2,Y2,C,X,Y,V,EV,modulename,description,datasheet,centerpad,numthermalvias,package_dimensions,
+                                     variants=None,optimize_thermal=False,paste_coverage=(0.5,0.8)):
+    """ build several variants of a footprint from one set of pads, same parameters as build_footprint_stmicro
+        the pad groups are built once and each variant picks the groups it needs, the formatted pads and the sections
+        that come out the same (fab, silkscreen, courtyard, model) are shared, so a variant costs little more than its pad list
+        @param variants: list of (modulename,groups) with groups out of "thermalvias" and "paste",
+                         default is modulename+"_ThermalVias" with both groups and modulename with the paste only
+        @return: list of kicad_footprint in the order of variants
+    """
+    if variants is None:
+        variants = [("{0}_ThermalVias".format(modulename),["thermalvias","paste"]),(modulename,["paste"])]
+    pads,thermalvia_pads,paste_pads = build_pad_groups_stmicro(N,E,X2,Y2,C,X,Y,V,EV,centerpad,numthermalvias,
+                                                               optimize_thermal=optimize_thermal,paste_coverage=paste_coverage)
+    timer = footprintstats.lap_timer()
+    shared = len(variants) > 1#a single footprint has nothing to share
+    fragments = {}
+    fp_objs = []
+    for variantname,groups in variants:
+        unknown = set(groups)-set(["thermalvias","paste"])
+        if unknown:
+            raise ValueError("Unknown pad groups {0}".format(", ".join(sorted(unknown))))
+        pad_groups = [pads]
+        if "thermalvias" in groups:
+            pad_groups.append(thermalvia_pads)
+        if "paste" in groups:
+            pad_groups.append(paste_pads)
+        variantpads = footprint_pad_array()
+        for group in pad_groups:
+            variantpads.extend(group)
+        fp_objs.append(kicad_footprint(name=variantname,desc=description,datasheet=datasheet,pads=variantpads,tags=["TDFN","DFN","{0}mm".format(E)],
+                                       model3dname="Package_DFN_QFN.3dshapes/{0}.wrl".format(variantname.replace("_ThermalVias","")),
+                                       package_dimensions=package_dimensions,
+                                       fragments=fragments if shared else None,pad_groups=pad_groups if shared else None))
+        footprintstats.count("footprints")
+        footprintstats.count("signal_pads",N)
+        if "thermalvias" in groups:
+            footprintstats.count("thermal_vias",sum(1 for drill in thermalvia_pads.drills if drill))
+        if "paste" in groups:
+            footprintstats.count("paste_apertures",len(paste_pads))
+        footprintstats.count("pads",len(variantpads))
+    timer.lap("assemble")
+    return fp_objs
 
 
+def make_footprint_variants_stmicro(*args,**kwargs):
+    """ make several variants of a footprint, same parameters as build_footprint_variants_stmicro
+        @return: list of (modulename,text)
+    """
+    return [(fp_obj.name,footprintstats.run_stage("format",fp_obj.format)) for fp_obj in build_footprint_variants_stmicro(*args,**kwargs)]
+        
+
+if __name__ == "__main__":
+    for modulename,footprint in make_footprint_variants_stmicro(N=8,
+                                                                E=0.5,
+                                                                X2=1.65,
+                                                                Y2=1.8,
+                                                                C=2.9,
+                                                                X=0.25,
+                                                                Y=0.85,
+                                                                V=0.3,
+                                                                EV=1.0,
+                                                                modulename="TDFN-8-1EP_3x2mm_P0.5mm_EP1.80x1.65mm",
+                                                                description="8-lead plastic dual flat, 2x3x0.75mm size, 0.5mm pitch",
+                                                                datasheet="http://ww1.microchip.com/downloads/en/DeviceDoc/8L_TDFN_2x3_MN_C04-0129E-MN.pdf",
+                                                                centerpad=True,
+                                                                numthermalvias=4,
+                                                                package_dimensions=(3,2),#swapped again portrait vs landscape
+                                                                ):#the _ThermalVias variant and the one without vias
+        with open("{0}.kicad_mod".format(modulename),"w") as f:
+            f.write(footprint)
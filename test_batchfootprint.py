@@ -0,0 +1,131 @@
+#file: test_batchfootprint.py
+#purpose: tests for the batch generation of footprints from a parameter table
+#author: Patrick Menschel (C)2018
+
+import os
+import tempfile
+import unittest
+
+from batchfootprint import row_to_kwargs, run_batch, parse_bool, parse_number, parse_number_pair
+from makefootprint import make_footprint_stmicro
+from footprintcache import footprint_cache
+
+
+def get_row(modulename,**kwargs):
+    row = {"N":"8","E":"0.5","X2":"1.65","Y2":"1.8","C":"2.9","X":"0.25","Y":"0.85","V":"0.3","EV":"1.0","modulename":modulename,
+           "description":"d","datasheet":"http://x","centerpad":"1","numthermalvias":"4","package_dimensions":"3x2"}
+    row.update(kwargs)
+    return row
+
+
+class test_row_to_kwargs(unittest.TestCase):
+
+
+    def test_types(self):
+        kwargs = row_to_kwargs(get_row("a"))
+        self.assertEqual(kwargs["N"],8)
+        self.assertEqual(kwargs["E"],0.5)
+        self.assertEqual(kwargs["package_dimensions"],(3,2))
+        self.assertIs(kwargs["centerpad"],True)
+        self.assertNotIn("generate_thermalvias",kwargs)
+        self.assertEqual(parse_number(" 3 "),3)
+        self.assertEqual(parse_number_pair("(4.5, 3)","x"),(4.5,3))
+        self.assertRaises(ValueError,parse_number_pair,"1x2x3","x")
+
+    def test_bool(self):
+        self.assertIs(parse_bool("Yes"),True)
+        self.assertIs(parse_bool("0"),False)
+        self.assertIs(parse_bool(0),False)
+        self.assertIs(parse_bool("",default=True),True)
+        self.assertIs(parse_bool(None,default=None),None)
+        self.assertRaises(ValueError,parse_bool,"maybe")
+
+    def test_blank_cells_use_the_defaults(self):
+        kwargs = row_to_kwargs(get_row("a",centerpad="",generate_thermalvias=" ",optimize_thermal=""))
+        self.assertIs(kwargs["centerpad"],True)
+        self.assertNotIn("generate_thermalvias",kwargs)
+        self.assertNotIn("optimize_thermal",kwargs)
+        kwargs = row_to_kwargs(get_row("a",centerpad=None,generate_thermalvias=None))#null in json lines
+        self.assertIs(kwargs["centerpad"],True)
+        self.assertNotIn("generate_thermalvias",kwargs)
+
+    def test_explicit_false(self):
+        kwargs = row_to_kwargs(get_row("a",centerpad="false",generate_thermalvias="0"))
+        self.assertIs(kwargs["centerpad"],False)
+        self.assertIs(kwargs["generate_thermalvias"],False)
+
+    def test_missing_columns(self):
+        row = get_row("a")
+        del row["N"]
+        self.assertRaises(KeyError,row_to_kwargs,row)
+
+
+class test_run_batch(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.outdir = os.path.join(self.tmpdir.name,"lib.pretty")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_bad_row_does_not_abort_the_batch(self):
+        results = run_batch([get_row("good1"),get_row("odd",N="7"),get_row("nonumber",E="x"),get_row("good2")],outdir=self.outdir,max_workers=0)
+        self.assertEqual([result.ok() for result in results],[True,False,False,True])
+        self.assertTrue(results[1].error.startswith("ValueError"))
+        self.assertEqual(sorted(os.listdir(self.outdir)),["good1.kicad_mod","good2.kicad_mod"])
+
+    def test_process_pool(self):
+        rows = [get_row("a"),get_row("b",generate_thermalvias="0"),get_row("c",N="7")]
+        results = run_batch(rows,outdir=self.outdir,max_workers=2,drc=False)
+        self.assertEqual([result.ok() for result in results],[True,True,False])
+        with open(results[1].filepath) as f:
+            self.assertNotIn("thru_hole",f.read())
+
+    def run_cached(self,rows,**kwargs):
+        cache = footprint_cache(os.path.join(self.outdir,".footprintcache.json"))
+        return run_batch(rows,outdir=self.outdir,max_workers=0,cache=cache,drc=False,**kwargs)
+
+    def test_cache_skips_unchanged_rows(self):
+        rows = [get_row("a"),get_row("b")]
+        self.assertEqual([result.skipped for result in self.run_cached(rows)],[False,False])
+        mtime = os.stat(os.path.join(self.outdir,"a.kicad_mod")).st_mtime_ns
+        rows[1]["N"] = "10"
+        self.assertEqual([result.skipped for result in self.run_cached(rows)],[True,False])
+        results = self.run_cached(rows,force=True)#generated again, but the content did not change
+        self.assertEqual([result.skipped for result in results],[True,True])
+        self.assertEqual(os.stat(os.path.join(self.outdir,"a.kicad_mod")).st_mtime_ns,mtime)
+
+    def test_cache_verify(self):
+        rows = [get_row("a")]
+        filepath = self.run_cached(rows)[0].filepath
+        with open(filepath,"w") as f:
+            f.write("edited")
+        self.assertTrue(self.run_cached(rows)[0].skipped)
+        self.assertFalse(self.run_cached(rows,verify=True)[0].skipped)
+        with open(filepath) as f:
+            self.assertEqual(f.read(),make_footprint_stmicro(**row_to_kwargs(rows[0])))
+
+    def test_failed_rows_are_not_cached(self):
+        rows = [get_row("a",N="7")]
+        self.assertFalse(self.run_cached(rows)[0].ok())
+        self.assertFalse(self.run_cached(rows)[0].ok())
+
+    def test_module_name_with_path_separator(self):
+        for modulename in ["sub/bad","sub\\bad"]:
+            self.assertRaises(ValueError,row_to_kwargs,get_row(modulename))
+
+    def test_write_error_fails_only_its_row(self):
+        os.makedirs(os.path.join(self.outdir,"bad.kicad_mod"))#a directory can not be replaced by a file
+        results = run_batch([get_row("good1"),get_row("sub/bad"),get_row("bad"),get_row("good2")],outdir=self.outdir,max_workers=0,drc=False)
+        self.assertEqual([result.ok() for result in results],[True,False,False,True])
+        self.assertIn("path separator",results[1].error)
+        self.assertIsNone(results[2].filepath)
+        for result in (results[0],results[3]):
+            with open(result.filepath) as f:
+                self.assertEqual(f.read(),make_footprint_stmicro(**row_to_kwargs(get_row(result.modulename))))
+
+
+if __name__ == "__main__":
+    unittest.main()
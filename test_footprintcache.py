@@ -0,0 +1,66 @@
+#file: test_footprintcache.py
+#purpose: tests for the incremental build cache
+#author: Patrick Menschel (C)2018
+
+import os
+import tempfile
+import unittest
+
+from footprintcache import footprint_cache, get_parameter_key, get_text_digest, get_file_digest
+
+
+class test_footprint_cache(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirpath = self.tmpdir.name
+        self.cachepath = os.path.join(self.dirpath,"cache.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self,filename,text):
+        filepath = os.path.join(self.dirpath,filename)
+        with open(filepath,"w") as f:
+            f.write(text)
+        return filepath
+
+    def test_parameter_key(self):
+        self.assertEqual(get_parameter_key({"N":8,"E":0.5}),get_parameter_key({"E":0.5,"N":8}))
+        self.assertNotEqual(get_parameter_key({"N":8}),get_parameter_key({"N":10}))
+        self.assertNotEqual(get_parameter_key({"N":8},version="0"),get_parameter_key({"N":8},version="1"))
+
+    def test_lookup_and_verify(self):
+        filepath = self.write("a.kicad_mod","A")
+        self.assertEqual(get_file_digest(filepath),get_text_digest("A"))
+        self.assertIsNone(get_file_digest(os.path.join(self.dirpath,"missing")))
+        cache = footprint_cache(self.cachepath)
+        self.assertFalse(cache.lookup("k",filepath))
+        cache.store("k",filepath,get_text_digest("A"))
+        self.assertTrue(cache.lookup("k",filepath,verify=True))
+        self.assertFalse(cache.lookup("k",os.path.join(self.dirpath,"b.kicad_mod")))
+        self.write("a.kicad_mod","changed")
+        self.assertTrue(cache.lookup("k",filepath))#without verify only the existence is checked
+        self.assertFalse(cache.lookup("k",filepath,verify=True))
+        os.unlink(filepath)
+        self.assertFalse(cache.lookup("k",filepath))
+
+    def test_save_load_and_evict(self):
+        cache = footprint_cache(self.cachepath,max_entries=2)
+        for key in ["a","b","c"]:
+            cache.store(key,self.write(key,key),get_text_digest(key))
+        self.assertEqual(list(cache.entries),["b","c"])
+        cache.lookup("b",os.path.join(self.dirpath,"b"))#b is now the most recently used
+        cache.store("d",self.write("d","d"),get_text_digest("d"))
+        self.assertEqual(list(cache.entries),["b","d"])
+        cache.save()
+        self.assertEqual(list(footprint_cache(self.cachepath).entries),["b","d"])
+
+    def test_broken_cache_file(self):
+        self.write("cache.json","{broken")
+        self.assertEqual(len(footprint_cache(self.cachepath)),0)
+
+
+if __name__ == "__main__":
+    unittest.main()
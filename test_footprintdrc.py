@@ -0,0 +1,98 @@
+#file: test_footprintdrc.py
+#purpose: tests for the design rule checks
+#author: Patrick Menschel (C)2018
+
+import random
+import unittest
+
+from makefootprint import kicad_footprint, footprint_pad, footprint_pad_array, fp_line, build_footprint_stmicro, mm_to_nm
+from footprintdrc import spatial_grid, get_pad_bboxes, get_pad_gap, check_footprint
+
+COURTYARD = [fp_line((-3,-3),(3,-3),"F.CrtYd",0.05),fp_line((3,-3),(3,3),"F.CrtYd",0.05),
+             fp_line((3,3),(-3,3),"F.CrtYd",0.05),fp_line((-3,3),(-3,-3),"F.CrtYd",0.05)]
+
+
+def get_footprint(pads,lines=COURTYARD):
+    fp_obj = kicad_footprint(name="T",desc="",datasheet="",pads=pads,package_dimensions=(2,2))
+    fp_obj.lines = list(lines)
+    return fp_obj
+
+
+def get_smd_pad(padnum,x,y,sizex=0.5,sizey=0.5,layers=("F.Cu","F.Paste","F.Mask"),padshape="rect"):
+    return footprint_pad(padnum,xypos=(x,y),sizexy=(sizex,sizey),padtype="smd",padshape=padshape,layers=layers)
+
+
+def get_rules(violations):
+    return [violation.rule for violation in violations]
+
+
+class test_spatial_grid(unittest.TestCase):
+
+
+    def test_query(self):
+        grid = spatial_grid(10)
+        grid.insert("a",(0,0,5,5))
+        grid.insert("b",(25,25,35,35))
+        grid.insert("c",(-15,-15,-12,-12))
+        self.assertEqual(grid.query((1,1,2,2)),{"a"})
+        self.assertEqual(grid.query((0,0,30,30)),{"a","b"})
+        self.assertEqual(grid.query((-11,-11,-1,-1)),{"c"})
+        self.assertEqual(grid.query((-11,-11,0,0)),{"a","c"})
+
+    def test_clearance_matches_all_pairs(self):
+        #the grid must find the same pairs as comparing every pad with every other pad
+        rand = random.Random(1)
+        pads = footprint_pad_array(get_smd_pad(idx,rand.uniform(-2,2),rand.uniform(-2,2),rand.uniform(0.1,0.6),rand.uniform(0.1,0.6),
+                                               padshape=rand.choice(["rect","circle"]))
+                                   for idx in range(80))
+        bboxes = get_pad_bboxes(pads)
+        expected = sorted((pads.padnums[idx],pads.padnums[other]) for idx in range(len(pads)) for other in range(idx+1,len(pads))
+                          if get_pad_gap(pads,bboxes,idx,other) < mm_to_nm(0.1))
+        violations = [violation for violation in check_footprint(get_footprint(pads)) if violation.rule == "pad_clearance"]
+        found = sorted(tuple(int(num) for num in violation.message.split(" are ")[0][5:].split(" and ")) for violation in violations)
+        self.assertTrue(expected)
+        self.assertEqual(found,expected)
+
+
+class test_rules(unittest.TestCase):
+
+
+    def test_pad_clearance(self):
+        self.assertEqual(get_rules(check_footprint(get_footprint([get_smd_pad(1,0,0),get_smd_pad(2,0.55,0)]))),["pad_clearance"])
+        self.assertEqual(check_footprint(get_footprint([get_smd_pad(1,0,0),get_smd_pad(2,0.6,0)])),[])
+        self.assertEqual(check_footprint(get_footprint([get_smd_pad(1,0,0),get_smd_pad(1,0.55,0)])),[])#same pad number
+        self.assertEqual(check_footprint(get_footprint([get_smd_pad(1,0,0),get_smd_pad(2,0.55,0,layers=("B.Cu",))])),[])
+        #circles are measured exactly, their bounding boxes would overlap
+        self.assertEqual(check_footprint(get_footprint([get_smd_pad(1,0,0,padshape="circle"),get_smd_pad(2,0.45,0.45,padshape="circle")])),[])
+
+    def test_silkscreen(self):
+        pads = [get_smd_pad(1,0,0)]
+        over = fp_line((-1,0.2),(1,0.2),"F.SilkS",0.12)
+        near = fp_line((-1,0.3),(1,0.3),"F.SilkS",0.12)
+        away = fp_line((-1,0.4),(1,0.4),"F.SilkS",0.12)
+        self.assertEqual(get_rules(check_footprint(get_footprint(pads,COURTYARD+[over]))),["silkscreen_over_pad"])
+        self.assertEqual(get_rules(check_footprint(get_footprint(pads,COURTYARD+[near]))),["silkscreen_over_pad"])#the width counts
+        self.assertEqual(check_footprint(get_footprint(pads,COURTYARD+[away])),[])
+
+    def test_courtyard(self):
+        self.assertEqual(get_rules(check_footprint(get_footprint([get_smd_pad(1,0,0)],[]))),["courtyard"])
+        violations = check_footprint(get_footprint([get_smd_pad(1,2.9,0)],COURTYARD+[fp_line((0,0),(3.5,0),"F.Fab",0.1)]))
+        self.assertEqual([violation.message for violation in violations],["pad 1 is outside of the courtyard",
+                                                                         "fab line point (3.5, 0) is outside of the courtyard"])
+
+    def test_via_in_paste(self):
+        via = footprint_pad(3,xypos=(0,0),sizexy=(0.6,0.6),padtype="thru_hole",padshape="circle",layers=["*.Cu"],drill=0.3)
+        paste = get_smd_pad(None,0.3,0,layers=("F.Paste",))
+        self.assertEqual(get_rules(check_footprint(get_footprint([via,paste]))),["via_in_paste"])
+        self.assertEqual(check_footprint(get_footprint([via,paste._replace(xypos=(0.5,0))])),[])
+
+    def test_generated_footprint(self):
+        params = dict(N=8,E=0.5,X2=1.65,Y2=1.8,C=2.9,X=0.25,Y=0.85,V=0.3,EV=1.0,modulename="TDFN-8",description="d",datasheet="http://x",
+                      centerpad=True,numthermalvias=4,package_dimensions=(3,2))
+        self.assertEqual(check_footprint(build_footprint_stmicro(**params)),[])
+        #8 vias of the fixed cross sit in the paste apertures
+        self.assertEqual(set(get_rules(check_footprint(build_footprint_stmicro(**dict(params,numthermalvias=8))))),{"via_in_paste"})
+
+
+if __name__ == "__main__":
+    unittest.main()
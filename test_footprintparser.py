@@ -0,0 +1,218 @@
+#file: test_footprintparser.py
+#purpose: tests for reading .kicad_mod files and the library index
+#author: Patrick Menschel (C)2018
+
+import os
+import tempfile
+import unittest
+
+from footprintparser import parse_sexpr, unquote, is_in_directory, read_footprint, read_library, footprint_index
+from makefootprint import make_footprint_stmicro
+
+#a file like the kicad 5 library writes it, off grid numbers, texts after lines and a pad without number
+SOIC8 = """(module SOIC-8_3.9x4.9mm_P1.27mm (layer F.Cu) (tedit 5A02F2D3)
+  (descr "8-Lead Plastic Small Outline (SN) - Narrow, 3.90 mm Body [SOIC] (see Microchip Packaging Specification 00000049BS.pdf)")
+  (tags "SOIC 1.27")
+  (attr smd)
+  (fp_text reference REF** (at 0 -3.5) (layer F.SilkS)
+    (effects (font (size 1 1) (thickness 0.15)))
+  )
+  (fp_text value SOIC-8_3.9x4.9mm_P1.27mm (at 0 3.5) (layer F.Fab)
+    (effects (font (size 1 1) (thickness 0.15)))
+  )
+  (fp_line (start -0.95 -2.45) (end 1.95 -2.45) (layer F.Fab) (width 0.1))
+  (fp_line (start 1.95 -2.45) (end 1.95 2.45) (layer F.Fab) (width 0.1))
+  (fp_line (start -2.075 -2.525) (end -3.475 -2.525) (layer F.SilkS) (width 0.15))
+  (fp_text user %R (at 0 0 90) (layer F.Fab) hide
+    (effects (font (size 0.98 0.98) (thickness 0.147)))
+  )
+  (fp_line (start -3.73 -2.7) (end 3.73 -2.7) (layer F.CrtYd) (width 0.05))
+  (pad 1 smd rect (at -2.7 -1.905) (size 1.55 0.6) (layers F.Cu F.Paste F.Mask))
+  (pad 2 smd rect (at -2.7 -0.635) (size 1.55 0.6) (layers F.Cu F.Paste F.Mask))
+  (pad 3 smd rect (at -2.7 0.635) (size 0.875 0.2625) (layers F.Cu F.Paste F.Mask))
+  (pad "" np_thru_hole circle (at 0 0) (size 1.2 1.2) (drill 1.2) (layers *.Cu *.Mask))
+  (model ${KISYS3DMOD}/Package_SO.3dshapes/SOIC-8_3.9x4.9mm_P1.27mm.wrl
+    (at (xyz 0 0 0.0254))
+    (scale (xyz 0.3937007874 0.3937007874 0.3937007874))
+    (rotate (xyz 0 0 -90))
+  )
+)"""
+
+
+def get_parameters(N=8,modulename="TDFN-8",**kwargs):
+    params = dict(N=N,E=0.5,X2=1.65,Y2=1.8,C=2.9,X=0.25,Y=0.85,V=0.3,EV=1.0,modulename=modulename,description="d",datasheet="http://x",
+                  centerpad=True,numthermalvias=4,package_dimensions=(3,2))
+    params.update(kwargs)
+    return params
+
+
+def write_footprint(dirpath,**kwargs):
+    params = get_parameters(**kwargs)
+    os.makedirs(dirpath,exist_ok=True)
+    filepath = os.path.join(dirpath,"{0}.kicad_mod".format(params["modulename"]))
+    with open(filepath,"w") as f:
+        f.write(make_footprint_stmicro(**params))
+    return filepath
+
+
+class test_parse_sexpr(unittest.TestCase):
+
+
+    def test_nested(self):
+        tree = parse_sexpr(b'(module "a b" (layer F.Cu) (descr "say \\"hi\\"") (pad "" smd rect))')
+        self.assertEqual(tree,["module",'"a b"',["layer","F.Cu"],["descr",'"say \\"hi\\""'],["pad",'""',"smd","rect"]])
+        self.assertEqual(unquote(tree[3][1]),'say "hi"')
+        self.assertEqual(unquote(tree[4][1]),"")
+
+    def test_errors(self):
+        self.assertRaises(ValueError,parse_sexpr,b"(module a")
+        self.assertRaises(ValueError,parse_sexpr,b")")
+        self.assertRaises(ValueError,parse_sexpr,b"module")
+
+
+class test_read_footprint(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirpath = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_generated_footprint(self):
+        fp_obj = read_footprint(write_footprint(self.dirpath))
+        self.assertEqual(fp_obj.name,"TDFN-8")
+        self.assertEqual((fp_obj.desc,fp_obj.datasheet),("d","http://x"))
+        self.assertEqual(fp_obj.model3dname,"Package_DFN_QFN.3dshapes/TDFN-8.wrl")
+        self.assertEqual(fp_obj.package_dimensions,(3.0,2.0))
+        self.assertEqual(len(fp_obj.pads),17)
+        self.assertEqual(fp_obj.unsupported,[])
+
+    def test_empty_file(self):
+        filepath = os.path.join(self.dirpath,"empty.kicad_mod")
+        open(filepath,"w").close()
+        self.assertRaises(ValueError,read_footprint,filepath)
+
+
+class test_write_read_footprint(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirpath = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_text(self,text):
+        filepath = os.path.join(self.dirpath,"fp.kicad_mod")
+        with open(filepath,"w") as f:
+            f.write(text)
+            f.write("\n")
+        return read_footprint(filepath)
+
+    def test_round_trip_text(self):
+        fp_obj = self.read_text(SOIC8)
+        self.assertEqual(fp_obj.unsupported,[])
+        self.assertEqual(fp_obj.item_order,[("fp_text",2),("fp_line",3),("fp_text",1),("fp_line",1),("pad",4),("model",1)])
+        self.assertEqual(fp_obj.format(),SOIC8)
+
+    def test_round_trip_generated(self):
+        for N in (8,24):
+            text = make_footprint_stmicro(**get_parameters(N=N,modulename="T{0}".format(N)))
+            fp_obj = self.read_text(text)
+            again = self.read_text(fp_obj.format())
+            self.assertEqual((again.lines,again.texts,again.model,list(again.pads)),(fp_obj.lines,fp_obj.texts,fp_obj.model,list(fp_obj.pads)))
+
+    def test_unsupported_items_raise(self):
+        cases = [("(drill 1.2)","(drill oval 1 2)","oval or offset drill"),
+                 ("(drill 1.2)","(drill 1.2 (offset 0 0.1))","oval or offset drill"),
+                 ("(layers F.Cu F.Paste F.Mask))\n  (pad 3","(layers F.Cu F.Paste F.Mask) (roundrect_rratio 0.25))\n  (pad 3","pad roundrect_rratio"),
+                 ("(size 1.2 1.2) (drill","(size 1.2 1.2) (solder_mask_margin 0.1) (drill","pad solder_mask_margin"),
+                 ("(at -2.7 -1.905)","(at -2.7 -1.905 90)","rotated pad"),
+                 ("(thickness 0.147)))","(thickness 0.147)) (justify left))","effects justify"),
+                 ("(thickness 0.147)))","(thickness 0.147) italic))","font italic"),
+                 ("(at 0 3.5)","(at 0 3.5 unlocked)","fp_text at 0 3.5 unlocked"),
+                 ("(width 0.05))","(width 0.05) (tstamp 1234))","fp_line tstamp"),
+                 ("  (attr smd)\n","  (attr smd)\n  (solder_mask_margin 0.05)\n  (fp_arc (start 0 0) (end 1 0) (angle 90) (layer F.Fab) (width 0.1))\n",
+                  "solder_mask_margin"),
+                 ("${KISYS3DMOD}/","${KICAD6_3DMODEL_DIR}/","model outside of ${KISYS3DMOD}/"),
+                 ]
+        for old,new,name in cases:
+            self.assertIn(old,SOIC8)
+            fp_obj = self.read_text(SOIC8.replace(old,new,1))
+            self.assertIn(name,fp_obj.unsupported)
+            self.assertRaises(ValueError,fp_obj.format)
+        self.assertIn("fp_arc",self.read_text(SOIC8.replace(cases[-2][0],cases[-2][1])).unsupported)
+
+    def test_supported_variants(self):
+        #a solid stroke is a width, a rotation of 0 is no rotation, (hide no) is shown
+        text = SOIC8.replace("(width 0.05)","(stroke (width 0.05) (type solid))").replace("(at -2.7 -1.905)","(at -2.7 -1.905 0)")
+        text = text.replace("(layer F.Fab) hide","(layer F.Fab) (hide no)")
+        fp_obj = self.read_text(text)
+        self.assertEqual(fp_obj.unsupported,[])
+        self.assertIn("(fp_line (start -3.73 -2.7) (end 3.73 -2.7) (layer F.CrtYd) (width 0.05))",fp_obj.format())
+        self.assertIn("(pad 1 smd rect (at -2.7 -1.905) (size 1.55 0.6)",fp_obj.format())
+        self.assertFalse(fp_obj.texts[2].hide)
+        self.assertIn("stroke type dash",self.read_text(text.replace("(type solid)","(type dash)")).unsupported)
+
+    def test_read_library_shares_primitives(self):
+        for name in ["A","B"]:
+            with open(os.path.join(self.dirpath,"{0}.kicad_mod".format(name)),"w") as f:
+                f.write(SOIC8.replace("SOIC-8_3.9x4.9mm_P1.27mm (layer","{0} (layer".format(name)))
+        fp_a,fp_b = [fp_obj for filepath,fp_obj in sorted(read_library([self.dirpath]).items())]
+        self.assertIs(fp_a.lines[0],fp_b.lines[0])
+        self.assertIs(fp_a.model,fp_b.model)
+
+
+class test_footprint_index(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirpath = self.tmpdir.name
+        self.lib = os.path.join(self.dirpath,"lib")
+        self.lib2 = os.path.join(self.dirpath,"lib2")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_is_in_directory(self):
+        self.assertTrue(is_in_directory(os.path.join(self.lib,"a.kicad_mod"),self.lib))
+        self.assertTrue(is_in_directory(os.path.join(self.lib,"sub","a.kicad_mod"),self.lib+os.sep))
+        self.assertFalse(is_in_directory(os.path.join(self.lib2,"a.kicad_mod"),self.lib))
+
+    def test_update_and_find(self):
+        write_footprint(self.lib,N=8,modulename="A")
+        write_footprint(self.lib,N=10,modulename="B",E=0.4)
+        index = footprint_index()
+        self.assertEqual(index.update([self.lib]),2)
+        self.assertEqual(index.update([self.lib]),0)#unchanged files are not read again
+        self.assertEqual([entry["name"] for entry in index.find(9,pitch=0.5,epsize=(1.65,1.8))],["A"])
+        self.assertEqual([entry["name"] for entry in index.find(11,pitch=0.4)],["B"])
+        self.assertEqual(index.find(9,pitch=0.4),[])
+
+    def test_update_keeps_other_libraries(self):
+        write_footprint(self.lib,modulename="A")
+        write_footprint(self.lib2,modulename="B")
+        index = footprint_index()
+        index.update([self.lib,self.lib2])
+        os.unlink(os.path.join(self.lib,"A.kicad_mod"))
+        index.update([self.lib])
+        self.assertEqual([entry["name"] for entry in index.entries.values()],["B"])
+
+    def test_save_load_and_errors(self):
+        write_footprint(self.lib,modulename="A")
+        with open(os.path.join(self.lib,"broken.kicad_mod"),"w") as f:
+            f.write("(module broken")
+        indexpath = os.path.join(self.dirpath,"index.json")
+        index = footprint_index(indexpath)
+        index.update([self.lib])
+        index.save()
+        self.assertEqual(list(index.errors),[os.path.join(self.lib,"broken.kicad_mod")])
+        self.assertEqual(len(footprint_index(indexpath).find(9)),1)
+
+
+if __name__ == "__main__":
+    unittest.main()
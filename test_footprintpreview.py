@@ -0,0 +1,110 @@
+#file: test_footprintpreview.py
+#purpose: tests for the svg previews and the contact sheet
+#author: Patrick Menschel (C)2018
+
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from makefootprint import build_footprint_stmicro, make_footprint_stmicro
+from footprintparser import read_footprint
+from footprintpreview import PREVIEW_LAYERS, get_preview_items, get_svg_elements, render_svg, get_preview_path, write_preview, render_files, write_index
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+def get_parameters(modulename="TDFN-8",**kwargs):
+    params = dict(N=8,E=0.5,X2=1.65,Y2=1.8,C=2.9,X=0.25,Y=0.85,V=0.3,EV=1.0,modulename=modulename,description="d",datasheet="http://x",
+                  centerpad=True,numthermalvias=4,package_dimensions=(3,2))
+    params.update(kwargs)
+    return params
+
+
+class test_render_svg(unittest.TestCase):
+
+
+    def test_svg(self):
+        fp_obj = build_footprint_stmicro(**get_parameters())
+        root = ET.fromstring(render_svg(fp_obj))
+        groups = dict((group.get("id"),list(group)) for group in root.iter(SVG+"g"))
+        self.assertEqual(root.find(SVG+"title").text,"TDFN-8")
+        self.assertEqual(len(groups["F.Cu"]),13)#8 signal pads, the exposed pad and 4 vias
+        self.assertEqual(len(groups["Drill"]),4)
+        self.assertEqual(len(groups["F.Paste"]),11)#8 signal pads and 3 apertures
+        self.assertEqual(len(groups["B.Cu"]),1)
+        #everything is inside of the view box
+        minx,miny,width,height = map(int,root.get("viewBox").split())
+        for element in root.iter(SVG+"line"):
+            for x,y in [("x1","y1"),("x2","y2")]:
+                self.assertTrue(minx <= int(element.get(x)) <= minx+width and miny <= int(element.get(y)) <= miny+height)
+
+    def test_same_drawing_as_items(self):
+        #the svg fast path and the matplotlib items draw the same elements with the same bounds
+        fp_obj = build_footprint_stmicro(**get_parameters(N=24,numthermalvias=8,package_dimensions=(4,4)))
+        items,item_bounds = get_preview_items(fp_obj)
+        elements,bounds = get_svg_elements(fp_obj)
+        self.assertEqual(bounds,item_bounds)
+        for layer,color in PREVIEW_LAYERS:
+            self.assertEqual(len(elements[layer]),len(items[layer]),layer)
+
+    def test_title_is_escaped(self):
+        fp_obj = build_footprint_stmicro(**get_parameters(modulename="A<&>B"))
+        self.assertEqual(ET.fromstring(render_svg(fp_obj)).find(SVG+"title").text,"A<&>B")
+
+
+class test_render_files(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirpath = self.tmpdir.name
+        self.outdir = os.path.join(self.dirpath,"preview")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self,name,text):
+        filepath = os.path.join(self.dirpath,"{0}.kicad_mod".format(name))
+        with open(filepath,"w") as f:
+            f.write(text)
+        return filepath
+
+    def test_write_preview(self):
+        fp_obj = build_footprint_stmicro(**get_parameters())
+        os.makedirs(self.outdir)
+        filepath = write_preview(fp_obj,self.outdir)
+        self.assertEqual(filepath,get_preview_path(self.outdir,"TDFN-8"))
+        with open(filepath) as f:
+            self.assertEqual(f.read(),render_svg(fp_obj))
+        self.assertRaises(ValueError,write_preview,fp_obj,self.outdir,fmt="gif")
+
+    def test_read_footprint_preview(self):
+        #a parsed footprint draws the same pads as the generated one, lines are written rounded to 0.01mm
+        fp_obj = build_footprint_stmicro(**get_parameters())
+        parsed = read_footprint(self.write("TDFN-8",fp_obj.format()))
+        elements,bounds = get_svg_elements(fp_obj)
+        parsed_elements,parsed_bounds = get_svg_elements(parsed)
+        for layer in ["B.Cu","F.Cu","F.Paste","Drill"]:
+            self.assertEqual(parsed_elements[layer],elements[layer],layer)
+        for layer in ["F.Fab","F.SilkS","F.CrtYd"]:
+            self.assertEqual(len(parsed_elements[layer]),len(elements[layer]),layer)
+
+    def test_batch_and_index(self):
+        filepaths = [self.write("B",make_footprint_stmicro(**get_parameters("B"))),
+                     self.write("broken","(module broken"),
+                     self.write("A",make_footprint_stmicro(**get_parameters("A")))]
+        for max_workers in (0,2):
+            entries = render_files(filepaths,self.outdir,max_workers=max_workers)
+            self.assertEqual([(name,filepath) for name,filepath,error in entries],
+                             [("B",get_preview_path(self.outdir,"B")),("broken",None),("A",get_preview_path(self.outdir,"A"))])
+            self.assertTrue(entries[1][2].startswith("ValueError"))
+        with open(write_index(entries,self.outdir)) as f:
+            text = f.read()
+        self.assertIn("3 footprints, 1 failed",text)
+        self.assertIn("<p class=\"error\">broken: ValueError",text)
+        self.assertLess(text.index("src=\"A.svg\""),text.index("src=\"B.svg\""))#sorted by name
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#file: test_footprintserver.py
+#purpose: tests for the resident footprint generation service
+#author: Patrick Menschel (C)2018
+
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from footprintserver import footprint_service, handle_line, serve_stdio, serve_unix, call
+from batchfootprint import row_to_kwargs
+from makefootprint import make_footprint_stmicro
+
+
+def get_params(modulename="TDFN-8",**kwargs):
+    params = {"N":8,"E":0.5,"X2":1.65,"Y2":1.8,"C":2.9,"X":0.25,"Y":0.85,"V":0.3,"EV":1.0,"modulename":modulename,
+              "description":"d","datasheet":"http://x","numthermalvias":4,"package_dimensions":[3,2]}
+    params.update(kwargs)
+    return params
+
+
+class test_service(unittest.TestCase):
+
+
+    def setUp(self):
+        self.service = footprint_service()
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_make_and_cache(self):
+        response = self.service.handle({"id":1,"params":get_params()})
+        self.assertTrue(response["ok"],response)
+        self.assertEqual(response["text"],make_footprint_stmicro(**row_to_kwargs(get_params())))
+        self.assertEqual((response["id"],response["modulename"],response["cached"],response["violations"]),(1,"TDFN-8",False,[]))
+        self.assertTrue(self.service.handle({"id":2,"params":get_params()})["cached"])
+        stats = self.service.handle({"op":"stats"})["stats"]
+        self.assertEqual((stats["requests"],stats["cache_hits"],stats["errors"],stats["cache_entries"]),(2,1,0,1))
+
+    def test_errors_keep_the_service_running(self):
+        for request,error in [({"id":1,"params":get_params(N=7)},"ValueError"),
+                              ({"id":2,"params":{"N":8}},"KeyError"),
+                              ({"id":3,"op":"nothing"},"ValueError: Unknown op"),
+                              ([1,2],"ValueError: A request must be a json object")]:
+            response = self.service.handle(request)
+            self.assertFalse(response["ok"])
+            self.assertTrue(response["error"].startswith(error),response)
+        self.assertEqual(json.loads(handle_line(self.service,"{broken"))["ok"],False)
+        self.assertTrue(self.service.handle({"op":"ping"})["ok"])
+        self.assertEqual(self.service.handle({"op":"stats"})["stats"]["errors"],4)
+
+    def test_outdir(self):
+        with tempfile.TemporaryDirectory() as outdir:
+            response = self.service.handle({"params":get_params(),"outdir":outdir})
+            self.assertTrue(response["ok"],response)
+            self.assertEqual(response["filepath"],os.path.join(outdir,"TDFN-8.kicad_mod"))
+            self.assertFalse(response["skipped"])
+            self.assertTrue(self.service.handle({"params":get_params(),"outdir":outdir})["skipped"])#unchanged content is not rewritten
+            self.assertFalse(self.service.handle({"params":get_params("../x"),"outdir":outdir})["ok"])
+
+    def test_stdio(self):
+        lines = [json.dumps({"id":1,"params":get_params()}),"",json.dumps({"id":2,"op":"shutdown"}),json.dumps({"id":3,"op":"ping"})]
+        outfile = io.StringIO()
+        serve_stdio(self.service,io.StringIO("\n".join(lines)+"\n"),outfile)
+        responses = [json.loads(line) for line in outfile.getvalue().splitlines()]
+        self.assertEqual([response["id"] for response in responses],[1,2])#nothing after the shutdown is answered
+        self.assertTrue(self.service.stopped.is_set())
+
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            path = os.path.join(dirpath,"footprint.sock")
+            thread = threading.Thread(target=serve_unix,args=(self.service,path))
+            thread.start()
+            try:
+                for idx in range(100):
+                    if os.path.exists(path):
+                        break
+                    time.sleep(0.01)
+                response = call(path,{"id":1,"params":get_params()})
+                self.assertEqual((response["id"],response["ok"]),(1,True))
+                self.assertTrue(call(path,{"op":"shutdown"})["ok"])
+            finally:
+                thread.join(10)
+            self.assertFalse(thread.is_alive())
+            self.assertFalse(os.path.exists(path))
+
+
+class test_service_workers(unittest.TestCase):
+
+
+    def test_stdio_with_workers(self):
+        service = footprint_service(max_workers=1)
+        try:
+            lines = [json.dumps({"id":idx,"params":get_params("T{0}".format(idx))}) for idx in range(4)]+[json.dumps({"id":"end","op":"shutdown"})]
+            outfile = io.StringIO()
+            serve_stdio(service,io.StringIO("\n".join(lines)+"\n"),outfile)
+            responses = dict((response["id"],response) for response in map(json.loads,outfile.getvalue().splitlines()))
+            self.assertEqual(sorted(responses,key=str),[0,1,2,3,"end"])
+            self.assertTrue(all(response["ok"] for response in responses.values()))
+            self.assertEqual(responses[2]["modulename"],"T2")
+        finally:
+            service.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
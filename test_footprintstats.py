@@ -0,0 +1,76 @@
+#file: test_footprintstats.py
+#purpose: tests for the opt-in stage timing and counters
+#author: Patrick Menschel (C)2018
+
+import os
+import pstats
+import tempfile
+import unittest
+
+import footprintstats
+from footprintstats import footprint_stats
+from makefootprint import make_footprint_stmicro, make_footprint_variants_stmicro
+
+
+def get_parameters(modulename="TDFN-8",**kwargs):
+    params = dict(N=8,E=0.5,X2=1.65,Y2=1.8,C=2.9,X=0.25,Y=0.85,V=0.3,EV=1.0,modulename=modulename,description="d",datasheet="http://x",
+                  centerpad=True,numthermalvias=4,package_dimensions=(3,2))
+    params.update(kwargs)
+    return params
+
+
+class test_footprint_stats(unittest.TestCase):
+
+
+    def tearDown(self):
+        footprintstats.disable()
+
+    def test_disabled(self):
+        self.assertIsNone(footprintstats.get_active())
+        with footprintstats.stage("a"):
+            footprintstats.count("b")
+        footprintstats.lap_timer().lap("c")
+        self.assertEqual(footprintstats.run_stage("d",len,"abc"),3)
+        self.assertEqual(list(footprintstats.iter_stage("e",["x"])),["x"])
+        self.assertIsNone(footprintstats.disable())
+
+    def test_collect(self):
+        text = make_footprint_stmicro(**get_parameters())
+        stats = footprintstats.enable()
+        self.assertIs(footprintstats.get_active(),stats)
+        self.assertEqual(make_footprint_stmicro(**get_parameters()),text)#collecting does not change the output
+        self.assertIs(footprintstats.disable(),stats)
+        self.assertEqual(stats.counters,{"footprints":1,"signal_pads":8,"thermal_vias":4,"paste_apertures":3,"pads":17})
+        calls,elapsed,nbytes = stats.stages["format"]
+        self.assertEqual((calls,nbytes),(1,len(text)))
+        self.assertGreaterEqual(elapsed,0)
+        for name in ["pads","header","assemble"]:
+            self.assertIn(name,stats.stages)
+
+    def test_variants(self):
+        stats = footprintstats.enable()
+        make_footprint_variants_stmicro(**get_parameters())
+        footprintstats.disable()
+        self.assertEqual(stats.counters["footprints"],2)
+        self.assertEqual(stats.counters["thermal_vias"],4)#only the _ThermalVias variant has vias
+        self.assertEqual(stats.stages["format"][0],2)
+
+    def test_merge_and_export(self):
+        stats = footprint_stats()
+        stats.add("format",0.5,nbytes=10)
+        stats.count("pads",3)
+        other = footprint_stats()
+        other.merge(stats)
+        other.merge(stats.to_dict())
+        self.assertEqual(other.stages,{"format":[2,1.0,20]})
+        self.assertEqual(other.counters,{"pads":6})
+        self.assertIn("\"bytes\": 20",other.to_json())
+        self.assertTrue(other.format_summary().splitlines()[1].endswith("format"))
+        with tempfile.TemporaryDirectory() as dirpath:
+            filepath = os.path.join(dirpath,"stats.prof")
+            other.dump_stats(filepath)
+            self.assertEqual(pstats.Stats(filepath).total_calls,2)
+
+
+if __name__ == "__main__":
+    unittest.main()
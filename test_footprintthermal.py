@@ -0,0 +1,84 @@
+#file: test_footprintthermal.py
+#purpose: tests for the thermal via and paste aperture optimizer
+#author: Patrick Menschel (C)2018
+
+import math
+import unittest
+
+from makefootprint import mm_to_nm, build_footprint_stmicro
+from footprintthermal import optimize_thermal_layout, is_balanced_grid
+
+EP_SIZES = [(1.8,1.65),(3,3),(4.2,2.6),(6,6)]
+
+
+class test_optimizer(unittest.TestCase):
+
+
+    def check_layout(self,layout,ep_size,drill=0.3,coverage=(0.5,0.8),max_vias=None,max_aperture=2.0):
+        lo,hi = coverage
+        self.assertTrue(lo <= layout.coverage <= hi,layout)
+        self.assertTrue(max_vias is None or layout.get_via_count() <= max_vias,layout)
+        if layout.get_via_count():
+            self.assertTrue(is_balanced_grid(layout.via_cols,layout.via_rows,*ep_size),layout)
+        sizex,sizey = layout.get_aperture_size()
+        self.assertTrue(0.3 <= min(sizex,sizey) and max(sizex,sizey) <= max_aperture,layout)
+        padnums,viasx,viasy = layout.get_via_layout()
+        padnums,pastex,pastey = layout.get_paste_layout()
+        self.assertEqual(len(pastex),layout.aperture_count)
+        self.assertAlmostEqual(len(pastex)*sizex*sizey/(ep_size[0]*ep_size[1]),layout.coverage,places=6)
+        #vias fit on the pad and every aperture keeps drill/2+keepout away from every via center
+        radius = layout.via_diameter/2
+        for vx,vy in zip(viasx,viasy):
+            self.assertLessEqual(abs(vx)+mm_to_nm(radius),mm_to_nm(ep_size[0]/2))
+            self.assertLessEqual(abs(vy)+mm_to_nm(radius),mm_to_nm(ep_size[1]/2))
+        keepout = mm_to_nm(drill/2+layout.keepout)
+        halfx,halfy = mm_to_nm(sizex)/2,mm_to_nm(sizey)/2
+        for px,py in zip(pastex,pastey):
+            self.assertLessEqual(abs(px)+halfx,mm_to_nm(ep_size[0]/2))
+            self.assertLessEqual(abs(py)+halfy,mm_to_nm(ep_size[1]/2))
+            for vx,vy in zip(viasx,viasy):
+                dx = max(0,abs(px-vx)-halfx)
+                dy = max(0,abs(py-vy)-halfy)
+                self.assertGreaterEqual(math.hypot(dx,dy),keepout,layout)
+
+    def test_layouts(self):
+        for ep_size in EP_SIZES:
+            self.check_layout(optimize_thermal_layout(ep_size,drill=0.3,min_pitch=1.0),ep_size)
+            self.check_layout(optimize_thermal_layout(ep_size,drill=0.3,min_pitch=1.0,max_vias=2),ep_size,max_vias=2)
+        for ep_size in EP_SIZES[1:]:#the small pad does not reach 60% next to its vias
+            self.check_layout(optimize_thermal_layout(ep_size,drill=0.3,min_pitch=1.0,coverage=(0.6,0.7)),ep_size,coverage=(0.6,0.7))
+
+    def test_tdfn_pad(self):
+        layout = optimize_thermal_layout((1.8,1.65),drill=0.3,min_pitch=1.0)
+        self.assertEqual((layout.via_cols,layout.via_rows,layout.paste_cols,layout.paste_rows,layout.aperture_count),(1,2,3,1,2))
+
+    def test_paste_only(self):
+        layout = optimize_thermal_layout((3,3),drill=0.3,min_pitch=1.0,max_vias=0)
+        self.assertEqual(layout.get_via_count(),0)
+        self.assertEqual(layout.aperture_count,layout.paste_cols*layout.paste_rows)
+        self.check_layout(layout,(3,3))
+
+    def test_infeasible(self):
+        with self.assertRaises(ValueError) as context:
+            optimize_thermal_layout((1.8,1.65),drill=0.3,min_pitch=1.0,coverage=(0.95,0.99))
+        self.assertIn("closest is",str(context.exception))
+
+    def test_cache(self):
+        self.assertIs(optimize_thermal_layout((3,3),drill=0.3,min_pitch=1.0),optimize_thermal_layout((3,3),drill=0.3,min_pitch=1.0))
+
+    def test_balanced_grid(self):
+        self.assertTrue(is_balanced_grid(3,3,3.0,3.0))
+        self.assertTrue(is_balanced_grid(3,4,3.0,3.0))
+        self.assertFalse(is_balanced_grid(2,6,3.0,3.0))
+        self.assertTrue(is_balanced_grid(4,2,4.2,2.0))
+
+    def test_footprint(self):
+        fp_obj = build_footprint_stmicro(N=8,E=0.5,X2=1.65,Y2=1.8,C=2.9,X=0.25,Y=0.85,V=0.3,EV=1.0,modulename="T",description="d",datasheet="x",
+                                         centerpad=True,numthermalvias=None,package_dimensions=(3,2),optimize_thermal=True)
+        drills = [pad for pad in fp_obj.pads if pad.drill]
+        paste = [pad for pad in fp_obj.pads if pad.layers == ("F.Paste",)]
+        self.assertEqual((len(drills),len(paste)),(2,2))
+
+
+if __name__ == "__main__":
+    unittest.main()
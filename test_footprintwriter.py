@@ -0,0 +1,116 @@
+#file: test_footprintwriter.py
+#purpose: tests for the atomic and archive output of footprint files
+#author: Patrick Menschel (C)2018
+
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from footprintwriter import atomic_write, write_file_atomic, get_library_name, open_output, pretty_writer, archive_writer, background_writer
+
+
+class test_atomic_write(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirpath = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_replace(self):
+        filepath = os.path.join(self.dirpath,"a.kicad_mod")
+        write_file_atomic(filepath,"old")
+        write_file_atomic(filepath,"new")
+        with open(filepath) as f:
+            self.assertEqual(f.read(),"new")
+        self.assertEqual(os.listdir(self.dirpath),["a.kicad_mod"])
+
+    def test_interrupted_write_keeps_old_file(self):
+        filepath = os.path.join(self.dirpath,"a.kicad_mod")
+        write_file_atomic(filepath,"old")
+        with self.assertRaises(RuntimeError):
+            with atomic_write(filepath) as f:
+                f.write("half")
+                raise RuntimeError("interrupted")
+        with open(filepath) as f:
+            self.assertEqual(f.read(),"old")
+        self.assertEqual(os.listdir(self.dirpath),["a.kicad_mod"])
+
+
+class test_archive_writer(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirpath = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_library_name(self):
+        self.assertEqual(get_library_name("out/Package_DFN_QFN.pretty.zip"),"Package_DFN_QFN.pretty")
+        self.assertEqual(get_library_name("out/lib.tar.gz"),"lib.pretty")
+        self.assertEqual(get_library_name("out/lib.pretty"),"lib.pretty")
+
+    def test_open_output(self):
+        self.assertIsInstance(open_output(os.path.join(self.dirpath,"lib.pretty")),pretty_writer)
+        sink = open_output(os.path.join(self.dirpath,"lib.tar"))
+        self.assertIsInstance(sink,archive_writer)
+        sink.abort()
+
+    def test_zip(self):
+        path = os.path.join(self.dirpath,"lib.pretty.zip")
+        sink = archive_writer(path)
+        self.assertEqual(sink.write("a.kicad_mod","A"),"lib.pretty/a.kicad_mod")
+        self.assertFalse(os.path.exists(path))#the archive only appears once it is complete
+        sink.close()
+        with zipfile.ZipFile(path) as z:
+            self.assertEqual(z.namelist(),["lib.pretty/a.kicad_mod"])
+            self.assertEqual(z.read("lib.pretty/a.kicad_mod"),b"A")
+
+    def test_tar(self):
+        path = os.path.join(self.dirpath,"lib.tar.gz")
+        with background_writer(archive_writer(path)) as writer:
+            writer.write("a.kicad_mod","A")
+            writer.write("b.kicad_mod","B")
+        with tarfile.open(path) as t:
+            self.assertEqual(t.getnames(),["lib.pretty/a.kicad_mod","lib.pretty/b.kicad_mod"])
+            self.assertEqual(t.extractfile("lib.pretty/b.kicad_mod").read(),b"B")
+
+    def test_abort(self):
+        path = os.path.join(self.dirpath,"lib.zip")
+        writer = background_writer(archive_writer(path))
+        writer.write("a.kicad_mod","A")
+        writer.abort()
+        self.assertEqual(os.listdir(self.dirpath),[])
+
+
+class test_background_writer(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirpath = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_failed_file_does_not_stop_the_others(self):
+        os.mkdir(os.path.join(self.dirpath,"b.kicad_mod"))#a directory can not be replaced by a file
+        writer = background_writer(pretty_writer(self.dirpath))
+        for name in ["a","b","c"]:
+            writer.write("{0}.kicad_mod".format(name),name)
+        written = writer.close()
+        self.assertEqual(written,[os.path.join(self.dirpath,"a.kicad_mod"),os.path.join(self.dirpath,"c.kicad_mod")])
+        self.assertEqual(list(writer.errors),["b.kicad_mod"])
+        self.assertIsInstance(writer.errors["b.kicad_mod"],OSError)
+        with open(os.path.join(self.dirpath,"c.kicad_mod")) as f:
+            self.assertEqual(f.read(),"c")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+#file: test_makefootprint.py
+#purpose: regression tests for the fixed point formatting and the generated output, run with python -m pytest or python -m unittest
+#author: Patrick Menschel (C)2018
+
+import hashlib
+import io
+import unittest
+from array import array
+
+import makefootprint
+from makefootprint import format_nm, format_mm, format_nm_exact, format_mm_exact, mm_to_nm, snap_nm_outward, get_courtyard_points, get_dual_layout, get_quad_layout, \
+                          get_grid_layout, get_bga_row_name, footprint_pad, build_footprint_stmicro, build_footprint_variants_stmicro, \
+                          make_footprint_stmicro
+
+#sha256 of all footprints of get_sweep_parameters, it changes whenever the generated output changes,
+#then bump makefootprint.__version__ so footprintcache regenerates the files, and update this digest
+SWEEP_DIGEST = "26e4966ab5fd9e64df62c607621280517a0c08fe266214965d75e11c6850212b"
+SWEEP_VERSION = "0.2.0"
+
+
+def get_parameters(N=8,numthermalvias=4,**kwargs):
+    params = dict(N=N,E=0.5,X2=1.65,Y2=1.8,C=2.9,X=0.25,Y=0.85,V=0.3,EV=1.0,modulename="TDFN-{0}".format(N),description="d",datasheet="http://x",
+                  centerpad=True,numthermalvias=numthermalvias,package_dimensions=(3,2))
+    params.update(kwargs)
+    return params
+
+
+def get_sweep_parameters():
+    sweep = []
+    for N in (8,10,14,24,64):
+        for generate_thermalvias in (True,False):
+            for numthermalvias in (4,8):
+                sweep.append(get_parameters(N,numthermalvias,generate_thermalvias=generate_thermalvias,
+                                            modulename="T-{0}-{1:d}-{2}".format(N,generate_thermalvias,numthermalvias)))
+    sweep.append(get_parameters(14,6,E=0.65,X2=1.6,Y2=3.7,C=3.0,X=0.35,Y=0.8,modulename="D14",package_dimensions=(4.5,3)))
+    sweep.append(get_parameters(8,8,X2=2.6,Y2=2.4,modulename="O8",package_dimensions=(4,3),optimize_thermal=True))
+    return sweep
+
+
+class test_format_nm(unittest.TestCase):
+
+
+    def test_half_even(self):
+        self.assertEqual(format_nm(5000),"0.00")
+        self.assertEqual(format_nm(15000),"0.02")
+        self.assertEqual(format_nm(25000),"0.02")
+        self.assertEqual(format_nm(25001),"0.03")
+        self.assertEqual(format_nm(1005000),"1.00")
+        self.assertEqual(format_nm(1015000),"1.02")
+        self.assertEqual(format_nm(-15000),"-0.02")
+        self.assertEqual(format_nm(-25000),"-0.02")
+
+    def test_negative_zero(self):
+        self.assertEqual(format_nm(-1),"0.00")
+        self.assertEqual(format_nm(-5000),"0.00")
+        self.assertEqual(format_mm(-0.001),"0.00")
+        self.assertEqual(format_mm(-0.0),"0.00")
+        self.assertEqual(format_nm(-5001),"-0.01")
+
+    def test_decimals(self):
+        self.assertEqual(format_nm(1234567,decimals=3),"1.235")
+        self.assertEqual(format_nm(1500000,decimals=0),"2")
+        self.assertEqual(format_nm(2500000,decimals=0),"2")
+
+    def test_exact(self):
+        self.assertEqual([format_nm_exact(value) for value in (0,-1905000,262500,1000000,-1)],["0","-1.905","0.2625","1","-0.000001"])
+        self.assertEqual([format_mm_exact(value) for value in (0.0,-0.0,-1.905,0.3937007874,90)],["0","0","-1.905","0.3937007874","90"])
+
+    def test_format_mm(self):
+        #floats that are not exact in binary still round on their nanometre value
+        self.assertEqual(mm_to_nm(0.1+0.2),300000)
+        self.assertEqual(format_mm(0.1+0.2),"0.30")
+        self.assertEqual(format_mm(2.675),"2.68")
+        self.assertEqual(format_mm(-1.45),"-1.45")
+
+
+class test_courtyard(unittest.TestCase):
+
+
+    def test_snap_outward(self):
+        grid = 10000
+        self.assertEqual(snap_nm_outward(0,grid),0)
+        self.assertEqual(snap_nm_outward(1,grid),grid)
+        self.assertEqual(snap_nm_outward(grid,grid),grid)
+        self.assertEqual(snap_nm_outward(-1,grid),-grid)
+        self.assertEqual(snap_nm_outward(-grid,grid),-grid)
+        self.assertEqual(snap_nm_outward(-grid-1,grid),-2*grid)
+
+    def test_courtyard_on_grid_and_outside(self):
+        pads = [footprint_pad(1,xypos=(-1.4333,-0.7711),sizexy=(0.8517,0.2503),padtype="smd",padshape="rect",layers=["F.Cu"]),
+                footprint_pad(2,xypos=(1.4333,0.7711),sizexy=(0.8517,0.2503),padtype="smd",padshape="rect",layers=["F.Cu"])]
+        points = get_courtyard_points(pads,package_dimensions=(2.0,1.0))
+        for point in points:
+            for value in point:
+                self.assertEqual(mm_to_nm(value)%10000,0,"courtyard point {0} is not on the 0.01mm grid".format(point))
+        minx = min(point[0] for point in points)
+        maxx = max(point[0] for point in points)
+        self.assertLessEqual(minx,-1.4333-0.8517/2-0.25)
+        self.assertGreaterEqual(maxx,1.4333+0.8517/2+0.25)
+
+
+class test_layout(unittest.TestCase):
+
+
+    def test_dual_layout_numbering(self):
+        padnums,posx,posy = get_dual_layout(pinnum=8,pitch=0.5,span=2.9)
+        self.assertEqual(padnums,[1,2,3,4,8,7,6,5])
+        self.assertEqual(list(posy[:4]),[-750000,-250000,250000,750000])
+        self.assertEqual(list(posx),[-1450000]*4+[1450000]*4)
+
+    def test_dual_layout_odd(self):
+        self.assertRaises(ValueError,get_dual_layout,pinnum=7,pitch=0.5,span=2.9)
+        self.assertRaises(ValueError,build_footprint_stmicro,**get_parameters(7))
+        self.assertRaises(ValueError,build_footprint_stmicro,**get_parameters(8,3))
+
+    def test_quad_layout_counterclockwise(self):
+        sides = dict(get_quad_layout(pinnum_x=2,pinnum_y=3,pitch=0.5,spanx=4.0,spany=3.0))
+        self.assertEqual(sides["left"],([1,2,3],array("q",[-2000000]*3),array("q",[-500000,0,500000])))
+        self.assertEqual(sides["bottom"],([4,5],array("q",[-250000,250000]),array("q",[1500000]*2)))
+        self.assertEqual(sides["right"],([6,7,8],array("q",[2000000]*3),array("q",[500000,0,-500000])))
+        self.assertEqual(sides["top"],([9,10],array("q",[250000,-250000]),array("q",[-1500000]*2)))
+
+    def test_grid_layout(self):
+        self.assertEqual([get_bga_row_name(row) for row in (0,19,20,40)],["A","Y","AA","BA"])
+        self.assertEqual(get_grid_layout(2,2,0.8,1.0),(["A1","A2","B1","B2"],array("q",[-400000,400000]*2),array("q",[-500000,-500000,500000,500000])))
+        padnums,posx,posy = get_grid_layout(3,3,0.8,depopulated=["A1"],center_hole=(1,1))
+        self.assertEqual(padnums,["A2","A3","B1","B3","C1","C2","C3"])
+        self.assertEqual(list(zip(posx,posy))[2:4],[(-800000,0),(800000,0)])
+
+
+class test_output(unittest.TestCase):
+
+
+    def test_format_equals_write(self):
+        for params in get_sweep_parameters():
+            fp_obj = build_footprint_stmicro(**params)
+            f = io.StringIO()
+            fp_obj.write(f)
+            self.assertEqual(f.getvalue(),fp_obj.format(),params["modulename"])
+            self.assertEqual(make_footprint_stmicro(**params),fp_obj.format(),params["modulename"])
+
+    def test_variants_equal_single_builds(self):
+        params = get_parameters(14,4)
+        variants = build_footprint_variants_stmicro(**params)
+        self.assertEqual([variant.name for variant in variants],["TDFN-14_ThermalVias","TDFN-14"])
+        for variant,generate_thermalvias in zip(variants,(True,False)):
+            single = dict(params,modulename=variant.name,generate_thermalvias=generate_thermalvias)
+            self.assertEqual(variant.format(),build_footprint_stmicro(**single).format(),variant.name)
+
+    def test_variant_without_groups(self):
+        params = get_parameters(8,4)
+        variants = build_footprint_variants_stmicro(variants=[("A",["paste"]),("B",[])],**params)
+        self.assertNotIn("F.Paste)",variants[1].format())
+        self.assertIn("F.Paste)",variants[0].format())
+        self.assertRaises(ValueError,build_footprint_variants_stmicro,variants=[("C",["vias"])],**params)
+
+    def test_golden_courtyard(self):
+        #outer pad edge 1.45+0.85/2 plus 0.25 offset is 2.125, it snaps outward to 2.13 and not half-even to 2.12
+        text = make_footprint_stmicro(**get_parameters(8))
+        courtyard = [line.strip() for line in text.splitlines() if "F.CrtYd" in line]
+        self.assertEqual(courtyard,["(fp_line (start -2.13 -1.25) (end -2.13 1.25) (layer F.CrtYd) (width 0.05))",
+                                    "(fp_line (start -2.13 1.25) (end 2.13 1.25) (layer F.CrtYd) (width 0.05))",
+                                    "(fp_line (start 2.13 1.25) (end 2.13 -1.25) (layer F.CrtYd) (width 0.05))",
+                                    "(fp_line (start 2.13 -1.25) (end -2.13 -1.25) (layer F.CrtYd) (width 0.05))"])
+        self.assertIn("(pad 1 smd oval (at -1.45 -0.75) (size 0.85 0.25) (layers F.Cu F.Paste F.Mask))",text)
+
+    def test_golden_sweep(self):
+        digest = hashlib.sha256()
+        for params in get_sweep_parameters():
+            digest.update(make_footprint_stmicro(**params).encode("utf-8"))
+            digest.update(b"\0")
+        self.assertEqual(makefootprint.__version__,SWEEP_VERSION,"update SWEEP_VERSION together with SWEEP_DIGEST")
+        self.assertEqual(digest.hexdigest(),SWEEP_DIGEST,"the generated output changed, bump makefootprint.__version__ and update SWEEP_DIGEST")
+
+
+if __name__ == "__main__":
+    unittest.main()